@@ -0,0 +1,59 @@
+"""
+Bootstrap shared by the benchmark scripts.
+
+Benchmarks never touch db.sqlite3: ``setup()`` creates a throw-away test
+database (the same way ``manage.py test`` does) before any data is seeded.
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from core.seeding import historical_timestamps  # noqa: E402,F401  (re-exported for the scripts)
+
+
+def setup(db_name=None, **options):
+    """
+    Configure Django and create an empty, fully migrated test database.
+    ``db_name`` selects a file-backed database (needed when several
+    threads or processes share it); the default is SQLite in-memory.
+    Extra keyword arguments are merged into the database OPTIONS.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+    import django
+
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    if db_name:
+        connection.settings_dict['TEST']['NAME'] = db_name
+    connection.settings_dict.setdefault('OPTIONS', {}).update(options)
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+    from django.db import connections
+
+    # зеркала 'default' (алиас 'reporting') читают ту же тестовую базу
+    for alias in connections:
+        if connections[alias].settings_dict.get('TEST', {}).get('MIRROR') == connection.alias:
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+    return connection
+
+
+def timed(fn, repeat=5):
+    """Run ``fn`` ``repeat`` times, return the median duration in ms."""
+    import time
+
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    return durations[len(durations) // 2]
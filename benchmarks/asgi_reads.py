@@ -0,0 +1,218 @@
+"""
+Concurrent-request throughput of the read endpoints, WSGI vs ASGI.
+
+    python benchmarks/asgi_reads.py --requests 400 --concurrency 32 --db-latency-ms 5
+
+Drives both deployments in-process, without a server in front, with
+``--concurrency`` clients each waiting for its response before sending
+the next request:
+
+* WSGI: config.wsgi's handler called from a pool of ``--wsgi-threads``
+  threads, like gunicorn with that many sync workers; every database
+  round-trip of a request holds its worker and the other clients queue.
+* ASGI: config.asgi's application with every client's request in flight
+  on one event loop; the async views (core/async_views.py) read
+  independent aggregates concurrently on ASYNC_READ_THREADS threads.
+
+Requests cycle through analytics, advanced analytics, the currency list
+and history pages. The analytics response cache is off so every request
+computes its payload. SQLite answers in microseconds; ``--db-latency-ms``
+adds a sleep to every query to model a database across the network,
+where the difference between the two models shows.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from _setup import historical_timestamps, setup
+
+PATHS = [
+    ('/api/analytics/', 'period=week'),
+    ('/api/analytics/', 'period=month'),
+    ('/api/analytics/advanced/', 'period=week'),
+    ('/api/operations/currencies/', ''),
+    ('/api/histories/', ''),
+    ('/api/histories/', 'page=3'),
+]
+
+
+def seed(operations, currencies, events):
+    from core.models import ClientOperation, Currency, CustomUser, HistoryEvent, Shift
+    from core.rollups import rebuild_rollups
+
+    rng = random.Random(42)
+    now = datetime.now()
+    admin = CustomUser.objects.create_user('bench', 'bench@example.com', 'bench', role='admin')
+    Shift.objects.create(user=admin)
+    Currency.objects.create(name='Som', balance=Decimal('100000000'))
+    cur_objs = Currency.objects.bulk_create(
+        [Currency(name=f'CUR{i}', balance=Decimal('1000000')) for i in range(currencies)]
+    )
+    with historical_timestamps(ClientOperation._meta.get_field('timestamp')):
+        batch = []
+        for i in range(operations):
+            amount = Decimal(rng.randint(1, 2000))
+            rate = Decimal(rng.uniform(1, 100)).quantize(Decimal('0.0001'))
+            batch.append(ClientOperation(
+                operation_type=rng.choice(('buy', 'sell')),
+                currency=rng.choice(cur_objs),
+                cashier_name=admin.username,
+                amount=amount,
+                exchange_rate=rate,
+                total_in_som=(amount * rate).quantize(Decimal('0.01')),
+                timestamp=now - timedelta(seconds=i * 60),
+            ))
+        ClientOperation.objects.bulk_create(batch, batch_size=5000)
+    HistoryEvent.objects.bulk_create([
+        HistoryEvent(event_type='create_currency', user=admin, user_username=admin.username,
+                     currency=cur, currency_name=cur.name)
+        for cur in (rng.choice(cur_objs) for _ in range(events))
+    ], batch_size=5000)
+    rebuild_rollups()
+    return admin
+
+
+def add_db_latency(latency):
+    """Sleep ``latency`` seconds before every query, on every connection."""
+    from django.db.backends.signals import connection_created
+
+    def delayed(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def on_connect(sender, connection, **kwargs):
+        # обёртка живёт на DatabaseWrapper потока, а он переживает переподключения
+        if delayed not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delayed)
+
+    connection_created.connect(on_connect, weak=False)
+
+
+def run_wsgi(requests, concurrency, threads, token):
+    from django.test import RequestFactory
+
+    from config.wsgi import application
+
+    factory = RequestFactory()
+    workers = threading.Semaphore(threads)
+
+    def one(target):
+        path, query = target
+        environ = factory.get(f'{path}?{query}', HTTP_AUTHORIZATION=f'Bearer {token}').environ
+        statuses = []
+        started = time.perf_counter()  # включая ожидание свободного воркера
+        with workers:
+            body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            b''.join(body)
+            body.close()
+        return int(statuses[0].split()[0]), time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(one, requests))
+        return time.perf_counter() - started, results
+
+
+async def _asgi_request(application, target, token):
+    path, query = target
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'root_path': '',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+        'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    messages = []
+    finished = asyncio.Event()
+    pending = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+        if message['type'] == 'http.response.body' and not message.get('more_body'):
+            finished.set()
+
+    started = time.perf_counter()
+    await application(scope, receive, send)
+    return messages[0]['status'], time.perf_counter() - started
+
+
+def run_asgi(requests, concurrency, token):
+    from config.asgi import application
+
+    async def main():
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one(target):
+            async with limit:
+                return await _asgi_request(application, target, token)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(target) for target in requests))
+        return time.perf_counter() - started, results
+
+    return asyncio.run(main())
+
+
+def report(name, elapsed, results):
+    latencies = sorted(duration * 1000 for _, duration in results)
+    statuses = {status for status, _ in results}
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:6} {len(results) / elapsed:>9.0f} {statistics.median(latencies):>9.1f} {p95:>9.1f}"
+          f"   {sorted(statuses)}")
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--wsgi-threads', type=int, default=4)
+    parser.add_argument('--operations', type=int, default=20000)
+    parser.add_argument('--currencies', type=int, default=10)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--db-latency-ms', type=float, default=0)
+    args = parser.parse_args()
+
+    db_file = Path(tempfile.mkdtemp()) / 'asgi_reads.sqlite3'
+    setup(db_name=str(db_file), timeout=60)
+
+    from django.conf import settings
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    settings.ANALYTICS_CACHE_SECONDS = 0
+    admin = seed(args.operations, args.currencies, args.events)
+    token = str(AccessToken.for_user(admin))
+    if args.db_latency_ms:
+        add_db_latency(args.db_latency_ms / 1000)
+
+    requests = [PATHS[i % len(PATHS)] for i in range(args.requests)]
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.wsgi_threads} WSGI threads, "
+          f"db latency {args.db_latency_ms} ms per query")
+    print(f"{'':6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9}   statuses")
+
+    run_wsgi(requests[:len(PATHS)], 1, 1, token)  # прогрев: импорты, реестр валют
+    statuses = report('WSGI', *run_wsgi(requests, args.concurrency, args.wsgi_threads, token))
+    run_asgi(requests[:len(PATHS)], 1, token)
+    statuses |= report('ASGI', *run_asgi(requests, args.concurrency, token))
+
+    db_file.unlink(missing_ok=True)
+    if statuses != {200}:
+        raise SystemExit(f"unexpected status codes: {sorted(statuses)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""
+Latency, query count and peak memory of every route in core/urls.py.
+
+    python benchmarks/endpoints.py --years 1 --output before.json
+    python benchmarks/endpoints.py --years 1 --output after.json --compare before.json
+
+Seeds a throw-away database with ``manage.py seed_data`` (years of
+operations, shifts, ledger and history), then sends every case below
+through DRF's test client as the seeded admin: ``--iterations`` timed
+requests for p50/p95 latency (response bodies, streamed ones included,
+are read to the end), then one more under tracemalloc with the queries
+of every database alias captured. Objects a destructive case consumes
+(a currency to delete, an operation to edit) are created before each
+request, outside the timing.
+
+The JSON report (``--output``) holds one entry per case plus the dataset
+and the git revision, so reports of two versions can be diffed with
+``--compare``. Routes of core/urls.py without a case are listed under
+``uncovered``: add a case when adding a route. The analytics response
+cache is off (``--analytics-cache`` keeps it) so analytics requests
+measure the computation, not a cache hit.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from itertools import count
+from pathlib import Path
+from urllib.parse import urlencode
+
+from _setup import BASE_DIR, setup
+
+# маршрут без кейса: причина
+SKIPPED = {
+    'event-stream': "server-sent events never finish; served under ASGI only",
+}
+
+
+class Case:
+    """One request to a named route of core/urls.py."""
+
+    def __init__(self, route, method='get', kwargs=None, query=None, data=None, prepare=None,
+                 label=None, max_iterations=None):
+        self.route = route
+        self.method = method
+        self.kwargs = kwargs or {}
+        self.query = query or {}
+        self.data = data
+        self.prepare = prepare  # () -> {'kwargs': ..., 'data': ...}, вызывается вне замера
+        self.label = label or f"{method.upper()} {route}" + (f"?{urlencode(self.query)}" if self.query else '')
+        self.max_iterations = max_iterations
+
+    def request(self):
+        from django.urls import reverse
+
+        parts = {'kwargs': self.kwargs, 'data': self.data}
+        if self.prepare is not None:
+            parts.update(self.prepare())
+        path = reverse(self.route, kwargs=parts['kwargs'])
+        if self.query:
+            path += '?' + urlencode(self.query)
+        return path, parts['data']
+
+
+def build_cases(client):
+    from core.models import ClientOperation, Currency, CustomUser, HistoryEvent, Shift
+
+    usd = Currency.objects.exclude(name='Som').order_by('id').first()
+    cashier = CustomUser.objects.filter(role='cashier').order_by('id').first()
+    operation = ClientOperation.objects.order_by('-timestamp').first()
+    closed_shift = Shift.objects.filter(end_time__isnull=False).order_by('-start_time').first()
+    event = HistoryEvent.objects.order_by('-timestamp').first()
+    year_ago = (datetime.now() - timedelta(days=365)).isoformat(timespec='seconds')
+    numbers = count(1)
+
+    def new_operation():
+        response = client.post('/api/operations/', {
+            'operation_type': 'buy', 'currency': usd.id, 'amount': '10', 'exchange_rate': '87.5',
+        })
+        assert response.status_code == 201, response.content
+        return {'kwargs': {'pk': response.data['id']}}
+
+    def new_currency():
+        return {'kwargs': {'pk': Currency.objects.create(name=f'DEL{next(numbers)}', balance=0).id}}
+
+    def new_user():
+        user = CustomUser.objects.create(username=f'deleted{next(numbers)}', role='cashier')
+        return {'kwargs': {'pk': user.id}}
+
+    def currency_payload():
+        return {'data': {'name': f'NEW{next(numbers)}', 'balance': '1000.00'}}
+
+    def user_payload():
+        return {'data': {'username': f'bench{next(numbers)}', 'email': 'bench@example.com',
+                         'role': 'cashier', 'password': 'Bench-pass-2024'}}
+
+    buy = {'operation_type': 'buy', 'currency': usd.id, 'amount': '10', 'exchange_rate': '87.5'}
+    op = {'pk': operation.id}
+    return [
+        Case('api-root'),
+
+        Case('currency-list'),
+        Case('currency-detail', kwargs={'pk': usd.id}),
+        Case('operation-currencies'),
+
+        Case('operation-list', query={'period': 'shift'}),
+        Case('operation-list', query={'period': 'week'}),
+        Case('operation-list', query={'period': 'week', 'page': 'last'}),
+        Case('operation-detail', kwargs=op),
+        Case('operation-generate-receipt', kwargs=op),
+        Case('operation-generate-receipt-inline', kwargs=op),
+        Case('operation-receipt-job', kwargs=op),
+        Case('operation-receipt-job', method='post', kwargs=op),
+        Case('operation-receipts-bundle', query={'shift': closed_shift.id}, max_iterations=3,
+             label='GET operation-receipts-bundle?shift=<last closed>'),
+
+        Case('shift-list'),
+        Case('shift-detail', kwargs={'pk': closed_shift.id}),
+        Case('shift-current-cashier'),
+        Case('shift-history'),
+        Case('shift-history', query={'page': 5}),
+
+        Case('histories-list'),
+        Case('histories-list', query={'page': 'last'}),
+        Case('histories-list', query={'event_type': 'update_currency'}),
+        Case('histories-detail', kwargs={'pk': event.id}),
+        Case('internal-history'),
+
+        Case('user-list'),
+        Case('user-detail', kwargs={'pk': cashier.id}),
+
+        Case('analytics', query={'period': 'today'}),
+        Case('analytics', query={'period': 'shift'}),
+        Case('analytics', query={'period': 'week'}),
+        Case('analytics', query={'period': 'month'}),
+        Case('analytics-advanced', query={'period': 'week'}),
+        Case('analytics-advanced', query={'period': 'month'}),
+        Case('export-analytics-excel', query={'period': 'month'}),
+
+        Case('balances-at'),
+        Case('balances-at', query={'at': year_ago}, label='GET balances-at?at=<a year ago>'),
+        Case('balances-history'),
+        Case('balances-history', query={'step': 'hour'}),
+
+        Case('export-event-excel', query={'period': 'month'}),
+        Case('export-event-csv', query={'period': 'month'}),
+        Case('export-event-ndjson', query={'period': 'month'}),
+        Case('export-operation-excel', query={'period': 'week'}),
+        Case('export-operation-csv', query={'period': 'month'}),
+        Case('export-operation-ndjson', query={'period': 'month'}),
+        Case('export-operation-csv', query={'since': '2000-01-01'}, max_iterations=3),
+
+        # записи — после чтений, чтобы чтения видели исходные данные
+        Case('operation-list', method='post', data=buy),
+        Case('operation-bulk', method='post', data={'operations': [buy] * 50}),
+        Case('operation-edit-operation', method='patch', data={'amount': '12'}, prepare=new_operation),
+        Case('operation-detail', method='delete', prepare=new_operation),
+        Case('currency-list', method='post', prepare=currency_payload),
+        Case('currency-detail', method='patch', kwargs={'pk': usd.id}, data={'name': usd.name}),
+        Case('currency-detail', method='delete', prepare=new_currency),
+        Case('user-list', method='post', prepare=user_payload),
+        Case('user-detail', method='delete', prepare=new_user),
+        Case('shift-set-cashier', method='post', data={'cashier_id': cashier.id}),
+        Case('shift-clear', method='post', data={'balances': []}),
+    ]
+
+
+def send(client, method, path, data):
+    if method == 'get':
+        response = client.get(path)
+    else:
+        response = getattr(client, method)(path, data, format='json')
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    response.close()
+    return response.status_code, size
+
+
+def measure(client, case, iterations):
+    from django.db import connections
+    from django.test.utils import CaptureQueriesContext
+
+    status, _ = send(client, case.method, *case.request())  # прогрев
+    latencies = []
+    for _ in range(iterations):
+        request = case.request()
+        started = time.perf_counter()
+        status, size = send(client, case.method, *request)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    request = case.request()
+    with ExitStack() as stack:
+        captured = {
+            alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+            for alias in connections.settings
+        }
+        tracemalloc.start()
+        send(client, case.method, *request)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    queries = {alias: len(context.captured_queries) for alias, context in captured.items()}
+    return {
+        'route': case.route,
+        'method': case.method.upper(),
+        'status': status,
+        'iterations': iterations,
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 2),
+        'max_ms': round(latencies[-1], 2),
+        'queries': sum(queries.values()),
+        'queries_by_alias': {alias: n for alias, n in queries.items() if n},
+        'peak_memory_kb': round(peak / 1024, 1),
+        'response_bytes': size,
+    }
+
+
+def route_names():
+    from django.urls import get_resolver
+
+    names = set()
+
+    def walk(patterns):
+        for pattern in patterns:
+            if hasattr(pattern, 'url_patterns'):
+                walk(pattern.url_patterns)
+            elif pattern.name:
+                names.add(pattern.name)
+
+    walk(get_resolver('core.urls').url_patterns)
+    return names
+
+
+def dataset():
+    from core.models import ClientOperation, Currency, CustomUser, HistoryEvent, LedgerEntry, Shift
+
+    return {
+        model.__name__: model.objects.count()
+        for model in (ClientOperation, LedgerEntry, HistoryEvent, Shift, Currency, CustomUser)
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\ncompared with {baseline_path} ({baseline['meta'].get('revision')})")
+    print(f"{'case':58} {'p50 ms':>20} {'queries':>12} {'peak kB':>20}")
+    for label, new in report['endpoints'].items():
+        old = baseline['endpoints'].get(label)
+        if old is None:
+            print(f"{label:58} {'new':>20}")
+            continue
+        print(f"{label:58} {old['p50_ms']:>8.1f} -> {new['p50_ms']:<8.1f} "
+              f"{old['queries']:>4} -> {new['queries']:<4} "
+              f"{old['peak_memory_kb']:>8.0f} -> {new['peak_memory_kb']:<8.0f}")
+    for label in baseline['endpoints'].keys() - report['endpoints'].keys():
+        print(f"{label:58} {'gone':>20}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--operations-per-day', type=int, default=200)
+    parser.add_argument('--currencies', type=int, default=12)
+    parser.add_argument('--cashiers', type=int, default=8)
+    parser.add_argument('--only', help="run only cases whose label contains this text")
+    parser.add_argument('--analytics-cache', action='store_true', help="keep the analytics response cache on")
+    parser.add_argument('--output', help="write the JSON report here")
+    parser.add_argument('--compare', help="JSON report of an earlier run to compare with")
+    args = parser.parse_args()
+
+    db_file = Path(tempfile.mkdtemp()) / 'endpoints.sqlite3'
+    setup(db_name=str(db_file), timeout=60)
+
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+    from rest_framework.test import APIClient
+
+    from core.models import CustomUser
+
+    if not args.analytics_cache:
+        settings.ANALYTICS_CACHE_SECONDS = 0
+    started = time.perf_counter()
+    call_command(
+        'seed_data', years=args.years, operations_per_day=args.operations_per_day,
+        currencies=args.currencies, cashiers=args.cashiers, verbosity=0,
+    )
+    seeded_in = time.perf_counter() - started
+
+    admin = CustomUser.objects.get(username='manager')
+    client = APIClient()
+    client.force_authenticate(admin)
+    cases = build_cases(client)
+    if args.only:
+        cases = [case for case in cases if args.only in case.label]
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'iterations': args.iterations,
+            'analytics_cache': args.analytics_cache,
+            'dataset': dataset(),
+        },
+        'endpoints': {},
+        'skipped': SKIPPED,
+        'uncovered': sorted(route_names() - {case.route for case in cases} - SKIPPED.keys()),
+    }
+    print(f"seeded in {seeded_in:.0f} s: {report['meta']['dataset']}")
+    print(f"{'case':58} {'status':>6} {'p50 ms':>8} {'p95 ms':>8} {'queries':>7} {'peak kB':>8}")
+    for case in cases:
+        iterations = min(args.iterations, case.max_iterations or args.iterations)
+        result = measure(client, case, iterations)
+        report['endpoints'][case.label] = result
+        print(f"{case.label:58} {result['status']:>6} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+              f"{result['queries']:>7} {result['peak_memory_kb']:>8.0f}")
+
+    if report['uncovered'] and not args.only:
+        print(f"routes without a case: {', '.join(report['uncovered'])}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, sort_keys=True))
+        print(f"report written to {args.output}")
+    if args.compare:
+        compare(report, args.compare)
+
+    db_file.unlink(missing_ok=True)
+    failed = [label for label, result in report['endpoints'].items() if result['status'] >= 400]
+    if failed:
+        raise SystemExit(f"unexpected status codes: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
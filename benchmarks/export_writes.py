@@ -0,0 +1,128 @@
+"""
+Latency of operation POSTs while a slow export is being downloaded.
+
+    python benchmarks/export_writes.py --operations 20000 --posts 40
+
+A client downloads /api/operations/export_csv/ slowly (pausing between
+chunks), which keeps the export's SELECT open for seconds. Meanwhile
+a cashier POSTs to /api/operations/ every ``--interval-ms``. Runs once with
+the rollback journal (journal_mode=DELETE: the open read holds a shared
+lock and every commit waits for it) and once with WAL, the mode migration
+core/0018_wal_journal_mode puts the database in (the export reads a
+snapshot through the 'reporting' alias and commits go through).
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from _setup import historical_timestamps, setup
+
+
+def seed(operations):
+    from core.models import ClientOperation, Currency, CustomUser, Shift
+
+    rng = random.Random(42)
+    now = datetime.now()
+    admin = CustomUser.objects.create_user('bench', 'bench@example.com', 'bench', role='admin')
+    Shift.objects.create(user=admin)
+    Currency.objects.create(name='Som', balance=Decimal('100000000'))
+    usd = Currency.objects.create(name='USD', balance=Decimal('1000000'))
+    with historical_timestamps(ClientOperation._meta.get_field('timestamp')):
+        ClientOperation.objects.bulk_create([
+            ClientOperation(
+                operation_type=rng.choice(('buy', 'sell')),
+                currency=usd,
+                cashier_name=admin.username,
+                amount=Decimal(rng.randint(1, 2000)),
+                exchange_rate=Decimal('87.5000'),
+                total_in_som=Decimal(rng.randint(1, 2000)) * Decimal('87.5'),
+                timestamp=now - timedelta(seconds=i * 30),
+            )
+            for i in range(operations)
+        ], batch_size=5000)
+    return admin, usd
+
+
+def use_journal_mode(mode):
+    from django.db import connections
+
+    connections.close_all()
+    options = connections['default'].settings_dict['OPTIONS']
+    options['init_command'] = f'PRAGMA journal_mode={mode}; PRAGMA synchronous=NORMAL'
+    with connections['default'].cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        return cursor.fetchone()[0]
+
+
+def slow_export(admin, pause, started):
+    from django.db import connections
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    client.force_authenticate(admin)
+    try:
+        response = client.get('/api/operations/export_csv/', {'since': '2000-01-01'})
+        chunks = 0
+        for _ in response.streaming_content:
+            if not chunks:
+                started.set()
+            chunks += 1
+            time.sleep(pause)
+        return chunks
+    finally:
+        connections.close_all()
+
+
+def post_latencies(admin, usd, posts, interval):
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    client.force_authenticate(admin)
+    latencies = []
+    for _ in range(posts):
+        started = time.perf_counter()
+        response = client.post('/api/operations/', {
+            'operation_type': 'buy', 'currency': usd.id, 'amount': '1', 'exchange_rate': '87.5',
+        })
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 201, response.content
+        time.sleep(interval)
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--operations', type=int, default=20000)
+    parser.add_argument('--posts', type=int, default=40)
+    parser.add_argument('--pause-ms', type=float, default=50, help="pause of the export client per chunk")
+    parser.add_argument('--interval-ms', type=float, default=100, help="pause between two POSTs")
+    args = parser.parse_args()
+
+    db_file = Path(tempfile.mkdtemp()) / 'export_writes.sqlite3'
+    setup(db_name=str(db_file), timeout=60)
+    admin, usd = seed(args.operations)
+
+    print(f"{args.operations} exported rows, {args.posts} POSTs during the export")
+    print(f"{'journal':8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for mode in ('DELETE', 'WAL'):
+        actual = use_journal_mode(mode)
+        started = threading.Event()
+        exporter = threading.Thread(target=slow_export, args=(admin, args.pause_ms / 1000, started))
+        exporter.start()
+        started.wait()
+        latencies = post_latencies(admin, usd, args.posts, args.interval_ms / 1000)
+        exporter.join()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"{actual:8} {statistics.median(latencies):>9.1f} {p95:>9.1f} {latencies[-1]:>9.1f}")
+
+    db_file.unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    main()
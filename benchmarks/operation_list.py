@@ -0,0 +1,119 @@
+"""
+Query count and per-row cost of serializing operation lists.
+
+    python benchmarks/operation_list.py --rows 1000
+
+Compares the ways of rendering the same rows:
+
+* model serializer, no join (the list path before: one currency query per row)
+* model serializer over select_related('currency')
+* values() + operation_list_rows (the list path of ClientOperationViewSet)
+
+and checks that all of them produce identical JSON. It then requests one
+page of /api/operations/ to show the query count of the endpoint.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from _setup import historical_timestamps, setup
+
+
+def seed(rows, currencies):
+    from core.models import ClientOperation, Currency, CustomUser, Shift
+
+    rng = random.Random(42)
+    now = datetime.now()
+    admin = CustomUser.objects.create_user('bench', 'bench@example.com', 'bench', role='admin')
+    Shift.objects.create(user=admin)
+    Currency.objects.create(name='Som', balance=Decimal('100000000'))
+    cur_objs = Currency.objects.bulk_create(
+        [Currency(name=f'CUR{i}', balance=Decimal('1000000')) for i in range(currencies)]
+    )
+    with historical_timestamps(ClientOperation._meta.get_field('timestamp')):
+        batch = []
+        for i in range(rows):
+            amount = Decimal(rng.randint(1, 2000))
+            rate = Decimal(rng.uniform(1, 100)).quantize(Decimal('0.0001'))
+            batch.append(ClientOperation(
+                operation_type=rng.choice(('buy', 'sell')),
+                currency=rng.choice(cur_objs),
+                cashier_name=admin.username,
+                amount=amount,
+                exchange_rate=rate,
+                total_in_som=(amount * rate).quantize(Decimal('0.01')),
+                timestamp=now - timedelta(seconds=i * 30),
+            ))
+        ClientOperation.objects.bulk_create(batch, batch_size=5000)
+    return admin
+
+
+def measure(name, render, rows, repeat):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    durations = []
+    for _ in range(repeat):
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            data = render()
+            durations.append(time.perf_counter() - started)
+    durations.sort()
+    median = durations[len(durations) // 2]
+    print(f"{name:42} {len(queries.captured_queries):>8} {median * 1000:>10.2f} {median / rows * 1e6:>10.2f}")
+    return [dict(row) for row in data]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--currencies', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    admin = seed(args.rows, args.currencies)
+
+    from core.models import ClientOperation
+    from core.serializers import OPERATION_LIST_VALUES, ClientOperationSerializer, operation_list_rows
+
+    base = ClientOperation.objects.order_by('-timestamp')
+    print(f"{args.rows} rows")
+    print(f"{'path':42} {'queries':>8} {'total ms':>10} {'us/row':>10}")
+    before = measure(
+        "ModelSerializer, no join",
+        lambda: ClientOperationSerializer(base.all(), many=True).data,
+        args.rows, args.repeat,
+    )
+    joined = measure(
+        "ModelSerializer + select_related",
+        lambda: ClientOperationSerializer(base.select_related('currency'), many=True).data,
+        args.rows, args.repeat,
+    )
+    lean = measure(
+        "values() + operation_list_rows",
+        lambda: operation_list_rows(base.values(*OPERATION_LIST_VALUES)),
+        args.rows, args.repeat,
+    )
+    assert before == joined == lean, "list paths disagree"
+    print("all paths produce identical rows")
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    client.force_authenticate(admin)
+    for url in ('/api/operations/?period=week', '/api/operations/?period=week&pagination=cursor'):
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        print(f"GET {url}: {len(queries.captured_queries)} queries")
+
+
+if __name__ == '__main__':
+    main()
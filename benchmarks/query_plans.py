@@ -0,0 +1,167 @@
+"""
+Query plans and timings of the hot queries, with and without the
+composite indexes added in core/migrations/0012_hot_path_indexes.py.
+
+    python benchmarks/query_plans.py --operations 200000
+
+The script seeds a throw-away database, drops the indexes to measure the
+"before" state, re-creates them and measures again.
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from _setup import historical_timestamps, setup, timed
+
+INDEXED_MODELS = ('ClientOperation', 'Shift', 'HistoryEvent')
+INDEX_NAMES = {
+    'op_ts_idx', 'op_cur_type_ts_idx',
+    'shift_open_idx', 'shift_start_idx',
+    'event_ts_idx', 'event_type_ts_idx',
+}
+
+
+def seed(operations, days, currencies):
+    from core.models import ClientOperation, Currency, CustomUser, HistoryEvent, Shift
+
+    rng = random.Random(42)
+    now = datetime.now()
+
+    cashier = CustomUser.objects.create_user('bench', 'bench@example.com', 'bench', role='cashier')
+    Currency.objects.create(name='Som', balance=Decimal('100000000'))
+    cur_objs = Currency.objects.bulk_create(
+        [Currency(name=f'CUR{i}', balance=Decimal('1000000')) for i in range(currencies)]
+    )
+
+    with historical_timestamps(
+        ClientOperation._meta.get_field('timestamp'),
+        Shift._meta.get_field('start_time'),
+        HistoryEvent._meta.get_field('timestamp'),
+    ):
+        shifts = []
+        for day in range(days, 0, -1):
+            start = now - timedelta(days=day)
+            shifts.append(Shift(user=cashier, start_time=start, end_time=start + timedelta(hours=23)))
+        shifts.append(Shift(user=cashier, start_time=now - timedelta(hours=1)))
+        Shift.objects.bulk_create(shifts)
+
+        span = days * 24 * 3600
+        batch = []
+        for _ in range(operations):
+            amount = Decimal(rng.randint(1, 2000))
+            rate = Decimal(rng.uniform(1, 100)).quantize(Decimal('0.0001'))
+            batch.append(ClientOperation(
+                operation_type=rng.choice(('buy', 'sell')),
+                currency=rng.choice(cur_objs),
+                cashier_name=cashier.username,
+                amount=amount,
+                exchange_rate=rate,
+                total_in_som=(amount * rate).quantize(Decimal('0.01')),
+                timestamp=now - timedelta(seconds=rng.randint(0, span)),
+            ))
+            if len(batch) == 5000:
+                ClientOperation.objects.bulk_create(batch)
+                batch = []
+        ClientOperation.objects.bulk_create(batch)
+
+        event_types = [choice for choice, _ in HistoryEvent.EVENT_TYPES]
+        HistoryEvent.objects.bulk_create(
+            [
+                HistoryEvent(
+                    event_type=rng.choice(event_types),
+                    user=cashier,
+                    currency=rng.choice(cur_objs),
+                    timestamp=now - timedelta(seconds=rng.randint(0, span)),
+                )
+                for _ in range(operations // 10)
+            ],
+            batch_size=5000,
+        )
+    return now, cur_objs[0]
+
+
+def hot_queries(now, currency):
+    from django.db.models import Avg, Count, Sum
+
+    from core.models import ClientOperation, HistoryEvent, Shift
+
+    week_ago = now - timedelta(days=7)
+    month_ago = now - timedelta(days=30)
+    return [
+        ("operations list (period=week)",
+         ClientOperation.objects.filter(timestamp__gte=week_ago).order_by('-timestamp')[:8]),
+        ("analytics raw edge scan (1 hour)",
+         ClientOperation.objects.filter(timestamp__gte=now - timedelta(hours=1), timestamp__lte=now)
+         .values('currency_id', 'operation_type')
+         .annotate(amount=Sum('amount'), rate=Sum('exchange_rate'), ops=Count('id')).order_by()),
+        ("per-currency aggregate (month)",
+         ClientOperation.objects.filter(currency=currency, operation_type='buy', timestamp__gte=month_ago)
+         .values('currency_id').annotate(amount=Sum('amount'), rate=Avg('exchange_rate')).order_by()),
+        ("operations export (period=month)",
+         ClientOperation.objects.filter(timestamp__gte=month_ago).order_by('-timestamp')),
+        ("active shift lookup",
+         Shift.objects.filter(end_time__isnull=True).order_by('-start_time')[:1]),
+        ("shift history page",
+         Shift.objects.order_by('-start_time')[:8]),
+        ("history events page",
+         HistoryEvent.objects.order_by('-timestamp')[:10]),
+        ("history events filtered by type",
+         HistoryEvent.objects.filter(event_type='create_currency').order_by('-timestamp')[:10]),
+    ]
+
+
+def measure(label, queries, repeat):
+    print(f"\n=== {label} ===")
+    timings = {}
+    for name, queryset in queries:
+        print(f"\n-- {name}")
+        print(queryset.explain())
+        timings[name] = timed(lambda: list(queryset.all()), repeat=repeat)
+        print(f"median: {timings[name]:.2f} ms")
+    return timings
+
+
+def set_indexes(connection, enabled):
+    from django.apps import apps
+
+    with connection.schema_editor() as editor:
+        for model_name in INDEXED_MODELS:
+            model = apps.get_model('core', model_name)
+            for index in model._meta.indexes:
+                if index.name not in INDEX_NAMES:
+                    continue
+                if enabled:
+                    editor.add_index(model, index)
+                else:
+                    editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--operations', type=int, default=200_000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--currencies', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    connection = setup()
+    print(f"Seeding {args.operations} operations over {args.days} days...")
+    now, currency = seed(args.operations, args.days, args.currencies)
+    queries = hot_queries(now, currency)
+
+    set_indexes(connection, enabled=False)
+    before = measure("before (no composite indexes)", queries, args.repeat)
+    set_indexes(connection, enabled=True)
+    after = measure("after (with composite indexes)", queries, args.repeat)
+
+    print("\n=== summary (median ms) ===")
+    print(f"{'query':40} {'before':>10} {'after':>10}")
+    for name, _ in queries:
+        print(f"{name:40} {before[name]:10.2f} {after[name]:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
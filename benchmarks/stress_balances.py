@@ -0,0 +1,123 @@
+"""
+Concurrency stress test for balance updates.
+
+    python benchmarks/stress_balances.py --requests 400 --workers 16
+
+Fires buy/sell requests at the operations API from many threads (each
+with its own database connection, like separate gunicorn workers) and
+then checks that every balance equals its starting value plus the effect
+of the operations that were actually recorded, that it matches the last
+ledger entry, and that no balance went negative. Starting balances are kept small so that a good share of the
+requests is rejected for insufficient funds.
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+from _setup import setup
+
+
+def seed(currencies, som_balance, currency_balance):
+    from core.models import Currency, CustomUser, Shift
+
+    admin = CustomUser.objects.create_user('stress', 'stress@example.com', 'stress', role='admin')
+    Shift.objects.create(user=admin)
+    Currency.objects.create(name='Som', balance=som_balance)
+    Currency.objects.bulk_create(
+        [Currency(name=f'CUR{i}', balance=currency_balance) for i in range(currencies)]
+    )
+    return admin, {cur.id: cur.balance for cur in Currency.objects.all()}
+
+
+def fire(admin, payloads, workers):
+    from django.db import connection
+    from rest_framework.test import APIClient
+
+    def send(payload):
+        client = APIClient()
+        client.force_authenticate(admin)
+        try:
+            response = client.post('/api/operations/', payload)
+            return response.status_code
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return Counter(pool.map(send, payloads))
+
+
+def expected_balances(initial):
+    from core.models import ClientOperation, Currency
+
+    som_id = Currency.objects.get(name='Som').id
+    expected = dict(initial)
+    for op_type, currency_id, amount, total in ClientOperation.objects.values_list(
+        'operation_type', 'currency_id', 'amount', 'total_in_som'
+    ):
+        sign = 1 if op_type == 'buy' else -1
+        expected[currency_id] += sign * amount
+        expected[som_id] -= sign * total
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--currencies', type=int, default=3)
+    args = parser.parse_args()
+
+    db_file = Path(tempfile.mkdtemp()) / 'stress.sqlite3'
+    # timeout: ждём блокировку, а не падаем с "database is locked"
+    setup(db_name=str(db_file), timeout=60)
+
+    admin, initial = seed(args.currencies, Decimal('50000.00'), Decimal('500.00'))
+    from core.models import Currency
+    currency_ids = list(Currency.objects.exclude(name='Som').values_list('id', flat=True))
+
+    rng = random.Random(7)
+    payloads = [
+        {
+            'operation_type': rng.choice(('buy', 'sell')),
+            'currency': rng.choice(currency_ids),
+            'amount': str(rng.randint(1, 200)),
+            'exchange_rate': str(Decimal(rng.uniform(50, 120)).quantize(Decimal('0.0001'))),
+        }
+        for _ in range(args.requests)
+    ]
+
+    started = time.perf_counter()
+    statuses = fire(admin, payloads, args.workers)
+    elapsed = time.perf_counter() - started
+    print(f"{args.requests} requests, {args.workers} workers, {elapsed:.2f} s "
+          f"({args.requests / elapsed:.0f} req/s)")
+    print("status codes:", dict(statuses))
+
+    from core.ledger import balance_at
+
+    expected = expected_balances(initial)
+    actual = dict(Currency.objects.values_list('id', 'balance'))
+    now = datetime.now()
+    failures = 0
+    for currency_id, balance in sorted(actual.items()):
+        ok = balance == expected[currency_id] == balance_at(currency_id, now) and balance >= 0
+        failures += not ok
+        print(f"currency {currency_id:3}: balance {balance:>14} expected {expected[currency_id]:>14}"
+              f" {'OK' if ok else 'MISMATCH'}")
+
+    db_file.unlink(missing_ok=True)
+    if failures or set(statuses) - {201, 400}:
+        print("FAILED")
+        sys.exit(1)
+    print("balances match the operation log")
+
+
+if __name__ == '__main__':
+    main()
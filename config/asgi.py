@@ -3,14 +3,29 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Under ASGI, URLs are resolved with config/asgi_urls.py: the async versions
+of the read endpoints (core/async_views.py) first, then everything from
+config/urls.py.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+ASGI_URLCONF = 'config.asgi_urls'
+
+
+class AsyncReadsASGIHandler(ASGIHandler):
+    async def get_response_async(self, request):
+        request.urlconf = ASGI_URLCONF
+        return await super().get_response_async(request)
+
+
+django.setup(set_prefix=False)
+application = AsyncReadsASGIHandler()
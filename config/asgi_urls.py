@@ -0,0 +1,16 @@
+"""
+URLconf of the ASGI deployment (see config/asgi.py): the read endpoints
+that have async versions are matched first, the rest is config/urls.py.
+"""
+from django.urls import path
+
+from core import async_views
+
+from .urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('api/analytics/', async_views.analytics, name='analytics-async'),
+    path('api/analytics/advanced/', async_views.advanced_analytics, name='analytics-advanced-async'),
+    path('api/operations/currencies/', async_views.list_currencies, name='operation-currencies-async'),
+    path('api/histories/', async_views.history_events, name='histories-list-async'),
+] + wsgi_urlpatterns
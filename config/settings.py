@@ -87,9 +87,94 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {
+            # Транзакция сразу берёт блокировку на запись: конкурирующие
+            # воркеры ждут своей очереди, а не падают на апгрейде блокировки
+            'transaction_mode': 'IMMEDIATE',
+            # Ждать занятую блокировку до 20 с вместо "database is locked"
+            'timeout': 20,
+            # Файл базы переводится в WAL один раз миграцией
+            # core/0018_wal_journal_mode (режим хранится в файле); synchronous
+            # действует только на соединение и задаётся при каждом подключении
+            'init_command': 'PRAGMA synchronous=NORMAL',
+        },
+    },
+    # Exports, analytics and history read through this alias (see
+    # core/routers.py): the same file, query-only and memory-mapped.
+    'reporting': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 20,
+            'init_command': 'PRAGMA query_only=ON; PRAGMA mmap_size=268435456',
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['core.routers.ReportingRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Version stamps shared by all gunicorn workers (see core/cache_versions.py)
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.django_cache',
+        'TIMEOUT': None,
+    },
+    # Cached analytics payloads (core/analytics_cache.py). Kept apart from
+    # 'shared' so culling payloads never evicts version stamps or counters.
+    'analytics': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.django_cache' / 'analytics',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    # Rendered receipt PDFs: bounded LRU (locmem evicts least recently used keys)
+    'receipts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'receipts',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 200,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+# Receipt rendering. 0 renders PDFs (receipt bundles included) inside the
+# request worker; N > 0 hands rendering to a pool of N local processes
+# (see core/receipts.py) and generate_receipt* wait at most
+# RECEIPT_JOB_WAIT_SECONDS before answering 202 with a receipt job the
+# client can poll.
+RECEIPT_RENDER_WORKERS = 0
+RECEIPT_JOB_WAIT_SECONDS = 10
+# A merged-PDF receipt bundle (&bundle=pdf) is assembled in memory, so it
+# is refused above this many receipts; the ZIP bundle streams any size.
+RECEIPT_PDF_BUNDLE_MAX_OPERATIONS = 200
+
+# How long a stored Idempotency-Key response is replayed (core/idempotency.py).
+# Expired rows are removed by ``manage.py purge_idempotency_keys``.
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
+# Server-sent events stream (core/events.py, served over ASGI only).
+# A client more than EVENT_STREAM_QUEUE_SIZE events behind gets a single
+# 'resync' event instead; idle streams get a comment line every
+# EVENT_STREAM_HEARTBEAT_SECONDS so proxies keep them open.
+EVENT_STREAM_QUEUE_SIZE = 256
+EVENT_STREAM_HEARTBEAT_SECONDS = 15
+
+# Threads that run the database reads of the async views under ASGI
+# (core/async_views.py); at most this many of their queries run at once.
+ASYNC_READ_THREADS = 32
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -0,0 +1,186 @@
+"""
+Shared analytics engine.
+
+Per-currency buy/sell amounts, average rates and operation counts for a
+period are computed with grouped queries (currency x operation type).
+Whole hours inside the period are read from the OperationRollup buckets;
+only the partial hours at the edges of the period touch raw operations, so
+the cost depends on the number of buckets, not on the number of operations.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import TruncHour
+
+from .models import ClientOperation, OperationRollup
+from .rollups import hour_bucket
+
+
+def _empty_stats():
+    return {
+        "buy_amount": None,
+        "sell_amount": None,
+        "avg_buy_rate": None,
+        "avg_sell_rate": None,
+        "buy_ops": 0,
+        "sell_ops": 0,
+    }
+
+
+def _split_period(start, end):
+    """
+    Split [start, end] into the range covered by whole rollup buckets
+    [first_bucket, last_bucket) and a Q() for the raw edge operations.
+    """
+    first_bucket = hour_bucket(start)
+    if first_bucket < start:
+        first_bucket += timedelta(hours=1)
+    last_bucket = hour_bucket(end)
+
+    if first_bucket >= last_bucket:
+        # Период короче часа — считаем по сырым операциям
+        return None, None, Q(timestamp__gte=start, timestamp__lte=end)
+
+    edges = (
+        Q(timestamp__gte=start, timestamp__lt=first_bucket)
+        | Q(timestamp__gte=last_bucket, timestamp__lte=end)
+    )
+    return first_bucket, last_bucket, edges
+
+
+def currency_stats(start, end):
+    """
+    Aggregate operations in [start, end] grouped by currency and type.
+
+    Returns a dict {currency_id: stats}. Missing sums/averages are None,
+    exactly like a plain ``aggregate()`` over an empty queryset, so callers
+    keep their own ``or 0`` fallbacks.
+    """
+    first_bucket, last_bucket, edges = _split_period(start, end)
+
+    totals = {}
+
+    def add(row):
+        key = (row['currency_id'], row['operation_type'])
+        amount, rate_sum, ops = totals.get(key, (None, Decimal('0'), 0))
+        if row['amount'] is not None:
+            amount = row['amount'] if amount is None else amount + row['amount']
+        totals[key] = (amount, rate_sum + (row['rate_sum'] or 0), ops + row['ops'])
+
+    if first_bucket is not None:
+        bucket_rows = (
+            OperationRollup.objects
+            .filter(bucket__gte=first_bucket, bucket__lt=last_bucket, rate_count__gt=0)
+            .values('currency_id', 'operation_type')
+            .annotate(amount=Sum('amount_sum'), rate_sum=Sum('rate_sum'), ops=Sum('rate_count'))
+            .order_by()
+        )
+        for row in bucket_rows:
+            add(row)
+
+    edge_rows = (
+        ClientOperation.objects
+        .filter(edges)
+        .values('currency_id', 'operation_type')
+        .annotate(amount=Sum('amount'), rate_sum=Sum('exchange_rate'), ops=Count('id'))
+        .order_by()
+    )
+    for row in edge_rows:
+        add(row)
+
+    stats = {}
+    for (currency_id, op_type), (amount, rate_sum, ops) in totals.items():
+        if not ops:
+            continue
+        entry = stats.setdefault(currency_id, _empty_stats())
+        prefix = 'buy' if op_type == 'buy' else 'sell'
+        entry[f"{prefix}_amount"] = amount
+        entry[f"avg_{prefix}_rate"] = Decimal(rate_sum) / ops
+        entry[f"{prefix}_ops"] = ops
+    return stats
+
+
+def get_currency_stats(stats, currency_id):
+    """Stats for one currency, empty if it had no operations in the period."""
+    return stats.get(currency_id) or _empty_stats()
+
+
+def operation_totals(stats):
+    """(total, buys, sells) operation counts across all currencies."""
+    buys = sum(entry['buy_ops'] for entry in stats.values())
+    sells = sum(entry['sell_ops'] for entry in stats.values())
+    return buys + sells, buys, sells
+
+
+def busiest_hours(start, end, limit=2):
+    """
+    The busiest hours in [start, end] as [(hour, operation_count), ...].
+    """
+    first_bucket, last_bucket, edges = _split_period(start, end)
+
+    counts = {}
+    if first_bucket is not None:
+        bucket_rows = (
+            OperationRollup.objects
+            .filter(bucket__gte=first_bucket, bucket__lt=last_bucket)
+            .values('bucket')
+            .annotate(ops=Sum('rate_count'))
+            .order_by()
+        )
+        for row in bucket_rows:
+            counts[row['bucket']] = counts.get(row['bucket'], 0) + row['ops']
+
+    edge_rows = (
+        ClientOperation.objects
+        .filter(edges)
+        .annotate(hour=TruncHour('timestamp'))
+        .values('hour')
+        .annotate(ops=Count('id'))
+        .order_by()
+    )
+    for row in edge_rows:
+        counts[row['hour']] = counts.get(row['hour'], 0) + row['ops']
+
+    busiest = sorted(
+        ((hour, ops) for hour, ops in counts.items() if ops > 0),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    return busiest[:limit]
+
+
+def shift_totals(start, end=None):
+    """
+    Operation count, bought/sold totals, average rates and profit for the
+    operations of a shift, in one aggregate query. ``end=None`` means the
+    shift is still open.
+    """
+    ops = ClientOperation.objects.filter(timestamp__gte=start)
+    if end is not None:
+        ops = ops.filter(timestamp__lte=end)
+
+    buy = Q(operation_type='buy')
+    sell = Q(operation_type='sell')
+    agg = ops.aggregate(
+        operations_count=Count('id'),
+        total_bought=Sum('amount', filter=buy),
+        avg_buy_rate=Avg('exchange_rate', filter=buy),
+        total_sold=Sum('amount', filter=sell),
+        avg_sell_rate=Avg('exchange_rate', filter=sell),
+    )
+
+    total_bought = agg['total_bought'] or 0
+    avg_buy_rate = agg['avg_buy_rate'] or 0
+    total_sold = agg['total_sold'] or 0
+    avg_sell_rate = agg['avg_sell_rate'] or 0
+
+    overlap = min(total_bought, total_sold)
+    return {
+        "operations_count": agg['operations_count'],
+        "total_bought": total_bought,
+        "total_sold": total_sold,
+        "avg_buy_rate": avg_buy_rate,
+        "avg_sell_rate": avg_sell_rate,
+        "profit": round(overlap * (avg_sell_rate - avg_buy_rate), 2),
+    }
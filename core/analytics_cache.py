@@ -0,0 +1,120 @@
+"""
+Shared response cache for the analytics endpoints.
+
+An analytics payload only changes when operations, currencies or the
+active shift change, and every such write already bumps a version stamp
+(see core/cache_versions.py). A payload is cached in the 'analytics'
+alias under its endpoint, period, start bucket and the current stamps, so
+all workers reuse one computation until the next write; after a write the
+key simply changes and the old entries expire (or are culled) on their own.
+Payloads never go to the 'shared' alias: culling there could evict the
+stamps themselves.
+
+Sliding periods ('week' = the last 7 days) have a new start on every
+call. Starts are grouped into ANALYTICS_CACHE_BUCKET-second buckets,
+the same window the analytics ETags use, so a cached payload is at most
+that old. Entries live ANALYTICS_CACHE_SECONDS (setting, default five
+buckets); 0 turns the cache off.
+
+Hits and misses are counted per endpoint in the 'shared' cache; see the
+``analytics_cache_stats`` management command.
+"""
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from .cache_versions import SHARED_CACHE_ALIAS, get_version
+from .etags import ANALYTICS_ETAG_WINDOW
+
+ANALYTICS_CACHE_BUCKET = ANALYTICS_ETAG_WINDOW
+ANALYTICS_CACHE_TIMEOUT = ANALYTICS_CACHE_BUCKET * 5
+ANALYTICS_CACHE_ENDPOINTS = ('analytics', 'advanced_analytics')
+ANALYTICS_CACHE_ALIAS = 'analytics'
+
+HIT = 'hit'
+MISS = 'miss'
+
+
+def _stat_key(endpoint, outcome):
+    return f"analytics_cache:{endpoint}:{outcome}"
+
+
+def _count(cache, endpoint, outcome):
+    key = _stat_key(endpoint, outcome)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:  # ключ удалили между add и incr
+        cache.set(key, 1, timeout=None)
+
+
+def _timeout():
+    # ANALYTICS_CACHE_SECONDS = 0 отключает кэш (каждый запрос считается заново)
+    return getattr(settings, 'ANALYTICS_CACHE_SECONDS', ANALYTICS_CACHE_TIMEOUT)
+
+
+def _payload_key(endpoint, period, start, versions):
+    bucket = int(start.timestamp() // ANALYTICS_CACHE_BUCKET)
+    parts = [endpoint, period, str(bucket)] + [str(get_version(name)) for name in versions]
+    digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+    return f"analytics_cache:payload:{digest}"
+
+
+def cached_payload(endpoint, period, start, versions, compute):
+    """
+    (payload, outcome): the cached payload of ``endpoint`` for this
+    period and start bucket, or ``compute()`` stored for the next callers.
+    ``versions`` are the stamps whose bump invalidates the payload.
+    """
+    cache = caches[ANALYTICS_CACHE_ALIAS]
+    stats = caches[SHARED_CACHE_ALIAS]
+    key = _payload_key(endpoint, period, start, versions)
+    payload = cache.get(key)
+    if payload is not None:
+        _count(stats, endpoint, HIT)
+        return payload, HIT
+
+    payload = compute()
+    cache.set(key, payload, timeout=_timeout())
+    _count(stats, endpoint, MISS)
+    return payload, MISS
+
+
+async def acached_payload(endpoint, period, start, versions, compute):
+    """cached_payload() for async views; ``compute`` is a coroutine function."""
+    cache = caches[ANALYTICS_CACHE_ALIAS]
+    stats = caches[SHARED_CACHE_ALIAS]
+    # операции кэша потокобезопасны — не занимаем общий thread-sensitive поток
+    key = await sync_to_async(_payload_key, thread_sensitive=False)(endpoint, period, start, versions)
+    payload = await cache.aget(key)
+    if payload is not None:
+        await sync_to_async(_count, thread_sensitive=False)(stats, endpoint, HIT)
+        return payload, HIT
+
+    payload = await compute()
+    await cache.aset(key, payload, timeout=_timeout())
+    await sync_to_async(_count, thread_sensitive=False)(stats, endpoint, MISS)
+    return payload, MISS
+
+
+def cache_stats():
+    """{endpoint: {'hit': n, 'miss': n}} since the last reset."""
+    cache = caches[SHARED_CACHE_ALIAS]
+    return {
+        endpoint: {
+            outcome: cache.get(_stat_key(endpoint, outcome), 0)
+            for outcome in (HIT, MISS)
+        }
+        for endpoint in ANALYTICS_CACHE_ENDPOINTS
+    }
+
+
+def reset_cache_stats():
+    cache = caches[SHARED_CACHE_ALIAS]
+    cache.delete_many([
+        _stat_key(endpoint, outcome)
+        for endpoint in ANALYTICS_CACHE_ENDPOINTS
+        for outcome in (HIT, MISS)
+    ])
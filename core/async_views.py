@@ -0,0 +1,223 @@
+"""
+Async versions of the read-only endpoints, served by config/asgi.py.
+
+The sync views hold a worker thread for every database round-trip of a
+request. These run on the event loop and hand each independent read to
+the thread pool with gather_reads(), so e.g. the period aggregates and
+the balances of /api/analytics/ are fetched at the same time, each on
+its own connection. Payloads are built by the same code as the DRF
+views (AnalyticsView.build, ...) and rendered with DRF's JSONRenderer,
+so both deployments answer byte for byte the same.
+
+URLs are in config/asgi_urls.py; under WSGI the DRF views keep serving.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .analytics import busiest_hours, currency_stats
+from .analytics_cache import acached_payload
+from .currencies import CURRENCY_REGISTRY_VERSION, current_balances, get_currency_registry
+from .etags import ANALYTICS_ETAG_WINDOW, CURRENCIES_VERSION, etag_condition
+from .pagination import wants_cursor
+from .permissions import is_cashier_or_admin, jwt_user
+from .routers import reporting_reads
+from .serializers import HistoryEventSerializer
+from .views import (
+    ANALYTICS_CACHE_HEADER,
+    ANALYTICS_ETAG_VERSIONS,
+    AdvancedAnalyticsView,
+    AnalyticsView,
+    ClientOperationViewSet,
+    HistoryEventFilter,
+    HistoryEventViewSet,
+)
+
+
+# Потоки для чтений из async-представлений: размер пула ограничивает
+# число одновременных запросов к БД (и открытых соединений).
+_read_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_READ_THREADS', 32),
+    thread_name_prefix='async-read',
+)
+
+
+def _pooled(call):
+    def run():
+        try:
+            return call()
+        finally:
+            # Соединение потока пула переживает вызов (открывать его на каждое
+            # чтение дороже самого чтения); закрываем только после ошибки.
+            for conn in connections.all(initialized_only=True):
+                if conn.errors_occurred:
+                    conn.close()
+    return run
+
+
+async def gather_reads(*calls):
+    """
+    Run independent blocking reads (zero-argument callables) concurrently,
+    each in a pool thread on that thread's own database connection.
+    """
+    return await asyncio.gather(*(
+        sync_to_async(_pooled(call), thread_sensitive=False, executor=_read_pool)()
+        for call in calls
+    ))
+
+
+def _json(data, status=200, headers=None):
+    return HttpResponse(
+        JSONRenderer().render(data), status=status,
+        content_type='application/json', headers=headers,
+    )
+
+
+async def _authorize(request, check=None):
+    """None if the request may proceed, else the 401/403 response DRF would give."""
+    user, = await gather_reads(lambda: jwt_user(request))
+    if user is None:
+        return _json({"detail": "Authentication credentials were not provided."}, status=401,
+                     headers={'WWW-Authenticate': 'Bearer realm="api"'})
+    if check is not None and not check(user):
+        return _json({"detail": "You do not have permission to perform this action."}, status=403)
+    request.user = user
+    return None
+
+
+async def analytics(request):
+    """GET /api/analytics/ — AnalyticsView."""
+    with reporting_reads():
+        return await _authorize(request, is_cashier_or_admin) or await _analytics(request)
+
+
+@etag_condition(*ANALYTICS_ETAG_VERSIONS, time_window=ANALYTICS_ETAG_WINDOW)
+async def _analytics(request):
+    period = request.GET.get('period', 'today')
+    now = timezone.now()
+    start, = await gather_reads(lambda: AnalyticsView.period_start(period, now))  # 'shift' читает активную смену
+
+    async def compute():
+        registry, stats, balances = await gather_reads(
+            get_currency_registry,
+            lambda: currency_stats(start, now),
+            current_balances,
+        )
+        return AnalyticsView.build(period, start, now, registry, stats, balances)
+
+    data, outcome = await acached_payload('analytics', period, start, ANALYTICS_ETAG_VERSIONS, compute)
+    return _json(data, headers={ANALYTICS_CACHE_HEADER: outcome})
+
+
+async def advanced_analytics(request):
+    """GET /api/analytics/advanced/ — AdvancedAnalyticsView."""
+    with reporting_reads():
+        return await _authorize(request, is_cashier_or_admin) or await _advanced_analytics(request)
+
+
+@etag_condition(*ANALYTICS_ETAG_VERSIONS, time_window=ANALYTICS_ETAG_WINDOW)
+async def _advanced_analytics(request):
+    period = request.GET.get('period', 'week')
+    now = timezone.now()
+    start = AdvancedAnalyticsView.period_start(period, now)
+
+    async def compute():
+        registry, stats, hours = await gather_reads(
+            get_currency_registry,
+            lambda: currency_stats(start, now),
+            lambda: busiest_hours(start, now),
+        )
+        return AdvancedAnalyticsView.build(period, start, now, registry, stats, hours)
+
+    data, outcome = await acached_payload('advanced_analytics', period, start, ANALYTICS_ETAG_VERSIONS, compute)
+    return _json(data, headers={ANALYTICS_CACHE_HEADER: outcome})
+
+
+async def list_currencies(request):
+    """GET /api/operations/currencies/ — ClientOperationViewSet.list_currencies."""
+    return await _authorize(request, is_cashier_or_admin) or await _list_currencies(request)
+
+
+@etag_condition(CURRENCIES_VERSION, CURRENCY_REGISTRY_VERSION)
+async def _list_currencies(request):
+    registry, balances = await gather_reads(get_currency_registry, current_balances)
+    rows = ClientOperationViewSet.currency_rows(registry)
+    return _json(ClientOperationViewSet.currency_list(rows, balances))
+
+
+_history_list = HistoryEventViewSet.as_view({'get': 'list'})
+
+
+async def history_events(request):
+    """
+    GET /api/histories/ — HistoryEventViewSet list with page-number
+    pagination: the page and the total count are read concurrently.
+    Cursor pages are a single query and go to the DRF view as they are.
+    """
+    if request.method != 'GET' or wants_cursor(request):
+        return await sync_to_async(_history_list)(request)
+    with reporting_reads():
+        return await _history_page(request)
+
+
+async def _history_page(request):
+    denied = await _authorize(request)
+    if denied:
+        return denied
+
+    filterset = HistoryEventFilter(request.GET, queryset=HistoryEventViewSet.queryset.all(), request=request)
+    if not filterset.is_valid():
+        return _json(filterset.errors, status=400)
+    queryset = filterset.qs
+
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    page_param = request.GET.get('page', 1)
+
+    if page_param == 'last':
+        # номер последней страницы зависит от count — здесь запросы по очереди
+        count, = await gather_reads(queryset.count)
+        number = max(1, -(-count // page_size))
+        offset = (number - 1) * page_size
+        events, = await gather_reads(lambda: list(queryset[offset:offset + page_size]))
+    else:
+        try:
+            number = int(page_param)
+        except (TypeError, ValueError):
+            number = 0
+        if number < 1:
+            return _json({"detail": "Invalid page."}, status=404)
+        offset = (number - 1) * page_size
+        count, events = await gather_reads(
+            queryset.count,
+            lambda: list(queryset[offset:offset + page_size]),
+        )
+
+    pages = max(1, -(-count // page_size))
+    if number > pages:
+        return _json({"detail": "Invalid page."}, status=404)
+
+    url = request.build_absolute_uri()
+    if number < pages:
+        next_link = replace_query_param(url, 'page', number + 1)
+    else:
+        next_link = None
+    if number == 1:
+        previous_link = None
+    elif number == 2:
+        previous_link = remove_query_param(url, 'page')
+    else:
+        previous_link = replace_query_param(url, 'page', number - 1)
+
+    return _json({
+        'count': count,
+        'next': next_link,
+        'previous': previous_link,
+        'results': HistoryEventSerializer(events, many=True).data,
+    })
@@ -0,0 +1,94 @@
+"""
+Atomic currency balance updates.
+
+Balances are never read, changed in Python and saved back: every change is
+a single ``UPDATE ... SET balance = balance + delta`` statement. Debits
+carry the sufficient-funds check in the same statement's WHERE clause, so
+two workers cannot both spend the same money. Callers run these inside
+``transaction.atomic`` together with the operation write, so a failed check
+rolls back everything done so far.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Value, When
+
+from .models import Currency
+
+BALANCE_QUANT = Decimal('0.01')  # Currency.balance decimal_places
+
+
+class InsufficientBalance(Exception):
+    def __init__(self, currency_id):
+        super().__init__(f"Insufficient balance for currency {currency_id}")
+        self.currency_id = currency_id
+
+
+def change_balance(currency_id, delta, check=True):
+    """
+    Add ``delta`` to the currency balance. A negative delta with
+    ``check=True`` only applies if the balance covers it, otherwise
+    InsufficientBalance is raised. Returns False if the currency is gone.
+    """
+    delta = Decimal(delta).quantize(BALANCE_QUANT)
+    qs = Currency.objects.filter(pk=currency_id)
+    if check and delta < 0:
+        qs = qs.filter(balance__gte=-delta)
+    if qs.update(balance=F('balance') + delta):
+        return True
+    if check and delta < 0 and Currency.objects.filter(pk=currency_id).exists():
+        raise InsufficientBalance(currency_id)
+    return False
+
+
+def operation_deltas(op_type, currency_id, som_id, amount, total_som, sign=1):
+    """
+    [(debited currency id, negative delta), (credited currency id, delta)]
+    of a buy/sell operation (sign=1) or of its undo (sign=-1).
+
+    buy:  Som -= total_som, currency += amount
+    sell: currency -= amount, Som += total_som
+    """
+    amount = Decimal(amount).quantize(BALANCE_QUANT)
+    total_som = Decimal(total_som).quantize(BALANCE_QUANT)
+    if op_type == 'buy':
+        debit, credit = (som_id, total_som), (currency_id, amount)
+    else:  # sell
+        debit, credit = (currency_id, amount), (som_id, total_som)
+    if sign < 0:
+        debit, credit = credit, debit
+    return [(debit[0], -debit[1]), (credit[0], credit[1])]
+
+
+def apply_operation(op_type, currency_id, som_id, amount, total_som, sign=1, check=True):
+    """
+    Move balances for an operation (or undo it with sign=-1) and return
+    the applied operation_deltas. The debited side is updated first, so a
+    failed funds check leaves the other balance untouched.
+    """
+    deltas = operation_deltas(op_type, currency_id, som_id, amount, total_som, sign)
+    (debit_id, debit), (credit_id, credit) = deltas
+    change_balance(debit_id, debit, check=check)
+    change_balance(credit_id, credit, check=False)
+    return deltas
+
+
+def apply_balance_deltas(deltas):
+    """
+    Add {currency_id: delta} to several balances in one UPDATE, without a
+    funds check: the caller has already validated against balances read
+    inside the same transaction.
+    """
+    deltas = {
+        currency_id: Decimal(delta).quantize(BALANCE_QUANT)
+        for currency_id, delta in deltas.items()
+        if delta
+    }
+    if not deltas:
+        return
+    output_field = DecimalField(max_digits=15, decimal_places=2)
+    Currency.objects.filter(pk__in=deltas).update(balance=Case(
+        *[When(pk=currency_id, then=F('balance') + Value(delta, output_field=output_field))
+          for currency_id, delta in deltas.items()],
+        default=F('balance'),
+        output_field=output_field,
+    ))
@@ -0,0 +1,44 @@
+"""
+Cross-worker version stamps.
+
+Process-local caches (active shift, currency registry, ...) remember the
+stamp they were loaded under and reload when it changes. Stamps live in
+the 'shared' cache alias, which every gunicorn worker reads, so a write
+in one worker invalidates the local copies in all of them.
+
+A bump stores a fresh random token rather than incrementing a counter:
+two concurrent bumps can never collapse into one, so a reader can never
+keep data loaded between them.
+"""
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+
+SHARED_CACHE_ALIAS = 'shared'
+
+
+def _key(name):
+    return f"version:{name}"
+
+
+def get_version(name):
+    cache = caches[SHARED_CACHE_ALIAS]
+    version = cache.get(_key(name))
+    if version is None:
+        cache.add(_key(name), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_key(name))
+    return version
+
+
+def bump_version(*names):
+    """
+    Invalidate everything cached under ``names``. Runs after the current
+    transaction commits, so readers never reload uncommitted state.
+    """
+    def bump():
+        cache = caches[SHARED_CACHE_ALIAS]
+        for name in names:
+            cache.set(_key(name), uuid.uuid4().hex, timeout=None)
+
+    transaction.on_commit(bump)
@@ -0,0 +1,81 @@
+"""
+Process-local currency registry.
+
+Currency names, soft-delete flags and the id of the base currency (Som)
+change rarely but are needed on almost every request. They are loaded
+once per process and reloaded when the shared 'currency_registry' version
+stamp changes; core/signals.py bumps it whenever a Currency is saved or
+deleted (balance-only updates excluded).
+
+Balances are never cached here: they change with every operation and are
+always read from the database.
+"""
+import threading
+from collections import namedtuple
+
+from .cache_versions import bump_version, get_version
+from .models import Currency
+
+BASE_CURRENCY_NAME = 'Som'
+CURRENCY_REGISTRY_VERSION = 'currency_registry'
+
+CurrencyInfo = namedtuple('CurrencyInfo', ['id', 'name', 'is_deleted', 'created_at'])
+
+
+class CurrencyRegistry:
+    def __init__(self, currencies):
+        self.by_id = {cur.id: cur for cur in currencies}
+        self.base_id = next(
+            (cur.id for cur in currencies if cur.name == BASE_CURRENCY_NAME), None
+        )
+        self._memo = {}
+
+    def memo(self, key, build):
+        """Value derived from this registry snapshot, built once per reload."""
+        if key not in self._memo:
+            self._memo[key] = build()
+        return self._memo[key]
+
+    @property
+    def base(self):
+        return self.by_id.get(self.base_id)
+
+    def active(self, include_base=True):
+        """Non-deleted currencies in id order."""
+        return [
+            cur for cur in self.by_id.values()
+            if not cur.is_deleted and (include_base or cur.id != self.base_id)
+        ]
+
+    def all(self, include_base=True):
+        return [cur for cur in self.by_id.values() if include_base or cur.id != self.base_id]
+
+
+_lock = threading.Lock()
+_cached = {'version': None, 'registry': None}
+
+
+def get_currency_registry():
+    version = get_version(CURRENCY_REGISTRY_VERSION)
+    with _lock:
+        if _cached['version'] == version:
+            return _cached['registry']
+
+    rows = Currency.objects.order_by('id').values_list('id', 'name', 'is_deleted', 'created_at')
+    registry = CurrencyRegistry([CurrencyInfo(*row) for row in rows])
+    with _lock:
+        _cached['version'] = version
+        _cached['registry'] = registry
+    return registry
+
+
+def invalidate_currency_registry():
+    bump_version(CURRENCY_REGISTRY_VERSION)
+
+
+def current_balances(currency_ids=None):
+    """{currency_id: balance}, always fresh from the database."""
+    qs = Currency.objects.all()
+    if currency_ids is not None:
+        qs = qs.filter(id__in=currency_ids)
+    return dict(qs.values_list('id', 'balance'))
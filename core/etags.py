@@ -0,0 +1,48 @@
+"""
+ETags for polled read endpoints.
+
+Each resource family has a version stamp in the shared cache (see
+core/cache_versions.py), bumped by the viewsets after every write that
+changes what the family's endpoints return. A response's ETag is a hash
+of the request path and the stamps it depends on, computed before the
+view runs: with a matching ``If-None-Match`` Django's ``condition``
+answers 304 without running the view body at all.
+"""
+import hashlib
+import time
+
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .cache_versions import get_version
+
+CURRENCIES_VERSION = 'etag_currencies'  # валюты и их балансы
+USERS_VERSION = 'etag_users'
+OPERATIONS_VERSION = 'etag_operations'  # операции и всё, что из них считается
+
+# Analytics periods slide with the clock ('week' = the last 7 days), so
+# their ETags also change every ANALYTICS_ETAG_WINDOW seconds.
+ANALYTICS_ETAG_WINDOW = 60
+
+
+def _etag_func(names, time_window=None):
+    def etag_func(request, *args, **kwargs):
+        parts = [request.get_full_path()]
+        parts += [str(get_version(name)) for name in names]
+        if time_window:
+            parts.append(str(int(time.time() // time_window)))
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+    return etag_func
+
+
+def etag_condition(*names, time_window=None):
+    """
+    Decorator for function views, sync or async: adds an ETag built from
+    the ``names`` stamps and answers matching ``If-None-Match`` with 304.
+    """
+    return condition(etag_func=_etag_func(names, time_window))
+
+
+def conditional_get(*names, time_window=None):
+    """etag_condition() for view handlers (``get``, ``list``, GET actions)."""
+    return method_decorator(etag_condition(*names, time_window=time_window))
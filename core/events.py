@@ -0,0 +1,158 @@
+"""
+Change events for the server-sent events stream (GET /api/events/).
+
+Write paths call publish_event() inside their transaction; the event is
+handed to the broker once the transaction commits. The broker fans it out
+to the process's EventHub, which gives every connected client its own
+bounded asyncio queue. A client too slow to drain its queue loses the
+queued events and gets a single 'resync' event instead, telling it to
+refetch its state; one stuck client never blocks the writers or the
+other clients.
+
+LocalBroker stands in for a cross-process pub/sub (Redis, LISTEN/NOTIFY):
+events published in this process are delivered directly, and writes made
+by other processes (e.g. the gunicorn workers) are noticed by watching
+the shared version stamps and announced as 'invalidate' events naming
+the resources to refetch.
+"""
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .cache_versions import get_version
+from .etags import CURRENCIES_VERSION, OPERATIONS_VERSION
+from .shifts import ACTIVE_SHIFT_VERSION
+
+RESYNC = 'resync'
+INVALIDATE = 'invalidate'
+
+# ресурс клиента -> версия, которая меняется вместе с ним
+STREAM_RESOURCES = {
+    'currencies': CURRENCIES_VERSION,
+    'operations': OPERATIONS_VERSION,
+    'shift': ACTIVE_SHIFT_VERSION,
+}
+STAMP_POLL_SECONDS = 1
+
+
+def _queue_size():
+    return getattr(settings, 'EVENT_STREAM_QUEUE_SIZE', 256)
+
+
+class Subscription:
+    """One connected client: a bounded queue owned by its event loop."""
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def offer(self, event):
+        # выполняется в цикле событий клиента
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait((event[0], RESYNC, {}))
+            return
+        self.queue.put_nowait(event)
+
+
+class EventHub:
+    """In-process broadcast of (id, type, data) events to subscriptions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._last_id = 0
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def subscribe(self):
+        """Register a client; call from the event loop that will read it."""
+        subscription = Subscription(asyncio.get_running_loop(), _queue_size())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event_type, data):
+        """Thread-safe: may be called from any thread."""
+        with self._lock:
+            self._last_id += 1
+            event = (self._last_id, event_type, data)
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:  # цикл клиента уже закрыт
+                self.unsubscribe(subscription)
+
+
+def _read_stamps():
+    return {name: get_version(name) for name in STREAM_RESOURCES.values()}
+
+
+class LocalBroker:
+    """
+    Single-process broker; see the module docstring. ``publish`` is
+    called after commit, from the thread that made the write.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._seen = {}
+        self._watcher = None
+
+    def publish(self, event_type, data):
+        if not len(self.hub):
+            return  # здесь никто не слушает (например, WSGI-воркер)
+        # запоминаем версии после своей записи, чтобы не объявлять её ещё раз
+        self._seen.update(_read_stamps())
+        self.hub.publish(event_type, data)
+
+    def ensure_watching(self):
+        """Start the stamp watcher in the running loop unless it is running."""
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.get_running_loop().create_task(self._watch())
+
+    async def _watch(self):
+        read_stamps = sync_to_async(_read_stamps, thread_sensitive=False)
+        self._seen.update(await read_stamps())
+        while len(self.hub):
+            await asyncio.sleep(STAMP_POLL_SECONDS)
+            stamps = await read_stamps()
+            changed = [
+                resource for resource, name in STREAM_RESOURCES.items()
+                if stamps[name] != self._seen.get(name)
+            ]
+            self._seen.update(stamps)
+            if changed:
+                self.hub.publish(INVALIDATE, {'resources': changed})
+
+
+hub = EventHub()
+broker = LocalBroker(hub)
+
+
+def publish_event(event_type, data):
+    """Publish a change event once the current transaction commits."""
+    transaction.on_commit(lambda: broker.publish(event_type, data))
+
+
+def ledger_balances(entries):
+    """{currency_id: balance} after the saved ledger ``entries``."""
+    return {entry.currency_id: entry.balance_after for entry in entries}
+
+
+def format_event(event):
+    event_id, event_type, data = event
+    payload = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
@@ -0,0 +1,210 @@
+"""
+Streaming export helpers.
+
+xlsx files are produced with a write-only openpyxl workbook saved to a
+temporary file and streamed back with FileResponse. CSV and NDJSON are
+generated chunk by chunk straight from a database iterator. Either way
+memory stays flat regardless of the number of exported rows.
+"""
+import csv
+import io
+import pickle
+import tempfile
+from datetime import datetime
+
+import openpyxl
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+from rest_framework.exceptions import ValidationError
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+SPOOL_BATCH = 1000
+STREAM_BATCH = 500  # rows per yielded chunk
+
+
+def _cell_width(value):
+    return len(str(value)) if value is not None else 0
+
+
+def _spool_rows(rows, widths):
+    """
+    Pickle rows into a temporary file in batches while tracking the
+    widest value per column. Returns the rewound spool file.
+    """
+    spool = tempfile.TemporaryFile()
+    batch = []
+    for row in rows:
+        for index, value in enumerate(row):
+            width = _cell_width(value)
+            if width > widths[index]:
+                widths[index] = width
+        batch.append(row)
+        if len(batch) == SPOOL_BATCH:
+            pickle.dump(batch, spool, protocol=pickle.HIGHEST_PROTOCOL)
+            batch = []
+    if batch:
+        pickle.dump(batch, spool, protocol=pickle.HIGHEST_PROTOCOL)
+    spool.seek(0)
+    return spool
+
+
+def _replay_rows(spool):
+    while True:
+        try:
+            batch = pickle.load(spool)
+        except EOFError:
+            return
+        yield from batch
+
+
+def xlsx_response(title, headers, rows, filename, footer=None):
+    """
+    Stream an xlsx file with a bold header, ``rows`` (any iterable of
+    value sequences) and optional bold ``footer`` rows.
+
+    A write-only sheet has to declare column widths before its first row,
+    so rows are spooled to a temporary file while their widths are
+    tracked and then replayed into the workbook.
+    """
+    footer = footer or []
+    widths = [len(str(header)) for header in headers]
+
+    with _spool_rows(rows, widths) as spool:
+        for row in footer:
+            for index, value in enumerate(row):
+                widths[index] = max(widths[index], _cell_width(value))
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title)
+        for index, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(index)].width = width + 2
+
+        header_font = Font(bold=True)
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = header_font
+            cell.alignment = Alignment(horizontal='center')
+            header_cells.append(cell)
+        ws.append(header_cells)
+
+        for row in _replay_rows(spool):
+            ws.append(row)
+
+        for row in footer:
+            footer_cells = []
+            for value in row:
+                cell = WriteOnlyCell(ws, value=value)
+                if value is not None:
+                    cell.font = header_font
+                footer_cells.append(cell)
+            ws.append(footer_cells)
+
+        output = tempfile.TemporaryFile()
+        wb.save(output)
+
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=filename,
+        content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+def parse_timestamp_param(value, name):
+    """
+    Parse an ISO 8601 datetime or date query parameter (400 if invalid).
+    A UTC offset is converted, so the result compares with stored datetimes.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is not None:
+            parsed = datetime(day.year, day.month, day.day)
+    if parsed is None:
+        raise ValidationError({name: f"Invalid timestamp '{value}'. Use ISO 8601, e.g. 2025-01-31T18:00:00."})
+    # '...Z' / '+06:00' приводим к тому виду, в котором хранятся даты
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    elif not settings.USE_TZ and timezone.is_aware(parsed):
+        parsed = timezone.make_naive(parsed)  # в локальное время сервера (TIME_ZONE)
+    return parsed
+
+
+def resolve_export_range(request, now, period_start):
+    """
+    (start, end, label) of an export request. Explicit ``since``/``until``
+    timestamps win; otherwise ``period_start(period)`` resolves the usual
+    period names ('3days', 'week', 'month', 'shift').
+    """
+    since = request.GET.get('since')
+    until = request.GET.get('until')
+    end = parse_timestamp_param(until, 'until') if until else now
+
+    if since:
+        start = parse_timestamp_param(since, 'since')
+        label = f"{start:%Y%m%d%H%M%S}-{end:%Y%m%d%H%M%S}"
+    else:
+        period = request.GET.get('period', '3days')
+        start = period_start(period)
+        label = period
+
+    if start > end:
+        raise ValidationError({"since": "'since' must not be later than 'until'."})
+    return start, end, label
+
+
+def _csv_chunks(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % STREAM_BATCH == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(fields, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    lines = []
+    for row in rows:
+        lines.append(encoder.encode(dict(zip(fields, row))))
+        if len(lines) == STREAM_BATCH:
+            lines.append('')
+            yield '\n'.join(lines)
+            lines = []
+    if lines:
+        lines.append('')
+        yield '\n'.join(lines)
+
+
+def stream_rows_response(export_format, fields, rows, filename):
+    """
+    Stream ``rows`` (tuples matching ``fields``) as CSV or NDJSON.
+    """
+    if export_format == 'csv':
+        content = _csv_chunks(fields, rows)
+        content_type = 'text/csv; charset=utf-8'
+        extension = 'csv'
+    elif export_format == 'ndjson':
+        content = _ndjson_chunks(fields, rows)
+        content_type = 'application/x-ndjson; charset=utf-8'
+        extension = 'ndjson'
+    else:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
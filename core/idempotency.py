@@ -0,0 +1,98 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A client that may retry a request (e.g. after a timeout) sends a unique
+``Idempotency-Key`` header. The first successful response is stored in
+IdempotencyKey together with a fingerprint of the request; a retry with
+the same key gets the stored response back (marked with an
+``Idempotent-Replayed: true`` header) and nothing is applied twice.
+
+The lookup, the view and the insert share one transaction. SQLite
+transactions are IMMEDIATE (see DATABASES in settings), so two concurrent
+requests with the same key are serialized and the second one sees the
+first one's record. Failed requests are not stored: they changed nothing
+and may be retried.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    raw = f"{request.method} {request.path}\n{body}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _ttl():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+
+def purge_expired_keys():
+    """Delete stored keys older than IDEMPOTENCY_KEY_TTL_HOURS. Returns the count."""
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - _ttl()).delete()
+    return deleted
+
+
+def idempotent(view_method):
+    """
+    Decorator for viewset methods (create, @action handlers). Requests
+    without the header are passed through unchanged.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"detail": f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+                status=400,
+            )
+
+        fingerprint = request_fingerprint(request)
+        with transaction.atomic():
+            record = (
+                IdempotencyKey.objects
+                .filter(user=request.user, key=key, created_at__gte=timezone.now() - _ttl())
+                .first()
+            )
+            if record is not None:
+                if record.fingerprint != fingerprint:
+                    return Response(
+                        {"detail": f"{IDEMPOTENCY_HEADER} was already used for a different request."},
+                        status=422,
+                    )
+                response = Response(record.response_body, status=record.status_code)
+                response[REPLAYED_HEADER] = 'true'
+                return response
+
+            response = view_method(self, request, *args, **kwargs)
+            if 200 <= response.status_code < 300:
+                # просроченная запись с тем же ключом мешает уникальности
+                IdempotencyKey.objects.filter(user=request.user, key=key).delete()
+                IdempotencyKey.objects.create(
+                    user=request.user,
+                    key=key,
+                    method=request.method,
+                    path=request.path[:255],
+                    fingerprint=fingerprint,
+                    status_code=response.status_code,
+                    response_body=response.data,
+                )
+        return response
+
+    return wrapper
@@ -0,0 +1,52 @@
+"""
+Append-only balance ledger.
+
+Every change of a Currency.balance writes a LedgerEntry with the signed
+delta and the balance right after it: operations, both halves of an
+edit (reversal of the old values, then the new ones), shift-close
+corrections and manual adjustments. The balance of a currency at any
+moment is then the balance_after of its last entry at or before that
+moment, one seek on the (currency, timestamp) index; see balance_at().
+"""
+from django.utils import timezone
+
+from .currencies import current_balances
+from .models import LedgerEntry
+
+
+def ledger_entries(changes, kind, operation=None, shift=None):
+    """Unsaved entries for [(currency_id, delta), ...] of one action."""
+    return [
+        LedgerEntry(currency_id=currency_id, delta=delta, kind=kind, operation=operation, shift=shift)
+        for currency_id, delta in changes
+        if delta
+    ]
+
+
+def record_ledger_entries(entries, timestamp=None):
+    """
+    Fill in balance_after and save ``entries`` (in the order their deltas
+    were applied). Must run inside the transaction that changed the
+    balances, after the balance updates: the running balances are derived
+    backwards from the balances as they are now.
+    """
+    if not entries:
+        return []
+    balances = current_balances({entry.currency_id for entry in entries})
+    timestamp = timestamp or timezone.now()
+    for entry in reversed(entries):
+        entry.balance_after = balances[entry.currency_id]
+        balances[entry.currency_id] -= entry.delta
+        entry.timestamp = timestamp
+    return LedgerEntry.objects.bulk_create(entries)
+
+
+def balance_at(currency_id, moment):
+    """Balance of the currency at ``moment``, None if it had no entries yet."""
+    return (
+        LedgerEntry.objects
+        .filter(currency_id=currency_id, timestamp__lte=moment)
+        .order_by('-timestamp', '-id')
+        .values_list('balance_after', flat=True)
+        .first()
+    )
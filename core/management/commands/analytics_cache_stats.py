@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.analytics_cache import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the analytics response cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters after printing them.")
+
+    def handle(self, *args, **options):
+        for endpoint, counts in cache_stats().items():
+            total = counts['hit'] + counts['miss']
+            ratio = counts['hit'] / total if total else 0
+            self.stdout.write(f"{endpoint}: {counts['hit']} hits, {counts['miss']} misses ({ratio:.0%} hit rate)")
+        if options['reset']:
+            reset_cache_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
@@ -0,0 +1,306 @@
+"""
+Fill an empty database with years of realistic data for load tests and
+benchmarks: cashiers, currencies, two shifts a day, operations at
+drifting exchange rates, the ledger, balance snapshots, shift summaries,
+history events and rollups — everything the app itself would have
+written, inserted with bulk_create.
+
+    python manage.py seed_data --years 3 --operations-per-day 200
+
+Never run it against a database you care about: it refuses to touch a
+database that already has currencies or operations.
+"""
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.balances import BALANCE_QUANT, operation_deltas
+from core.cache_versions import bump_version
+from core.currencies import BASE_CURRENCY_NAME, invalidate_currency_registry
+from core.etags import CURRENCIES_VERSION, OPERATIONS_VERSION, USERS_VERSION
+from core.models import (
+    BalanceSnapshot,
+    ClientOperation,
+    Currency,
+    CustomUser,
+    HistoryEvent,
+    LedgerEntry,
+    Shift,
+    ShiftSummary,
+)
+from core.rollups import rebuild_rollups
+from core.seeding import historical_timestamps
+from core.shifts import invalidate_active_shift
+
+# (название, курс в сомах на старте, доля операций)
+CURRENCIES = [
+    ('USD', '87.5', 30), ('EUR', '95.0', 15), ('RUB', '0.95', 20), ('KZT', '0.18', 10),
+    ('CNY', '12.1', 5), ('GBP', '110.0', 3), ('TRY', '2.6', 3), ('UZS', '0.0069', 4),
+    ('JPY', '0.58', 2), ('CHF', '98.0', 1), ('AED', '23.8', 2), ('KRW', '0.064', 2),
+    ('TJS', '8.1', 1), ('INR', '1.04', 1), ('CAD', '63.0', 1), ('AUD', '57.0', 1),
+]
+SHIFT_STARTS = (time(8, 0), time(14, 0))
+SHIFT_HOURS = 6
+SPREAD = Decimal('0.01')  # курс продажи выше курса покупки на 2 * SPREAD
+RATE_QUANT = Decimal('0.0001')
+OPENING_SOM = Decimal('50000000')
+OPENING_SOM_PER_CURRENCY = Decimal('5000000')  # начальный остаток валюты, в сомах
+
+
+class Command(BaseCommand):
+    help = "Fill an empty database with years of generated operations, shifts and history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=float, default=3)
+        parser.add_argument('--currencies', type=int, default=12, help="foreign currencies besides Som")
+        parser.add_argument('--cashiers', type=int, default=8)
+        parser.add_argument('--operations-per-day', type=int, default=200)
+        parser.add_argument('--events-per-day', type=int, default=2, help="user/currency edits in the history")
+        parser.add_argument('--password', default='seed', help="password of every generated user")
+        parser.add_argument('--seed', type=int, default=42, help="random seed; the same seed gives the same data")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if Currency.objects.exists() or ClientOperation.objects.exists():
+            raise CommandError("The database already has currencies or operations; seed_data fills an empty one.")
+        if options['currencies'] < 1 or options['cashiers'] < 1:
+            raise CommandError("Need at least one currency and one cashier.")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+        now = timezone.now().replace(microsecond=0)
+        start_day = (now - timedelta(days=int(options['years'] * 365))).date()
+
+        fields = [
+            ClientOperation._meta.get_field('timestamp'),
+            Currency._meta.get_field('created_at'),
+            HistoryEvent._meta.get_field('timestamp'),
+            Shift._meta.get_field('start_time'),
+            ShiftSummary._meta.get_field('created_at'),
+        ]
+        with historical_timestamps(*fields), transaction.atomic():
+            opened = datetime.combine(start_day, time(7, 0))
+            admin, cashiers = self.create_users(options, opened)
+            currencies = self.create_currencies(options['currencies'], opened)
+            self.open_ledger(currencies, opened)
+            self.create_setup_events(admin, cashiers, currencies, opened)
+            counts = self.create_days(options, admin, cashiers, currencies, start_day, now)
+            Currency.objects.bulk_update(
+                [Currency(id=cur.id, balance=self.balances[cur.id]) for cur in currencies], ['balance']
+            )
+            buckets = rebuild_rollups(batch_size=self.batch_size)
+
+        # реестр валют, активная смена и ETag-и закэшированы в общем кэше
+        invalidate_currency_registry()
+        invalidate_active_shift()
+        bump_version(CURRENCIES_VERSION, OPERATIONS_VERSION, USERS_VERSION)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(cashiers) + 1} users, {len(currencies)} currencies, {counts['shifts']} shifts, "
+            f"{counts['operations']} operations, {counts['entries']} ledger entries, "
+            f"{counts['events']} history events and {buckets} rollup buckets."
+        ))
+
+    # --- справочники ---------------------------------------------------
+
+    def create_users(self, options, joined):
+        names = ['manager'] + [f'cashier{i:02d}' for i in range(1, options['cashiers'] + 1)]
+        taken = set(CustomUser.objects.filter(username__in=names).values_list('username', flat=True))
+        if taken:
+            raise CommandError(f"Users already exist: {', '.join(sorted(taken))}")
+        password = make_password(options['password'])  # хэш считаем один раз: он медленный
+        users = CustomUser.objects.bulk_create([
+            CustomUser(
+                username=name, password=password, email=f'{name}@example.com',
+                role='admin' if name == 'manager' else 'cashier', date_joined=joined,
+            )
+            for name in names
+        ])
+        return users[0], users[1:]
+
+    def create_currencies(self, count, created_at):
+        specs = CURRENCIES[:count]
+        for i in range(len(specs), count):
+            specs.append((f'CUR{i + 1}', str(round(self.rng.uniform(0.5, 150), 4)), 1))
+
+        balances = [(BASE_CURRENCY_NAME, OPENING_SOM)] + [
+            (name, (OPENING_SOM_PER_CURRENCY / Decimal(rate)).quantize(BALANCE_QUANT)) for name, rate, _ in specs
+        ]
+        currencies = Currency.objects.bulk_create([
+            Currency(name=name, balance=balance, created_at=created_at) for name, balance in balances
+        ])
+        self.som = currencies[0]
+        self.rates = {cur.id: Decimal(rate) for cur, (_, rate, _) in zip(currencies[1:], specs)}
+        self.weights = [weight for _, _, weight in specs]
+        self.balances = {cur.id: cur.balance for cur in currencies}
+        return currencies
+
+    def open_ledger(self, currencies, opened):
+        entries = LedgerEntry.objects.bulk_create([
+            LedgerEntry(currency_id=cur.id, kind=LedgerEntry.OPENING, delta=cur.balance,
+                        balance_after=cur.balance, timestamp=opened)
+            for cur in currencies
+        ])
+        self.last_entry_id = entries[-1].id
+        self.snapshot(BalanceSnapshot.OPENING, opened, self.last_entry_id).save()
+
+    def snapshot(self, kind, taken_at, last_entry_id, shift=None):
+        """Unsaved snapshot of the running balances."""
+        return BalanceSnapshot(
+            kind=kind, taken_at=taken_at, last_entry_id=last_entry_id, shift=shift,
+            balances={str(currency_id): balance for currency_id, balance in self.balances.items()},
+        )
+
+    def create_setup_events(self, admin, cashiers, currencies, at):
+        HistoryEvent.objects.bulk_create(
+            [
+                HistoryEvent(event_type='create_user', user=admin, user_username=admin.username,
+                             target_user=cashier, target_user_username=cashier.username, timestamp=at)
+                for cashier in cashiers
+            ] + [
+                HistoryEvent(event_type='create_currency', user=admin, user_username=admin.username,
+                             currency=cur, currency_name=cur.name, timestamp=at)
+                for cur in currencies
+            ],
+            batch_size=self.batch_size,
+        )
+
+    # --- рабочие дни ---------------------------------------------------
+
+    def create_days(self, options, admin, cashiers, currencies, start_day, now):
+        counts = {'shifts': 0, 'operations': 0, 'entries': 0, 'events': len(cashiers) + len(currencies)}
+        foreign = currencies[1:]
+        day = start_day
+        while day <= now.date():
+            shifts = []
+            for shift_start in SHIFT_STARTS:
+                start = datetime.combine(day, shift_start)
+                if start > now:
+                    break
+                end = start + timedelta(hours=SHIFT_HOURS)
+                shifts.append(Shift(
+                    user=self.rng.choice(cashiers), start_time=start,
+                    end_time=end if end <= now else None,  # последняя смена остаётся открытой
+                    note=f"Clear by user: {admin.username}" if end <= now else None,
+                    changed_balances=[] if end <= now else None,
+                ))
+            if not shifts:
+                break
+            Shift.objects.bulk_create(shifts)
+            counts['shifts'] += len(shifts)
+
+            self.drift_rates()
+            snapshots, summaries = [], []
+            per_shift = max(1, options['operations_per_day'] // len(SHIFT_STARTS))
+            for shift in shifts:
+                ops, entries = self.create_operations(shift, foreign, per_shift, now)
+                counts['operations'] += len(ops)
+                counts['entries'] += len(entries)
+                if shift.end_time is not None:
+                    summaries.append(self.summary(shift, ops))
+                    last_entry_id = entries[-1].id if entries else self.last_entry_id
+                    snapshots.append(self.snapshot(BalanceSnapshot.SHIFT_CLOSE, shift.end_time, last_entry_id, shift))
+                if entries:
+                    self.last_entry_id = entries[-1].id
+            if shifts[-1].end_time is not None:
+                eod = datetime.combine(day, time(23, 59))
+                snapshots.append(self.snapshot(BalanceSnapshot.END_OF_DAY, eod, self.last_entry_id))
+            ShiftSummary.objects.bulk_create(summaries)
+            BalanceSnapshot.objects.bulk_create(snapshots)
+            counts['events'] += self.create_events(options['events_per_day'], admin, cashiers, foreign, day, now)
+
+            if self.verbosity > 1 and day.day == 1:
+                self.stdout.write(f"{day:%Y-%m}: {counts['operations']} operations so far")
+            day += timedelta(days=1)
+        return counts
+
+    def drift_rates(self):
+        for currency_id, rate in self.rates.items():
+            drift = Decimal(str(self.rng.gauss(0, 0.004)))
+            self.rates[currency_id] = max(RATE_QUANT, (rate * (1 + drift)).quantize(RATE_QUANT))
+
+    def create_operations(self, shift, foreign, count, now):
+        end = shift.end_time or now
+        seconds = int((end - shift.start_time).total_seconds())
+        count = max(0, int(count * self.rng.uniform(0.7, 1.3)))
+        moments = sorted(shift.start_time + timedelta(seconds=self.rng.randrange(seconds)) for _ in range(count))
+
+        ops, changes = [], []
+        for moment, cur in zip(moments, self.rng.choices(foreign, weights=self.weights, k=count)):
+            mid = self.rates[cur.id]
+            # клиенты приносят суммы от сотен до сотен тысяч сомов
+            som_value = Decimal(str(round(self.rng.lognormvariate(9, 1.1), -1) or 10))
+            amount = max(Decimal('1'), (som_value / mid).quantize(Decimal('1')))
+            op_type = self.rng.choice(('buy', 'sell'))
+            for _ in range(2):
+                rate = (mid * (1 - SPREAD if op_type == 'buy' else 1 + SPREAD)).quantize(RATE_QUANT)
+                total = (amount * rate).quantize(BALANCE_QUANT)
+                deltas = operation_deltas(op_type, cur.id, self.som.id, amount, total)
+                debit_id, debit = deltas[0]
+                if self.balances[debit_id] + debit >= 0:
+                    break
+                op_type = 'sell' if op_type == 'buy' else 'buy'  # не хватает средств — обратная операция
+            else:
+                continue
+            for currency_id, delta in deltas:
+                self.balances[currency_id] += delta
+            ops.append(ClientOperation(
+                operation_type=op_type, currency=cur, cashier_name=shift.user.username,
+                amount=amount, exchange_rate=rate, total_in_som=total, timestamp=moment,
+            ))
+            changes.append([(currency_id, delta, self.balances[currency_id]) for currency_id, delta in deltas])
+
+        ops = ClientOperation.objects.bulk_create(ops, batch_size=self.batch_size)
+        entries = LedgerEntry.objects.bulk_create([
+            LedgerEntry(currency_id=currency_id, kind=LedgerEntry.OPERATION, delta=delta,
+                        balance_after=balance_after, timestamp=op.timestamp, operation=op)
+            for op, deltas in zip(ops, changes)
+            for currency_id, delta, balance_after in deltas
+        ], batch_size=self.batch_size)
+        return ops, entries
+
+    def summary(self, shift, ops):
+        """ShiftSummary as ShiftViewSet.clear freezes it (see analytics.shift_totals)."""
+        buys = [op for op in ops if op.operation_type == 'buy']
+        sells = [op for op in ops if op.operation_type == 'sell']
+        total_bought = sum((op.amount for op in buys), Decimal('0'))
+        total_sold = sum((op.amount for op in sells), Decimal('0'))
+        avg_buy_rate = sum((op.exchange_rate for op in buys), Decimal('0')) / len(buys) if buys else Decimal('0')
+        avg_sell_rate = sum((op.exchange_rate for op in sells), Decimal('0')) / len(sells) if sells else Decimal('0')
+        return ShiftSummary(
+            shift=shift,
+            operations_count=len(ops),
+            total_bought=total_bought,
+            total_sold=total_sold,
+            avg_buy_rate=avg_buy_rate.quantize(Decimal('0.000001')),
+            avg_sell_rate=avg_sell_rate.quantize(Decimal('0.000001')),
+            profit=round(min(total_bought, total_sold) * (avg_sell_rate - avg_buy_rate), 2),
+            created_at=shift.end_time,
+        )
+
+    def create_events(self, per_day, admin, cashiers, foreign, day, now):
+        events = []
+        for _ in range(self.rng.randint(0, 2 * per_day)):
+            at = datetime.combine(day, time(self.rng.randrange(8, 20), self.rng.randrange(60)))
+            if at > now:
+                continue
+            if self.rng.random() < 0.5:
+                cashier = self.rng.choice(cashiers)
+                events.append(HistoryEvent(
+                    event_type='update_user', user=admin, user_username=admin.username,
+                    target_user=cashier, target_user_username=cashier.username, timestamp=at,
+                ))
+            else:
+                cur = self.rng.choice(foreign)
+                events.append(HistoryEvent(
+                    event_type='update_currency', user=admin, user_username=admin.username,
+                    currency=cur, currency_name=cur.name, timestamp=at,
+                ))
+        HistoryEvent.objects.bulk_create(events)
+        return len(events)
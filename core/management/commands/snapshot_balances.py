@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.models import BalanceSnapshot
+from core.snapshots import take_snapshot
+
+
+class Command(BaseCommand):
+    help = "Store a snapshot of all currency balances (run from cron at the end of the day)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            default=BalanceSnapshot.END_OF_DAY,
+            choices=[choice for choice, _ in BalanceSnapshot.KIND_CHOICES],
+        )
+
+    def handle(self, *args, **options):
+        snapshot = take_snapshot(options['kind'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {snapshot.kind} snapshot #{snapshot.id} of {len(snapshot.balances)} balances."
+        ))
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+
+
+def build_rollups(apps, schema_editor):
+    ClientOperation = apps.get_model('core', 'ClientOperation')
+    OperationRollup = apps.get_model('core', 'OperationRollup')
+    rows = (
+        ClientOperation.objects
+        .annotate(bucket=TruncHour('timestamp'))
+        .values('currency_id', 'operation_type', 'bucket')
+        .annotate(
+            amount_sum=Sum('amount'),
+            rate_sum=Sum('exchange_rate'),
+            rate_count=Count('id'),
+            som_total=Sum('total_in_som'),
+        )
+        .order_by()
+    )
+    OperationRollup.objects.bulk_create([OperationRollup(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_remove_historyevent_description_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation_type', models.CharField(choices=[('buy', 'Buy'), ('sell', 'Sell')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('amount_sum', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('rate_sum', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('rate_count', models.PositiveIntegerField(default=0)),
+                ('som_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='core.currency')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket'], name='rollup_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('currency', 'operation_type', 'bucket'), name='unique_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
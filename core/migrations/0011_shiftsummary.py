@@ -0,0 +1,66 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Avg, Count, Q, Sum
+
+
+def freeze_closed_shifts(apps, schema_editor):
+    Shift = apps.get_model('core', 'Shift')
+    ShiftSummary = apps.get_model('core', 'ShiftSummary')
+    ClientOperation = apps.get_model('core', 'ClientOperation')
+
+    buy = Q(operation_type='buy')
+    sell = Q(operation_type='sell')
+    summaries = []
+    for shift in Shift.objects.filter(end_time__isnull=False).iterator():
+        agg = ClientOperation.objects.filter(
+            timestamp__gte=shift.start_time,
+            timestamp__lte=shift.end_time,
+        ).aggregate(
+            operations_count=Count('id'),
+            total_bought=Sum('amount', filter=buy),
+            avg_buy_rate=Avg('exchange_rate', filter=buy),
+            total_sold=Sum('amount', filter=sell),
+            avg_sell_rate=Avg('exchange_rate', filter=sell),
+        )
+        total_bought = agg['total_bought'] or 0
+        total_sold = agg['total_sold'] or 0
+        avg_buy_rate = agg['avg_buy_rate'] or 0
+        avg_sell_rate = agg['avg_sell_rate'] or 0
+        profit = min(total_bought, total_sold) * (avg_sell_rate - avg_buy_rate)
+        summaries.append(ShiftSummary(
+            shift=shift,
+            operations_count=agg['operations_count'],
+            total_bought=total_bought,
+            total_sold=total_sold,
+            avg_buy_rate=avg_buy_rate,
+            avg_sell_rate=avg_sell_rate,
+            profit=round(profit, 2),
+        ))
+    ShiftSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_operationrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShiftSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operations_count', models.PositiveIntegerField(default=0)),
+                ('total_bought', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('total_sold', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('avg_buy_rate', models.DecimalField(decimal_places=6, default=0, max_digits=16)),
+                ('avg_sell_rate', models.DecimalField(decimal_places=6, default=0, max_digits=16)),
+                ('profit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('shift', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='core.shift')),
+            ],
+        ),
+        migrations.RunPython(freeze_closed_shifts, migrations.RunPython.noop),
+    ]
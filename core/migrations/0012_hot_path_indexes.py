@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_shiftsummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clientoperation',
+            index=models.Index(fields=['timestamp'], name='op_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientoperation',
+            index=models.Index(fields=['currency', 'operation_type', 'timestamp'], name='op_cur_type_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historyevent',
+            index=models.Index(fields=['-timestamp'], name='event_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historyevent',
+            index=models.Index(fields=['event_type', '-timestamp'], name='event_type_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['end_time', '-start_time'], name='shift_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['-start_time'], name='shift_start_idx'),
+        ),
+    ]
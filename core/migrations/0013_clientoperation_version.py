@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientoperation',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
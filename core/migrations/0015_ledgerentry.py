@@ -0,0 +1,44 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # История балансов до появления журнала не восстановима (clear смены
+    # перезаписывал балансы), поэтому журнал начинается с текущих значений.
+    Currency = apps.get_model('core', 'Currency')
+    LedgerEntry = apps.get_model('core', 'LedgerEntry')
+    now = django.utils.timezone.now()
+    LedgerEntry.objects.bulk_create([
+        LedgerEntry(currency_id=currency_id, kind='opening', delta=balance, balance_after=balance, timestamp=now)
+        for currency_id, balance in Currency.objects.values_list('id', 'balance')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('operation', 'Operation'), ('edit_reversal', 'Edit (old values reversed)'), ('edit', 'Edit (new values applied)'), ('shift_close', 'Shift close correction'), ('adjustment', 'Manual adjustment')], max_length=20)),
+                ('delta', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.currency')),
+                ('operation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='core.clientoperation')),
+                ('shift', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='core.shift')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['currency', 'timestamp', 'id', 'balance_after'], name='ledger_cur_ts_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:41
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def opening_snapshot(apps, schema_editor):
+    # Отправная точка для запросов баланса на момент времени
+    Currency = apps.get_model('core', 'Currency')
+    LedgerEntry = apps.get_model('core', 'LedgerEntry')
+    BalanceSnapshot = apps.get_model('core', 'BalanceSnapshot')
+    BalanceSnapshot.objects.create(
+        kind='opening',
+        last_entry_id=LedgerEntry.objects.aggregate(last=Max('id'))['last'] or 0,
+        balances={str(currency_id): str(balance) for currency_id, balance in Currency.objects.values_list('id', 'balance')},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_ledgerentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Ledger opening'), ('shift_close', 'Shift close'), ('end_of_day', 'End of day')], max_length=20)),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_entry_id', models.BigIntegerField(default=0)),
+                ('balances', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('shift', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='balance_snapshots', to='core.shift')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['taken_at'], name='snapshot_taken_idx')],
+            },
+        ),
+        migrations.RunPython(opening_snapshot, migrations.RunPython.noop),
+    ]
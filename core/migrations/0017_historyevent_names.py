@@ -0,0 +1,50 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:44
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_names(apps, schema_editor):
+    HistoryEvent = apps.get_model('core', 'HistoryEvent')
+    CustomUser = apps.get_model('core', 'CustomUser')
+    Currency = apps.get_model('core', 'Currency')
+
+    def name_of(model, fk, field):
+        return Coalesce(
+            Subquery(model.objects.filter(pk=OuterRef(fk)).values(field)[:1]),
+            Value(''),
+        )
+
+    # Один UPDATE на всю таблицу вместо сохранения событий по одному
+    HistoryEvent.objects.update(
+        user_username=name_of(CustomUser, 'user_id', 'username'),
+        target_user_username=name_of(CustomUser, 'target_user_id', 'username'),
+        currency_name=name_of(Currency, 'currency_id', 'name'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_balancesnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historyevent',
+            name='currency_name',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='historyevent',
+            name='target_user_username',
+            field=models.CharField(blank=True, default='', max_length=150),
+        ),
+        migrations.AddField(
+            model_name='historyevent',
+            name='user_username',
+            field=models.CharField(blank=True, default='', max_length=150),
+        ),
+        migrations.RunPython(backfill_names, migrations.RunPython.noop),
+    ]
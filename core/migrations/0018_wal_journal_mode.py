@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def set_journal_mode(mode):
+    def run(apps, schema_editor):
+        connection = schema_editor.connection
+        if connection.vendor != 'sqlite':
+            return
+        # Режим WAL хранится в самом файле базы — достаточно переключить один раз
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode={mode}')
+    return run
+
+
+class Migration(migrations.Migration):
+    # journal_mode нельзя менять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('core', '0017_historyevent_names'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_journal_mode('WAL'), set_journal_mode('DELETE')),
+    ]
@@ -1,5 +1,7 @@
 
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
 
@@ -45,8 +47,28 @@ class HistoryEvent(models.Model):
     currency = models.ForeignKey(Currency, on_delete=models.SET_NULL, null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    # Имена на момент события: история и экспорт читаются без JOIN
+    user_username = models.CharField(max_length=150, blank=True, default='')
+    target_user_username = models.CharField(max_length=150, blank=True, default='')
+    currency_name = models.CharField(max_length=50, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-timestamp'], name='event_ts_idx'),
+            models.Index(fields=['event_type', '-timestamp'], name='event_type_ts_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.user_id and not self.user_username:
+            self.user_username = self.user.username
+        if self.target_user_id and not self.target_user_username:
+            self.target_user_username = self.target_user.username
+        if self.currency_id and not self.currency_name:
+            self.currency_name = self.currency.name
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"{self.get_event_type_display()} by {self.user} on {self.timestamp}"
+        return f"{self.get_event_type_display()} by {self.user_username or 'N/A'} on {self.timestamp}"
 
 
 class ClientOperation(models.Model):
@@ -64,6 +86,14 @@ class ClientOperation(models.Model):
     total_in_som = models.DecimalField(max_digits=15, decimal_places=2, default=0)  # Новое поле
     timestamp = models.DateTimeField(auto_now_add=True)
     edited = models.CharField(max_length=150, blank=True, default='')
+    version = models.PositiveIntegerField(default=1)  # растёт при каждом edit_operation
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp'], name='op_ts_idx'),
+            models.Index(fields=['currency', 'operation_type', 'timestamp'], name='op_cur_type_ts_idx'),
+        ]
+
     def __str__(self):
         return f"{self.operation_type} {self.currency.name} {self.amount}"
 
@@ -75,10 +105,35 @@ class Shift(models.Model):
     note = models.TextField(blank=True, null=True)
     changed_balances = models.JSONField(blank=True, null=True)  # Новое поле
 
+    class Meta:
+        indexes = [
+            # активная смена: end_time IS NULL ORDER BY start_time DESC
+            models.Index(fields=['end_time', '-start_time'], name='shift_open_idx'),
+            models.Index(fields=['-start_time'], name='shift_start_idx'),
+        ]
+
     def __str__(self):
         return f"Shift (id={self.id}) - {self.user} from {self.start_time} to {self.end_time}"
 
 
+class ShiftSummary(models.Model):
+    """
+    Totals of a closed shift, frozen by ShiftViewSet.clear so the shift
+    history does not have to re-aggregate operations for every row.
+    """
+    shift = models.OneToOneField('Shift', on_delete=models.CASCADE, related_name='summary')
+    operations_count = models.PositiveIntegerField(default=0)
+    total_bought = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    total_sold = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    avg_buy_rate = models.DecimalField(max_digits=16, decimal_places=6, default=0)
+    avg_sell_rate = models.DecimalField(max_digits=16, decimal_places=6, default=0)
+    profit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Summary of shift {self.shift_id}: {self.operations_count} ops, profit {self.profit}"
+
+
 from rest_framework import viewsets
 from .serializers import CurrencySerializer
 
@@ -93,3 +148,140 @@ class CurrencyViewSet(viewsets.ModelViewSet):
 
 
 
+
+
+class OperationRollup(models.Model):
+    """
+    Hourly totals of ClientOperation per (currency, operation_type).
+    Maintained by core.rollups on every create/edit; analytics read these
+    buckets instead of scanning raw operations.
+    """
+    currency = models.ForeignKey('Currency', on_delete=models.CASCADE, related_name='rollups')
+    operation_type = models.CharField(max_length=10, choices=ClientOperation.OPERATION_TYPE_CHOICES)
+    bucket = models.DateTimeField()  # начало часа
+    amount_sum = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    rate_sum = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    rate_count = models.PositiveIntegerField(default=0)  # = количество операций
+    som_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['currency', 'operation_type', 'bucket'],
+                name='unique_rollup_bucket',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['bucket'], name='rollup_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.operation_type} {self.currency_id} @ {self.bucket}: {self.rate_count} ops"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a request sent with an ``Idempotency-Key`` header, so a
+    retried request is answered from here instead of being applied again.
+    See core/idempotency.py.
+    """
+    user = models.ForeignKey('CustomUser', on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # sha256 метода, пути и тела запроса
+    status_code = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.path} [{self.key}] -> {self.status_code}"
+
+
+class LedgerEntry(models.Model):
+    """
+    One signed change of a currency balance with the balance right after
+    it. Append-only: entries are never updated or deleted by the app.
+    Written by core.ledger inside the transaction that changed the balance.
+    """
+    OPENING = 'opening'
+    OPERATION = 'operation'
+    EDIT_REVERSAL = 'edit_reversal'
+    EDIT = 'edit'
+    SHIFT_CLOSE = 'shift_close'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (OPENING, 'Opening balance'),
+        (OPERATION, 'Operation'),
+        (EDIT_REVERSAL, 'Edit (old values reversed)'),
+        (EDIT, 'Edit (new values applied)'),
+        (SHIFT_CLOSE, 'Shift close correction'),
+        (ADJUSTMENT, 'Manual adjustment'),
+    ]
+
+    currency = models.ForeignKey('Currency', on_delete=models.CASCADE, related_name='ledger_entries')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    delta = models.DecimalField(max_digits=15, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=15, decimal_places=2)
+    timestamp = models.DateTimeField(default=timezone.now)
+    operation = models.ForeignKey(
+        'ClientOperation', on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries'
+    )
+    shift = models.ForeignKey(
+        'Shift', on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries'
+    )
+
+    class Meta:
+        indexes = [
+            # покрывающий индекс: баланс на момент времени читается прямо из индекса
+            models.Index(fields=['currency', 'timestamp', 'id', 'balance_after'], name='ledger_cur_ts_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Ledger entries are append-only.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.kind} {self.currency_id} {self.delta:+} -> {self.balance_after} @ {self.timestamp}"
+
+
+class BalanceSnapshot(models.Model):
+    """
+    Balances of all currencies at one moment, taken at every shift close
+    and at the end of the day (``manage.py snapshot_balances``).
+    ``last_entry_id`` is the newest LedgerEntry already reflected in
+    ``balances``; point-in-time queries replay only the entries after it.
+    """
+    OPENING = 'opening'
+    SHIFT_CLOSE = 'shift_close'
+    END_OF_DAY = 'end_of_day'
+    KIND_CHOICES = [
+        (OPENING, 'Ledger opening'),
+        (SHIFT_CLOSE, 'Shift close'),
+        (END_OF_DAY, 'End of day'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    taken_at = models.DateTimeField(default=timezone.now)
+    last_entry_id = models.BigIntegerField(default=0)
+    balances = models.JSONField(encoder=DjangoJSONEncoder)  # {"<currency_id>": "<balance>"}
+    shift = models.ForeignKey(
+        'Shift', on_delete=models.SET_NULL, null=True, blank=True, related_name='balance_snapshots'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['taken_at'], name='snapshot_taken_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} snapshot @ {self.taken_at}"
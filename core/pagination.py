@@ -0,0 +1,120 @@
+"""
+Opt-in keyset (cursor) pagination.
+
+Page-number pagination counts the whole table and skips rows with OFFSET
+on every page, so deep pages get slower as tables grow. Views using
+CursorOptInMixin keep page numbers by default; with ``?pagination=cursor``
+(or any ``?cursor=``) they switch to KeysetCursorPagination, where every
+page is a seek on (field, id) and costs the same as the first one.
+"""
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    CursorPagination on a compound (field, id) key. DRF's CursorPagination
+    positions on the first ordering field only and falls back to OFFSET
+    among equal values (e.g. operations of one bulk batch share a
+    timestamp); here the cursor carries both values and no offset is used.
+    """
+    ordering = ('-timestamp', '-id')
+
+    def _fields(self):
+        field, pk_field = (name.lstrip('-') for name in self.ordering)
+        return field, pk_field
+
+    def _position(self, obj):
+        field, pk_field = self._fields()
+        if isinstance(obj, dict):  # страница из values()
+            value, pk = obj[field], obj[pk_field]
+        else:
+            value, pk = getattr(obj, field), getattr(obj, pk_field)
+        value = value.isoformat() if hasattr(value, 'isoformat') else value
+        return f"{value}|{pk}"
+
+    def _parse_position(self, position):
+        try:
+            value, pk = position.rsplit('|', 1)
+            pk = int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        parsed = parse_datetime(value)
+        return (parsed if parsed is not None else value), pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor.reverse if self.cursor else False
+
+        field, pk_field = self._fields()
+        descending = self.ordering[0].startswith('-')
+        if reverse:
+            descending = not descending
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{field}', f'{prefix}{pk_field}')
+
+        if self.cursor and self.cursor.position is not None:
+            value, pk = self._parse_position(self.cursor.position)
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'{pk_field}__{lookup}': pk})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True  # мы пришли сюда со следующей страницы
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None and self.cursor.position is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self._position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self._position(self.page[0])))
+
+
+def wants_cursor(request):
+    params = getattr(request, 'query_params', request.GET)  # DRF или обычный HttpRequest
+    return params.get('pagination') == 'cursor' or 'cursor' in params
+
+
+class CursorOptInMixin:
+    """
+    For generic views: switch to KeysetCursorPagination on request,
+    ordered by ``cursor_ordering`` and with the page size settings of the
+    view's regular paginator.
+    """
+    cursor_ordering = ('-timestamp', '-id')
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            paginator = super().paginator
+            if paginator is not None and wants_cursor(self.request):
+                cursor_paginator = KeysetCursorPagination()
+                cursor_paginator.ordering = self.cursor_ordering
+                cursor_paginator.page_size = getattr(paginator, 'page_size', None)
+                cursor_paginator.page_size_query_param = getattr(paginator, 'page_size_query_param', None)
+                cursor_paginator.max_page_size = getattr(paginator, 'max_page_size', None)
+                self._paginator = cursor_paginator
+        return self._paginator
@@ -1,4 +1,6 @@
 from rest_framework import permissions
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
 
 class IsAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -18,3 +20,27 @@ class IsAdminOrReadOnly(permissions.BasePermission):
         # POST, PUT, DELETE - только если роль admin
         return (request.user.is_authenticated and request.user.role == 'admin')
 
+
+def jwt_user(request, allow_query_token=False):
+    """
+    The user of the request's JWT access token, or None. For plain Django
+    views (async views, the event stream) that DRF does not authenticate.
+    With ``allow_query_token`` the token may also come as ``?token=``
+    (EventSource cannot send headers). Hits the database: call through
+    sync_to_async from async code.
+    """
+    auth = JWTAuthentication()
+    raw_token = request.GET.get('token') if allow_query_token else None
+    if not raw_token:
+        header = auth.get_header(request)
+        raw_token = auth.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    try:
+        return auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def is_cashier_or_admin(user):
+    return user is not None and user.is_authenticated and user.role in ('admin', 'cashier')
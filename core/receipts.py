@@ -0,0 +1,301 @@
+"""
+Receipt PDF rendering with a cache keyed by operation id and version.
+
+ClientOperation.version is bumped by every edit, so a cached PDF can never
+be served for a modified operation. The 'receipts' cache alias is a
+bounded LRU (see CACHES in settings).
+
+With settings.RECEIPT_RENDER_WORKERS > 0 the CPU-bound xhtml2pdf step runs
+in a local process pool instead of the request worker. A "receipt job" is
+identified by (operation id, version); its result lands in the same cache,
+so any worker can answer for a job, re-submitting it if the job was
+started by another process.
+
+Receipt bundles (all receipts of a shift or time range) render on the
+same pool, keeping a bounded window of jobs in flight, or inline one by
+one when RECEIPT_RENDER_WORKERS is 0, and are streamed out as a ZIP while
+they are produced.
+"""
+import logging
+import multiprocessing
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from xhtml2pdf import pisa
+
+RECEIPT_CACHE_ALIAS = 'receipts'
+
+JOB_DONE = 'done'
+JOB_PENDING = 'pending'
+JOB_FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_jobs = {}  # job id -> Future, only for jobs started by this process
+_lock = threading.Lock()
+
+
+def receipt_cache_key(operation):
+    return f"receipt:{operation.id}:v{operation.version}"
+
+
+def receipt_job_id(operation):
+    return f"{operation.id}-v{operation.version}"
+
+
+def render_receipt_html(operation):
+    context = {
+        'operation': operation,
+        'edited_by': operation.edited if operation.edited else None,
+    }
+    return render_to_string('receipt_template.html', context)
+
+
+def html_to_pdf(html_content):
+    """Render HTML to PDF bytes, None if xhtml2pdf reports an error."""
+    pdf_file = BytesIO()
+    pisa_status = pisa.CreatePDF(
+        src=html_content,
+        dest=pdf_file,
+        encoding='utf-8'
+    )
+    if pisa_status.err:
+        return None
+    return pdf_file.getvalue()
+
+
+def get_receipt_pdf(operation):
+    """
+    Cached PDF bytes of the operation's receipt, rendering on a miss.
+    Returns None if rendering failed (failures are not cached).
+    """
+    cache = caches[RECEIPT_CACHE_ALIAS]
+    key = receipt_cache_key(operation)
+    pdf_bytes = cache.get(key)
+    if pdf_bytes is None:
+        pdf_bytes = html_to_pdf(render_receipt_html(operation))
+        if pdf_bytes is not None:
+            cache.set(key, pdf_bytes)
+    return pdf_bytes
+
+
+def render_pool_enabled():
+    return getattr(settings, 'RECEIPT_RENDER_WORKERS', 0) > 0
+
+
+def _pool_size():
+    return getattr(settings, 'RECEIPT_RENDER_WORKERS', 0)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn: дочерние процессы не наследуют соединения с БД и потоки
+        _executor = ProcessPoolExecutor(
+            max_workers=_pool_size(),
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+def _store_result(key, job_id, future):
+    try:
+        pdf_bytes = future.result()
+        if pdf_bytes is not None:
+            caches[RECEIPT_CACHE_ALIAS].set(key, pdf_bytes)
+    except Exception:
+        logger.exception("Error rendering receipt %s", job_id)
+    finally:
+        # завершённая задача (в том числе упавшая) больше не нужна: результат
+        # в кэше, а после ошибки следующий запрос отправит её заново
+        with _lock:
+            if _jobs.get(job_id) is future:
+                del _jobs[job_id]
+
+
+def submit_receipt_job(operation):
+    """
+    Start rendering the receipt in the process pool unless it is cached or
+    already being rendered by this process. Returns the job id.
+    """
+    key = receipt_cache_key(operation)
+    job_id = receipt_job_id(operation)
+    if caches[RECEIPT_CACHE_ALIAS].get(key) is not None:
+        return job_id
+
+    with _lock:
+        future = _jobs.get(job_id)
+        if future is not None and not (future.done() and _job_failed(future)):
+            return job_id
+        html_content = render_receipt_html(operation)
+        try:
+            future = _get_executor().submit(html_to_pdf, html_content)
+        except BrokenProcessPool:
+            # пул умер (например, убит дочерний процесс) — пересоздаём
+            _reset_executor()
+            future = _get_executor().submit(html_to_pdf, html_content)
+        _jobs[job_id] = future
+
+    future.add_done_callback(lambda f: _store_result(key, job_id, f))
+    return job_id
+
+
+def _job_failed(future):
+    return future.exception() is not None or future.result() is None
+
+
+def receipt_job_result(operation, wait=0):
+    """
+    (status, pdf_bytes) of the operation's current receipt job, waiting up
+    to ``wait`` seconds for it to finish. Submits the job if this process
+    does not know it yet.
+    """
+    cache = caches[RECEIPT_CACHE_ALIAS]
+    key = receipt_cache_key(operation)
+    pdf_bytes = cache.get(key)
+    if pdf_bytes is not None:
+        return JOB_DONE, pdf_bytes
+
+    job_id = submit_receipt_job(operation)
+    with _lock:
+        future = _jobs.get(job_id)
+    if future is None:
+        # завершилась между проверками
+        pdf_bytes = cache.get(key)
+        return (JOB_DONE, pdf_bytes) if pdf_bytes is not None else (JOB_PENDING, None)
+
+    try:
+        pdf_bytes = future.result(timeout=wait)
+    except FutureTimeoutError:
+        return JOB_PENDING, None
+    except Exception:
+        return JOB_FAILED, None
+    if pdf_bytes is None:
+        return JOB_FAILED, None
+    return JOB_DONE, pdf_bytes
+
+
+def _submit_render(html_content):
+    with _lock:
+        try:
+            return _get_executor().submit(html_to_pdf, html_content)
+        except BrokenProcessPool:
+            _reset_executor()
+            return _get_executor().submit(html_to_pdf, html_content)
+
+
+def iter_rendered_receipts(operations):
+    """
+    Yield (operation, pdf_bytes or None) in the order of ``operations``.
+    On the process pool receipts render in parallel with at most two jobs
+    per worker in flight; with RECEIPT_RENDER_WORKERS = 0 they render
+    inline, one at a time. Cached receipts are reused; bundle renders are
+    not written to the cache so a large bundle does not evict hot receipts.
+    """
+    cache = caches[RECEIPT_CACHE_ALIAS]
+
+    def resolve(operation, render):
+        try:
+            return operation, render()
+        except Exception:
+            logger.exception("Error rendering receipt %s", operation.id)
+            return operation, None
+
+    if not render_pool_enabled():
+        for operation in operations:
+            pdf_bytes = cache.get(receipt_cache_key(operation))
+            if pdf_bytes is not None:
+                yield operation, pdf_bytes
+            else:
+                yield resolve(operation, lambda: html_to_pdf(render_receipt_html(operation)))
+        return
+
+    window = _pool_size() * 2
+    pending = deque()
+    for operation in operations:
+        pdf_bytes = cache.get(receipt_cache_key(operation))
+        if pdf_bytes is None:
+            pending.append((operation, _submit_render(render_receipt_html(operation)).result))
+        else:
+            pending.append((operation, lambda pdf_bytes=pdf_bytes: pdf_bytes))
+        if len(pending) >= window:
+            yield resolve(*pending.popleft())
+
+    while pending:
+        yield resolve(*pending.popleft())
+
+
+class _ZipChunks:
+    """Write-only sink for zipfile; collects bytes until they are yielded."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_receipts_zip(rendered):
+    """
+    Generator of ZIP archive chunks, one receipt_<id>.pdf per operation.
+    Operations whose receipt failed to render are listed in errors.txt.
+    """
+    sink = _ZipChunks()
+    failed = []
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for operation, pdf_bytes in rendered:
+            if pdf_bytes is None:
+                failed.append(operation.id)
+                continue
+            archive.writestr(f"receipt_{operation.id}.pdf", pdf_bytes)
+            yield sink.take()
+        if failed:
+            errors = "Receipts that could not be rendered: " + ", ".join(map(str, failed)) + "\n"
+            archive.writestr("errors.txt", errors)
+    yield sink.take()
+
+
+def merged_receipts_pdf(rendered):
+    """
+    Merge rendered receipts into one multi-page PDF written to a temporary
+    file (returned rewound). PdfWriter keeps every page in memory until
+    write(), so unlike the ZIP bundle this holds the whole bundle at once;
+    the receipts_bundle view caps it at RECEIPT_PDF_BUNDLE_MAX_OPERATIONS.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    for _, pdf_bytes in rendered:
+        if pdf_bytes is not None:
+            writer.append(PdfReader(BytesIO(pdf_bytes)))
+
+    output = tempfile.TemporaryFile()
+    writer.write(output)
+    output.seek(0)
+    return output
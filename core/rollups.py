@@ -0,0 +1,101 @@
+"""
+Maintenance of the hourly OperationRollup table.
+
+Every change to a ClientOperation is mirrored here as a signed delta on the
+(currency, operation_type, hour) bucket it falls into. ``rebuild_rollups``
+recomputes the whole table from raw operations.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+
+from .models import ClientOperation, OperationRollup
+
+AMOUNT_QUANT = Decimal('0.01')
+RATE_QUANT = Decimal('0.0001')
+
+
+def hour_bucket(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _add_to_bucket(currency_id, operation_type, bucket, amount, rate, count, som_total):
+    rollup, _ = OperationRollup.objects.get_or_create(
+        currency_id=currency_id,
+        operation_type=operation_type,
+        bucket=bucket,
+    )
+    OperationRollup.objects.filter(pk=rollup.pk).update(
+        amount_sum=F('amount_sum') + amount,
+        rate_sum=F('rate_sum') + rate,
+        rate_count=F('rate_count') + count,
+        som_total=F('som_total') + som_total,
+    )
+
+
+def _signed_totals(op, sign):
+    return (
+        sign * Decimal(op.amount).quantize(AMOUNT_QUANT),
+        sign * Decimal(op.exchange_rate).quantize(RATE_QUANT),
+        sign,
+        sign * Decimal(op.total_in_som).quantize(AMOUNT_QUANT),
+    )
+
+
+def record_operation(op, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) an operation from its hourly bucket.
+    """
+    _add_to_bucket(
+        op.currency_id, op.operation_type, hour_bucket(op.timestamp),
+        *_signed_totals(op, sign),
+    )
+
+
+def record_operations(ops, sign=1):
+    """
+    record_operation for many operations: deltas are summed per bucket
+    first, so the cost is per touched bucket, not per operation.
+    """
+    buckets = {}
+    for op in ops:
+        key = (op.currency_id, op.operation_type, hour_bucket(op.timestamp))
+        totals = _signed_totals(op, sign)
+        if key in buckets:
+            totals = tuple(a + b for a, b in zip(buckets[key], totals))
+        buckets[key] = totals
+    for key, totals in buckets.items():
+        _add_to_bucket(*key, *totals)
+
+
+def rollup_rows(queryset):
+    """
+    Group raw operations into unsaved OperationRollup objects.
+    """
+    rows = (
+        queryset
+        .annotate(bucket=TruncHour('timestamp'))
+        .values('currency_id', 'operation_type', 'bucket')
+        .annotate(
+            amount_sum=Sum('amount'),
+            rate_sum=Sum('exchange_rate'),
+            rate_count=Count('id'),
+            som_total=Sum('total_in_som'),
+        )
+        .order_by()
+    )
+    return [OperationRollup(**row) for row in rows]
+
+
+@transaction.atomic
+def rebuild_rollups(batch_size=1000):
+    """
+    Drop all rollups and rebuild them from ClientOperation.
+    Returns the number of buckets written.
+    """
+    OperationRollup.objects.all().delete()
+    rollups = rollup_rows(ClientOperation.objects.all())
+    OperationRollup.objects.bulk_create(rollups, batch_size=batch_size)
+    return len(rollups)
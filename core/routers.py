@@ -0,0 +1,65 @@
+"""
+Read/write routing between the primary and the reporting database alias.
+
+Both aliases open the same SQLite file (see DATABASES in
+config/settings.py). The file is in WAL mode (switched once by migration
+core/0018_wal_journal_mode); 'default' has a busy timeout and takes
+every write. 'reporting' is a query-only, memory-mapped connection
+used by exports, analytics and history. In WAL mode readers work on a
+snapshot and never block the writer, so a long export no longer delays
+cashiers posting operations.
+
+Reporting views run inside ``reporting_reads()`` (or inherit
+ReportingReadsMixin): while it is active, ReportingRouter sends every
+read to the reporting alias. The flag is a ContextVar, so it follows the
+request into sync_to_async threads. Querysets evaluated after the view
+returns (streamed exports) must pick the alias themselves with
+``.using(reporting_alias())``.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPORTING_DB_ALIAS = 'reporting'
+
+_reporting = ContextVar('reporting_reads', default=False)
+
+
+def reporting_alias():
+    """The reporting alias, or 'default' if it is not configured."""
+    return REPORTING_DB_ALIAS if REPORTING_DB_ALIAS in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def reporting_reads():
+    token = _reporting.set(True)
+    try:
+        yield
+    finally:
+        _reporting.reset(token)
+
+
+class ReportingReadsMixin:
+    """For DRF views: the whole request reads from the reporting alias."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with reporting_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class ReportingRouter:
+    def db_for_read(self, model, **hints):
+        if _reporting.get():
+            return reporting_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # один и тот же файл БД
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,25 @@
+"""
+Helpers for inserting generated rows with timestamps in the past (used by
+the seed_data command and the benchmark scripts). Kept free of Django
+imports so benchmarks can import it before django.setup().
+"""
+
+
+class historical_timestamps:
+    """
+    Let bulk_create keep explicit values for ``auto_now_add`` fields, so
+    seeded rows can be spread over the past.
+    """
+
+    def __init__(self, *fields):
+        self.fields = fields
+
+    def __enter__(self):
+        for field in self.fields:
+            field.auto_now_add = False
+        return self
+
+    def __exit__(self, *exc):
+        for field in self.fields:
+            field.auto_now_add = True
+        return False
@@ -31,6 +31,14 @@ class CurrencySerializer(serializers.ModelSerializer):
         model = Currency
         fields = ['id', 'name', 'created_at', 'balance']
 
+    def update(self, instance, validated_data):
+        # Пишем только присланные поля: баланс параллельно меняют операции,
+        # и сохранение всей строки затёрло бы их изменения
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
 
 # serializers.py
 
@@ -41,9 +49,10 @@ from rest_framework import serializers
 from .models import HistoryEvent, CustomUser, Currency
 
 class HistoryEventSerializer(serializers.ModelSerializer):
+    # имена берутся из денормализованных полей события, без загрузки связей
     user = serializers.SerializerMethodField()
     target_user = serializers.SerializerMethodField()
-    currency = serializers.StringRelatedField()
+    currency = serializers.SerializerMethodField()
     timestamp = serializers.SerializerMethodField()
 
     class Meta:
@@ -51,15 +60,18 @@ class HistoryEventSerializer(serializers.ModelSerializer):
         fields = ['id', 'event_type', 'user', 'target_user', 'currency', 'timestamp']
 
     def get_user(self, obj):
-        if obj.user:
-            return f"{obj.user.username} (ID: {obj.user.id})"
+        if obj.user_id:
+            return f"{obj.user_username} (ID: {obj.user_id})"
         return "N/A"
 
     def get_target_user(self, obj):
-        if obj.target_user:
-            return f"{obj.target_user.username} (ID: {obj.target_user.id})"
+        if obj.target_user_id:
+            return f"{obj.target_user_username} (ID: {obj.target_user_id})"
         return "N/A"
 
+    def get_currency(self, obj):
+        return obj.currency_name if obj.currency_id else None
+
     def get_timestamp(self, obj):
         return obj.timestamp.strftime('%Y-%m-%dT%H:%M:%SZ')
 
@@ -85,7 +97,52 @@ class ClientOperationSerializer(serializers.ModelSerializer):
         ]
 
     def get_timestamp(self, obj):
-        return obj.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        return format_operation_timestamp(obj.timestamp)
+
+
+def format_operation_timestamp(value):
+    # то же, что strftime('%Y-%m-%d %H:%M:%S') для naive datetime (USE_TZ = False), но быстрее
+    return value.isoformat(sep=' ', timespec='seconds')
+
+
+# Columns read by the lean list path; currency__name is joined in the same query.
+OPERATION_LIST_VALUES = (
+    'id', 'operation_type', 'currency_id', 'currency__name', 'cashier_name',
+    'amount', 'exchange_rate', 'total_in_som', 'timestamp', 'edited',
+)
+
+
+def operation_list_rows(rows):
+    """
+    Render ``values(*OPERATION_LIST_VALUES)`` rows exactly like
+    ClientOperationSerializer(many=True), without per-row field objects.
+    """
+    return [
+        {
+            'id': row['id'],
+            'operation_type': row['operation_type'],
+            'currency': row['currency_id'],
+            'currency_name': row['currency__name'],
+            'cashier_name': row['cashier_name'],
+            'amount': '{:f}'.format(row['amount']),
+            'exchange_rate': '{:f}'.format(row['exchange_rate']),
+            'total_in_som': '{:f}'.format(row['total_in_som']),
+            'timestamp': format_operation_timestamp(row['timestamp']),
+            'edited': row['edited'],
+        }
+        for row in rows
+    ]
+
+
+class BulkOperationItemSerializer(serializers.Serializer):
+    """
+    One item of a bulk ingest batch. The currency is a plain id: the view
+    resolves all ids of the batch with a single query.
+    """
+    operation_type = serializers.ChoiceField(choices=ClientOperation.OPERATION_TYPE_CHOICES)
+    currency = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    exchange_rate = serializers.DecimalField(max_digits=12, decimal_places=4)
 
 
 
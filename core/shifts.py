@@ -0,0 +1,61 @@
+"""
+Active shift resolver with a per-process cache.
+
+The active shift (and its user) is looked up on almost every request.
+It is cached in each process and reloaded only when the shared
+'active_shift' version stamp changes, which ShiftViewSet bumps whenever
+it opens, closes or reassigns a shift.
+
+The cached instance is shared between requests: treat it as read-only
+and re-fetch the shift from the database before modifying it.
+"""
+import threading
+
+from .analytics import shift_totals
+from .cache_versions import bump_version, get_version
+from .models import Shift, ShiftSummary
+
+ACTIVE_SHIFT_VERSION = 'active_shift'
+
+_lock = threading.Lock()
+_cached = {'version': None, 'shift': None}
+
+
+def get_active_shift():
+    """The most recent open shift with its user, or None."""
+    # версию читаем до запроса в БД: если смену поменяют между ними,
+    # кэш всё равно устареет при следующем обращении
+    version = get_version(ACTIVE_SHIFT_VERSION)
+    with _lock:
+        if _cached['version'] == version:
+            return _cached['shift']
+
+    shift = (
+        Shift.objects.select_related('user')
+        .filter(end_time__isnull=True)
+        .order_by('-start_time')
+        .first()
+    )
+    with _lock:
+        _cached['version'] = version
+        _cached['shift'] = shift
+    return shift
+
+
+def invalidate_active_shift():
+    bump_version(ACTIVE_SHIFT_VERSION)
+
+
+def refreeze_shift_summaries(*moments):
+    """
+    Recompute the frozen ShiftSummary of every closed shift that contains
+    one of ``moments``, after an operation at that time was edited or
+    deleted. Call inside the transaction that changed the operation.
+    """
+    for moment in set(moments):
+        closed = Shift.objects.filter(start_time__lte=moment, end_time__gte=moment)
+        for shift in closed:
+            ShiftSummary.objects.update_or_create(
+                shift=shift,
+                defaults=shift_totals(shift.start_time, shift.end_time),
+            )
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .currencies import invalidate_currency_registry
+from .ledger import record_ledger_entries
+from .models import Currency, LedgerEntry
+
+
+@receiver(post_save, sender=Currency)
+def currency_saved(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    if created and not raw:
+        # журнал баланса новой валюты начинается с её начального баланса
+        record_ledger_entries([
+            LedgerEntry(currency_id=instance.id, kind=LedgerEntry.OPENING, delta=instance.balance)
+        ])
+    # Баланс меняется при каждой операции и в реестре не хранится
+    if update_fields is not None and set(update_fields) <= {'balance'}:
+        return
+    invalidate_currency_registry()
+
+
+@receiver(post_delete, sender=Currency)
+def currency_deleted(sender, instance, **kwargs):
+    invalidate_currency_registry()
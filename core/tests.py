@@ -0,0 +1,474 @@
+import json
+import zipfile
+from concurrent.futures import Future
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import F
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from pypdf import PdfReader, PdfWriter
+from rest_framework.test import APIClient
+
+from . import receipts
+from .analytics_cache import cache_stats
+from .exports import parse_timestamp_param
+from .models import (
+    BalanceSnapshot,
+    ClientOperation,
+    Currency,
+    CustomUser,
+    LedgerEntry,
+    OperationRollup,
+    Shift,
+    ShiftSummary,
+)
+from .rollups import rebuild_rollups
+from .snapshots import balances_at, take_snapshot
+from .views import CurrencyViewSet
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-shared'},
+    'analytics': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-analytics'},
+    'receipts': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-receipts'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES, ANALYTICS_CACHE_SECONDS=0)
+class APITestBase(TransactionTestCase):
+    """
+    TransactionTestCase: the reporting alias is a second connection to the
+    same test database and only sees committed rows.
+    """
+    databases = {'default', 'reporting'}
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()  # новые штампы версий — локальные кэши перечитаются
+        self.admin = CustomUser.objects.create_user('admin', password='admin', role='admin')
+        self.cashier = CustomUser.objects.create_user('cashier', password='cashier', role='cashier')
+        self.shift = Shift.objects.create(user=self.cashier)
+        self.som = Currency.objects.create(name='Som', balance=Decimal('1000000'))
+        self.usd = Currency.objects.create(name='USD', balance=Decimal('1000'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_currencies(self, count, operations=3):
+        """``count`` currencies with a few buy and sell operations each."""
+        start = Currency.objects.count()
+        for i in range(count):
+            currency = Currency.objects.create(name=f'C{start + i}', balance=Decimal('1000'))
+            ClientOperation.objects.bulk_create([
+                ClientOperation(
+                    operation_type='buy' if n % 2 else 'sell', currency=currency,
+                    cashier_name=self.cashier.username, amount=Decimal('10'),
+                    exchange_rate=Decimal('2.5'), total_in_som=Decimal('25'),
+                )
+                for n in range(operations)
+            ])
+        rebuild_rollups()
+
+    def fetch(self, path, params=None):
+        """Body of a successful GET, streamed responses read to the end."""
+        response = self.client.get(path, params or {})
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual(response.status_code, 200, body[:500])
+        return body
+
+    def count_queries(self, path, params=None):
+        """Queries of one request, per alias, after a warm-up request."""
+        self.fetch(path, params)  # прогрев: реестр валют, активная смена
+        with ExitStack() as stack:
+            contexts = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in self.databases
+            }
+            self.fetch(path, params)
+        return {alias: len(context) for alias, context in contexts.items()}
+
+    def live_balances(self):
+        return {currency.id: currency.balance for currency in Currency.objects.all()}
+
+    def post_operation(self, operation_type='buy', currency=None, amount='10', rate='87.5', **headers):
+        return self.client.post('/api/operations/', {
+            'operation_type': operation_type, 'currency': (currency or self.usd).id,
+            'amount': amount, 'exchange_rate': rate,
+        }, format='json', headers=headers)
+
+
+class AnalyticsQueryCountTests(APITestBase):
+    ENDPOINTS = [
+        ('/api/analytics/', {'period': 'today'}),
+        ('/api/analytics/', {'period': 'week'}),
+        ('/api/analytics/advanced/', {'period': 'week'}),
+        ('/api/analytics/export_excel/', {'period': 'week'}),
+    ]
+
+    def test_query_count_does_not_grow_with_currencies(self):
+        self.add_currencies(1)  # две валюты кроме Som: USD и C3
+        expected = {(path, params['period']): self.count_queries(path, params) for path, params in self.ENDPOINTS}
+
+        self.add_currencies(10)
+        for path, params in self.ENDPOINTS:
+            counts = expected[(path, params['period'])]
+            with self.subTest(path=path, period=params['period']):
+                self.fetch(path, params)
+                with self.assertNumQueries(counts['default']), \
+                        self.assertNumQueries(counts['reporting'], using='reporting'):
+                    self.fetch(path, params)
+
+
+
+@override_settings(ANALYTICS_CACHE_SECONDS=60)
+class AnalyticsPayloadCacheTests(APITestBase):
+    def test_payloads_do_not_share_the_version_stamp_cache(self):
+        self.fetch('/api/analytics/', {'period': 'week'})
+        shared_keys = set(caches['shared']._cache)
+
+        self.fetch('/api/analytics/', {'period': 'month'})
+        self.assertEqual(len(caches['analytics']._cache), 2)
+        self.assertEqual(set(caches['shared']._cache), shared_keys)  # только штампы и счётчики
+        self.assertEqual(cache_stats()['analytics'], {'hit': 0, 'miss': 2})
+
+        caches['analytics'].clear()  # вытеснение полезных данных не трогает счётчики
+        self.fetch('/api/analytics/', {'period': 'week'})
+        self.assertEqual(cache_stats()['analytics'], {'hit': 0, 'miss': 3})
+
+    def test_patch_invalidates_cached_payload_and_etag(self):
+        operation_id = self.post_operation(amount='10').data['id']
+        etag = self.client.get('/api/analytics/', {'period': 'week'})['ETag']
+        self.fetch('/api/analytics/', {'period': 'week'})
+        self.assertEqual(cache_stats()['analytics'], {'hit': 1, 'miss': 1})
+
+        response = self.client.patch(f'/api/operations/{operation_id}/', {'amount': '500'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/analytics/', {'period': 'week'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'"buy_count":500.0', response.content)
+        self.assertEqual(cache_stats()['analytics'], {'hit': 1, 'miss': 2})
+
+
+class ConditionalGetTests(APITestBase):
+    def assert_not_modified(self, path, etag):
+        with self.assertNumQueries(0), self.assertNumQueries(0, using='reporting'):
+            response = self.client.get(path, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def assert_modified(self, path, etag):
+        response = self.client.get(path, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_currency_list_etag_changes_after_a_write(self):
+        etag = self.client.get('/api/currencies/')['ETag']
+        self.assert_not_modified('/api/currencies/', etag)
+
+        response = self.client.post('/api/currencies/', {'name': 'EUR', 'balance': '50'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.assert_modified('/api/currencies/', etag)
+        self.assertIn('EUR', [row['name'] for row in response.data['results']])
+
+    def test_shift_clear_changes_the_balances_etag(self):
+        path = '/api/operations/currencies/'
+        etag = self.client.get(path)['ETag']
+        self.assert_not_modified(path, etag)
+
+        response = self.client.post('/api/shifts/clear/', {'balances': [{'currency_id': self.usd.id, 'leftover': '700'}]},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.assert_modified(path, etag)
+        self.assertEqual([row['balance'] for row in response.data], ['700.00'])
+
+class CursorPaginationTests(APITestBase):
+    def test_page_numbers_stay_the_default(self):
+        self.post_operation()
+        data = self.client.get('/api/operations/', {'period': 'week'}).data
+        self.assertEqual((data['count'], data['next'], data['previous']), (1, None, None))
+
+    def test_cursor_walks_tied_timestamps_without_gaps_or_duplicates(self):
+        for _ in range(20):
+            self.post_operation(amount='1')
+        ids = list(ClientOperation.objects.order_by('id').values_list('id', flat=True))
+        # группы операций с одинаковым временем, как у пакетной загрузки; границы страниц (по 8) внутри групп
+        moment = datetime.now().replace(microsecond=0)
+        ClientOperation.objects.filter(id__in=ids[:9]).update(timestamp=moment - timedelta(days=2))
+        ClientOperation.objects.filter(id__in=ids[9:17]).update(timestamp=moment - timedelta(days=1))
+        expected = list(ClientOperation.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+        seen, url = [], '/api/operations/?period=week&pagination=cursor'
+        while url:
+            data = self.client.get(url).data
+            self.assertNotIn('count', data)
+            seen += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(seen, expected)
+
+class ClosedShiftSummaryTests(APITestBase):
+    def close_shift_with_operations(self, *amounts):
+        ids = [self.post_operation(amount=amount).data['id'] for amount in amounts]
+        self.assertEqual(self.client.post('/api/shifts/clear/', {'balances': []}, format='json').status_code, 200)
+        return ids
+
+    def closed_shift_row(self):
+        rows = self.client.get('/api/shifts/history/').data['results']
+        return next(row for row in rows if row['id'] == self.shift.id)
+
+    def test_deleting_an_operation_refreezes_the_summary(self):
+        operation_id, _ = self.close_shift_with_operations('10', '5')
+        self.assertEqual(self.closed_shift_row()['operations_count'], 2)
+
+        response = self.client.delete(f'/api/operations/{operation_id}/?period=week')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.closed_shift_row()['operations_count'], 1)
+
+    def test_editing_an_operation_refreezes_the_summary(self):
+        operation_id, = self.close_shift_with_operations('10')
+        response = self.client.patch(
+            f'/api/operations/{operation_id}/edit_operation/?period=week', {'amount': '4'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ShiftSummary.objects.get(shift=self.shift).total_bought, Decimal('4'))
+
+    def test_plain_patch_updates_rollups_and_summary(self):
+        operation_id, = self.close_shift_with_operations('10')
+        response = self.client.patch(f'/api/operations/{operation_id}/?period=week', {'amount': '500'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        rollup = OperationRollup.objects.get(currency=self.usd, operation_type='buy')
+        self.assertEqual((rollup.amount_sum, rollup.som_total), (Decimal('500'), Decimal('43750')))
+        self.assertEqual(ShiftSummary.objects.get(shift=self.shift).total_bought, Decimal('500'))
+
+
+class TimestampParamTests(APITestBase):
+    def test_offsets_are_converted_to_server_local_time(self):
+        # TIME_ZONE = 'Asia/Bishkek' (UTC+6), USE_TZ = False
+        self.assertEqual(parse_timestamp_param('2025-01-01T00:00:00Z', 'since'), datetime(2025, 1, 1, 6, 0))
+        self.assertEqual(parse_timestamp_param('2025-01-01T08:00:00+06:00', 'since'), datetime(2025, 1, 1, 8, 0))
+        self.assertEqual(parse_timestamp_param('2025-01-01', 'since'), datetime(2025, 1, 1))
+
+    def test_endpoints_accept_zulu_offset_and_date_only_values(self):
+        self.post_operation()
+        for params in (
+            {'since': '2000-01-01T00:00:00Z'},
+            {'since': '2000-01-01T00:00:00+06:00', 'until': '2100-01-01'},
+            {'since': '2000-01-01', 'until': '2100-01-01T00:00:00Z'},
+        ):
+            with self.subTest(**params):
+                self.assertIn(b'USD', self.fetch('/api/operations/export_csv/', params))
+                self.assertIn(b'USD', self.fetch('/api/operations/export_ndjson/', params))
+        self.fetch('/api/balances/at/', {'at': '2030-01-01T00:00:00Z'})
+        self.fetch('/api/balances/history/', {'since': '2025-01-01T00:00:00Z', 'until': '2025-01-10T00:00:00+06:00'})
+        self.fetch('/api/operations/receipts_bundle/', {
+            'since': '2099-01-01T00:00:00Z', 'until': '2099-01-02T00:00:00+06:00',
+        })
+
+
+class ReceiptJobTests(APITestBase):
+    def test_failed_job_is_logged_and_forgotten(self):
+        future = Future()
+        receipts._jobs['1-v1'] = future
+        future.set_exception(RuntimeError("render crashed"))
+        with self.assertLogs('core.receipts', level='ERROR') as logs:
+            receipts._store_result('receipt:1:v1', '1-v1', future)
+        self.assertIn('1-v1', logs.output[0])
+        self.assertNotIn('1-v1', receipts._jobs)
+        self.assertIsNone(caches[receipts.RECEIPT_CACHE_ALIAS].get('receipt:1:v1'))
+
+
+def blank_pdf():
+    writer = PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+class ReceiptBundleTests(APITestBase):
+    @override_settings(RECEIPT_RENDER_WORKERS=0)
+    def test_bundle_renders_inline_without_workers(self):
+        operation_id = self.post_operation().data['id']
+        rendered = []
+        with mock.patch.object(receipts, 'html_to_pdf', side_effect=lambda html: rendered.append(html) or b'%PDF'):
+            body = self.fetch('/api/operations/receipts_bundle/', {'shift': self.shift.id})
+        self.assertIsNone(receipts._executor)  # пул процессов не запускался
+        self.assertEqual(len(rendered), 1)
+        names = zipfile.ZipFile(BytesIO(body)).namelist()
+        self.assertEqual(names, [f'receipt_{operation_id}.pdf'])
+
+    @override_settings(RECEIPT_RENDER_WORKERS=0, RECEIPT_PDF_BUNDLE_MAX_OPERATIONS=2)
+    def test_merged_pdf_bundle_is_capped(self):
+        for _ in range(3):
+            self.post_operation()
+        with mock.patch.object(receipts, 'html_to_pdf') as html_to_pdf:
+            response = self.client.get('/api/operations/receipts_bundle/', {'shift': self.shift.id, 'bundle': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('bundle=zip', response.data['detail'])
+        html_to_pdf.assert_not_called()
+
+        html_to_pdf.return_value = blank_pdf()
+        with override_settings(RECEIPT_PDF_BUNDLE_MAX_OPERATIONS=3), \
+                mock.patch.object(receipts, 'html_to_pdf', html_to_pdf):
+            body = self.fetch('/api/operations/receipts_bundle/', {'shift': self.shift.id, 'bundle': 'pdf'})
+        self.assertEqual(len(PdfReader(BytesIO(body)).pages), 3)
+
+
+class ReceiptCacheTests(APITestBase):
+    @override_settings(RECEIPT_RENDER_WORKERS=0)
+    def test_patch_renders_a_fresh_receipt(self):
+        operation_id = self.post_operation(amount='10').data['id']
+        path = f'/api/operations/{operation_id}/generate_receipt/'
+        rendered = []
+        with mock.patch.object(receipts, 'html_to_pdf', side_effect=lambda html: rendered.append(html) or b'%PDF'):
+            self.fetch(path)
+            self.fetch(path)
+            response = self.client.patch(f'/api/operations/{operation_id}/', {'amount': '500'}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.fetch(path)
+        self.assertEqual(ClientOperation.objects.get(id=operation_id).version, 2)
+        self.assertEqual(len(rendered), 2)  # второй запрос — из кэша, после правки — новый чек
+        self.assertIn('500', rendered[1])
+
+class CurrencyUpdateTests(APITestBase):
+    def patch_during_concurrent_sale(self, data):
+        """PATCH the USD currency while 100 USD are credited right after get_object()."""
+        get_object = CurrencyViewSet.get_object
+
+        def stale_get_object(view):
+            instance = get_object(view)
+            Currency.objects.filter(pk=instance.pk).update(balance=F('balance') + 100)
+            return instance
+
+        with mock.patch.object(CurrencyViewSet, 'get_object', stale_get_object):
+            response = self.client.patch(f'/api/currencies/{self.usd.id}/', data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def test_rename_keeps_a_concurrent_balance_change(self):
+        self.patch_during_concurrent_sale({'name': 'US Dollar'})
+        self.usd.refresh_from_db()
+        self.assertEqual((self.usd.name, self.usd.balance), ('US Dollar', Decimal('1100')))
+        self.assertFalse(LedgerEntry.objects.filter(kind=LedgerEntry.ADJUSTMENT).exists())
+
+    def test_balance_adjustment_is_measured_against_the_locked_row(self):
+        self.patch_during_concurrent_sale({'balance': '500.00'})
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.balance, Decimal('500'))
+        adjustment = LedgerEntry.objects.get(kind=LedgerEntry.ADJUSTMENT)
+        self.assertEqual((adjustment.delta, adjustment.balance_after), (Decimal('-600'), Decimal('500')))
+
+
+class BulkIngestTests(APITestBase):
+    def item(self, operation_type, amount):
+        return {'operation_type': operation_type, 'currency': self.usd.id, 'amount': amount, 'exchange_rate': '2'}
+
+    def test_items_are_checked_in_order_against_running_balances(self):
+        response = self.client.post('/api/operations/bulk/', {'operations': [
+            self.item('sell', '800'),  # USD 1000 -> 200
+            self.item('sell', '500'),  # не хватает: USD 200
+            self.item('buy', '400'),   # USD 200 -> 600
+            self.item('sell', '500'),  # теперь хватает: USD 600 -> 100
+            {'operation_type': 'sell', 'currency': self.usd.id},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (3, 2))
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'error', 'created', 'created', 'error'],
+        )
+        self.assertIn('Insufficient USD', response.data['results'][1]['errors']['detail'])
+        self.assertIn('amount', response.data['results'][4]['errors'])
+
+        self.usd.refresh_from_db()
+        self.som.refresh_from_db()
+        self.assertEqual(self.usd.balance, Decimal('100'))
+        self.assertEqual(self.som.balance, Decimal('1001800'))  # +1600 - 800 + 1000
+        self.assertEqual(ClientOperation.objects.count(), 3)
+        last = LedgerEntry.objects.filter(currency=self.usd).latest('id')
+        self.assertEqual(last.balance_after, Decimal('100'))
+
+    def test_batch_without_valid_items_changes_nothing(self):
+        response = self.client.post('/api/operations/bulk/', [self.item('sell', '5000')], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], 0)
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.balance, Decimal('1000'))
+        self.assertFalse(ClientOperation.objects.exists())
+
+
+class OperationUpdateTests(APITestBase):
+    def test_put_reverses_balances_through_the_ledger(self):
+        operation_id = self.post_operation(amount='10').data['id']
+        response = self.client.put(f'/api/operations/{operation_id}/', {
+            'operation_type': 'buy', 'currency': self.usd.id, 'cashier_name': 'cashier',
+            'amount': '500', 'exchange_rate': '87.5',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_in_som'], '43750.00')
+
+        self.assertEqual(self.live_balances(), {self.som.id: Decimal('956250'), self.usd.id: Decimal('1500')})
+        kinds = list(LedgerEntry.objects.filter(operation_id=operation_id).values_list('kind', flat=True))
+        self.assertEqual(sorted(kinds), sorted([LedgerEntry.OPERATION] * 2 + [LedgerEntry.EDIT_REVERSAL] * 2
+                                               + [LedgerEntry.EDIT] * 2))
+        for currency_id, balance in self.live_balances().items():
+            last = LedgerEntry.objects.filter(currency_id=currency_id).latest('id')
+            self.assertEqual(last.balance_after, balance)
+
+class IdempotencyKeyTests(APITestBase):
+    def test_retry_replays_the_stored_response_without_applying_twice(self):
+        first = self.post_operation(amount='10', **{'Idempotency-Key': 'till-1:42'})
+        retry = self.post_operation(amount='10', **{'Idempotency-Key': 'till-1:42'})
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(ClientOperation.objects.count(), 1)
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.balance, Decimal('1010'))
+
+    def test_same_key_with_a_different_body_is_rejected(self):
+        self.post_operation(amount='10', **{'Idempotency-Key': 'till-1:43'})
+        response = self.post_operation(amount='11', **{'Idempotency-Key': 'till-1:43'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(ClientOperation.objects.count(), 1)
+
+    def test_edit_retry_is_applied_once(self):
+        operation_id = self.post_operation(amount='10').data['id']
+        path = f'/api/operations/{operation_id}/edit_operation/?period=week'
+        for _ in range(2):
+            response = self.client.patch(path, {'amount': '30'}, format='json', headers={'Idempotency-Key': 'edit-1'})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(ClientOperation.objects.get(id=operation_id).version, 2)
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.balance, Decimal('1030'))
+
+
+class BalancesAtTests(APITestBase):
+    def test_point_in_time_balances_match_live_balances(self):
+        self.post_operation('buy', amount='10.1', rate='87.37')
+        take_snapshot(BalanceSnapshot.END_OF_DAY)
+        edited = self.post_operation('sell', amount='300', rate='86.9').data['id']
+        deleted = self.post_operation('buy', amount='7.5', rate='88.1').data['id']
+        response = self.client.patch(f'/api/operations/{edited}/edit_operation/', {'amount': '250.25'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.delete(f'/api/operations/{deleted}/').status_code, 204)
+        moment, expected = timezone.now(), self.live_balances()
+
+        response = self.client.post('/api/shifts/clear/', {'balances': [{'currency_id': self.usd.id, 'leftover': '700'}]},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        self.post_operation('sell', amount='0.3', rate='86.91')
+
+        self.assertEqual(balances_at(moment)[1], expected)
+        self.assertEqual(balances_at(timezone.now())[1], self.live_balances())
+        rows = json.loads(self.fetch('/api/balances/at/'))['balances']
+        self.assertEqual({row['currency_id']: Decimal(row['balance']) for row in rows}, self.live_balances())
@@ -10,7 +10,12 @@ from .views import (
     AdvancedAnalyticsView,
     ExportEventExcel,
     ExportOperationExcel,
-    ExportAnalyticsExcel, InternalHistoryAPIView
+    ExportAnalyticsExcel, InternalHistoryAPIView,
+    ExportOperationStream,
+    ExportEventStream,
+    BalanceAtView,
+    BalanceHistoryView,
+    event_stream,
     # <и т.д.>
 )
 
@@ -30,11 +35,18 @@ router.register(r'histories', HistoryEventViewSet, basename='histories')
 router.register(r'users', CustomUserViewSet, basename='user')
 
 urlpatterns = [
+    path('events/stream/', event_stream, name='event-stream'),
     path('events/export_excel/', ExportEventExcel.as_view(), name='export-event-excel'),
+    path('events/export_csv/', ExportEventStream.as_view(export_format='csv'), name='export-event-csv'),
+    path('events/export_ndjson/', ExportEventStream.as_view(export_format='ndjson'), name='export-event-ndjson'),
     path('operations/export_excel/', ExportOperationExcel.as_view(), name='export-operation-excel'),
+    path('operations/export_csv/', ExportOperationStream.as_view(export_format='csv'), name='export-operation-csv'),
+    path('operations/export_ndjson/', ExportOperationStream.as_view(export_format='ndjson'), name='export-operation-ndjson'),
     path('analytics/export_excel/', ExportAnalyticsExcel.as_view(), name='export-analytics-excel'),
     path('analytics/', AnalyticsView.as_view(), name='analytics'),
     path('analytics/advanced/', AdvancedAnalyticsView.as_view(), name='analytics-advanced'),
+    path('balances/at/', BalanceAtView.as_view(), name='balances-at'),
+    path('balances/history/', BalanceHistoryView.as_view(), name='balances-history'),
     path('internal-history/', InternalHistoryAPIView.as_view(), name='internal-history'),
     path('', include(router.urls)),
 ]
@@ -1,5 +1,3 @@
-from io import BytesIO
-
 from rest_framework import viewsets, generics
 from .models import Currency, HistoryEvent,  Shift, CustomUser
 from .serializers import (
@@ -9,6 +7,22 @@ from .serializers import (
     CustomUserSerializer
 )
 from .permissions import IsCashierOrAdmin
+from .pagination import CursorOptInMixin
+from .routers import ReportingReadsMixin, reporting_alias
+from .cache_versions import bump_version
+from .currencies import CURRENCY_REGISTRY_VERSION
+from .etags import (
+    ANALYTICS_ETAG_WINDOW,
+    CURRENCIES_VERSION,
+    OPERATIONS_VERSION,
+    USERS_VERSION,
+    conditional_get,
+)
+from .ledger import ledger_entries, record_ledger_entries
+from .models import LedgerEntry
+from .events import ledger_balances, publish_event
+from django.db import transaction
+from decimal import Decimal
 
 from rest_framework.pagination import PageNumberPagination
 
@@ -17,14 +31,21 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class CurrencyViewSet(viewsets.ModelViewSet):
+class CurrencyViewSet(CursorOptInMixin, viewsets.ModelViewSet):
     queryset = Currency.objects.filter(is_deleted=False)
     serializer_class = CurrencySerializer
     pagination_class = StandardResultsSetPagination
+    cursor_ordering = ('created_at', 'id')
+
+    @conditional_get(CURRENCIES_VERSION, CURRENCY_REGISTRY_VERSION)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
 
-        currency = serializer.save()
+        currency = serializer.save()  # начальная запись журнала — core/signals.py
+        bump_version(CURRENCIES_VERSION, OPERATIONS_VERSION)
+        publish_event('currency.created', {"currency": serializer.data})
 
         try:
             HistoryEvent.objects.create(
@@ -37,7 +58,19 @@ class CurrencyViewSet(viewsets.ModelViewSet):
             print(f"Error creating history event: {e}")
 
     def perform_update(self, serializer):
-        currency = serializer.save()
+        with transaction.atomic():
+            # get_object() прочитал баланс до транзакции; перечитываем его
+            # под блокировкой записи (transaction_mode IMMEDIATE)
+            old_balance = Currency.objects.filter(pk=serializer.instance.pk).values_list('balance', flat=True).get()
+            serializer.instance.balance = old_balance
+            currency = serializer.save()  # только присланные поля, см. CurrencySerializer.update
+            if 'balance' in serializer.validated_data:
+                record_ledger_entries(ledger_entries(
+                    [(currency.id, Decimal(currency.balance).quantize(BALANCE_QUANT) - old_balance)],
+                    LedgerEntry.ADJUSTMENT,
+                ))
+            bump_version(CURRENCIES_VERSION, OPERATIONS_VERSION)
+            publish_event('currency.updated', {"currency": serializer.data})
         HistoryEvent.objects.create(
             event_type='update_currency',
             user=self.request.user if self.request.user.is_authenticated else None,
@@ -53,17 +86,43 @@ class CurrencyViewSet(viewsets.ModelViewSet):
         )
         instance.is_deleted = True
         instance.save()
+        bump_version(CURRENCIES_VERSION, OPERATIONS_VERSION)
+        publish_event('currency.deleted', {"id": instance.id})
 from rest_framework.exceptions import ValidationError
 
 
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from django.template.loader import render_to_string
-from xhtml2pdf import pisa
 from .models import ClientOperation
-from .serializers import ClientOperationSerializer
+from .serializers import (
+    OPERATION_LIST_VALUES,
+    BulkOperationItemSerializer,
+    ClientOperationSerializer,
+    operation_list_rows,
+)
+from .rollups import record_operation, record_operations
+from .shifts import ACTIVE_SHIFT_VERSION, get_active_shift, invalidate_active_shift, refreeze_shift_summaries
+from .currencies import current_balances, get_currency_registry
+from .balances import BALANCE_QUANT, InsufficientBalance, apply_balance_deltas, apply_operation, operation_deltas
+from django.db import transaction
+from .idempotency import idempotent
+from .receipts import (
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_PENDING,
+    get_receipt_pdf,
+    iter_rendered_receipts,
+    merged_receipts_pdf,
+    receipt_job_id,
+    receipt_job_result,
+    render_pool_enabled,
+    stream_receipts_zip,
+    submit_receipt_job,
+)
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
 
-class ClientOperationViewSet(viewsets.ModelViewSet):
+class ClientOperationViewSet(CursorOptInMixin, viewsets.ModelViewSet):
     queryset = ClientOperation.objects.all().order_by('-timestamp')  # Order by latest timestamp
     serializer_class = ClientOperationSerializer
     permission_classes = [IsCashierOrAdmin]
@@ -72,14 +131,14 @@ class ClientOperationViewSet(viewsets.ModelViewSet):
         """
         Filter operations by the selected period (shift, 3 days, week).
         """
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('currency')
         period = self.request.query_params.get('period', 'shift')  # Default to 'shift'
 
         now = datetime.now()
 
         if period == 'shift':
             # Retrieve the most recent shift
-            recent_shift = Shift.objects.filter(end_time__isnull=True).order_by('-start_time').first()
+            recent_shift = get_active_shift()
             if recent_shift:
                 queryset = queryset.filter(timestamp__gte=recent_shift.start_time)
             else:
@@ -99,10 +158,22 @@ class ClientOperationViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        # Быстрый путь списка: values() с JOIN валюты, без ModelSerializer на строку
+        queryset = self.filter_queryset(self.get_queryset()).values(*OPERATION_LIST_VALUES)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(operation_list_rows(page))
+        return Response(operation_list_rows(queryset))
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         from rest_framework.exceptions import ValidationError
         # find active shift
-        active_shift = Shift.objects.filter(end_time__isnull=True).order_by('-start_time').first()
+        active_shift = get_active_shift()
         if not active_shift or not active_shift.user:
             raise ValidationError({"detail": "No active shift or no user assigned to the active shift."})
 
@@ -115,98 +186,244 @@ class ClientOperationViewSet(viewsets.ModelViewSet):
         rate = data['exchange_rate']
 
 
-        try:
-            som_currency = Currency.objects.get(name="Som")
-        except Currency.DoesNotExist:
+        som_id = get_currency_registry().base_id
+        if som_id is None:
             raise ValidationError({"detail": "The main currency 'Som' was not found."})
 
         total_som = amount * rate
 
-        if op_type == 'buy':
-            if som_currency.balance < total_som:
-                raise ValidationError({"detail": "Insufficient Som balance for this purchase."})
-        else:  # sell
-            if currency.balance < amount:
+        # Проверка средств и списание — одним UPDATE, вместе с записью операции
+        with transaction.atomic():
+            try:
+                changes = apply_operation(op_type, currency.id, som_id, amount, total_som)
+            except InsufficientBalance:
+                if op_type == 'buy':
+                    raise ValidationError({"detail": "Insufficient Som balance for this purchase."})
                 raise ValidationError({"detail": f"Insufficient {currency.name} balance for this sale."})
 
-        operation = serializer.save(
-            cashier_name=shift_cashier.username,  # SHIFT’s user name
-            total_in_som=total_som
-        )
+            operation = serializer.save(
+                cashier_name=shift_cashier.username,  # SHIFT’s user name
+                total_in_som=total_som
+            )
+            record_operation(operation)
+            entries = record_ledger_entries(ledger_entries(changes, LedgerEntry.OPERATION, operation=operation))
+            bump_version(CURRENCIES_VERSION, OPERATIONS_VERSION)
+            publish_event('operation.created', {
+                "operation": serializer.data,
+                "balances": ledger_balances(entries),
+            })
+
+    def perform_destroy(self, instance):
+        operation_id = instance.id
+        with transaction.atomic():
+            record_operation(instance, sign=-1)
+            instance.delete()
+            refreeze_shift_summaries(instance.timestamp)
+        bump_version(OPERATIONS_VERSION)
+        publish_event('operation.deleted', {"id": operation_id})
+
+    BULK_MAX_OPERATIONS = 500
+
+    @action(detail=False, methods=['post'], url_path='bulk', url_name='bulk')
+    @idempotent
+    def bulk_create_operations(self, request):
+        """
+        Ingest a batch of operations (e.g. queued by an offline till).
+
+        Body: a list of operations, or {"operations": [...]}, each with
+        operation_type, currency, amount and exchange_rate. Items are
+        validated in order against running balances, so an item may spend
+        what an earlier item of the batch brought in. Valid items are
+        created, invalid ones are reported and skipped; the response has
+        one result per item, in request order.
+        """
+        from rest_framework.exceptions import ValidationError
+
+        items = request.data.get('operations') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError({"detail": "Expected a non-empty list of operations."})
+        if len(items) > self.BULK_MAX_OPERATIONS:
+            raise ValidationError({"detail": f"At most {self.BULK_MAX_OPERATIONS} operations per batch."})
+
+        active_shift = get_active_shift()
+        if not active_shift or not active_shift.user:
+            raise ValidationError({"detail": "No active shift or no user assigned to the active shift."})
+        cashier_name = active_shift.user.username
+
+        som_id = get_currency_registry().base_id
+        if som_id is None:
+            raise ValidationError({"detail": "The main currency 'Som' was not found."})
 
+        parsed = []
+        for item in items:
+            item_serializer = BulkOperationItemSerializer(data=item if isinstance(item, dict) else {})
+            if item_serializer.is_valid():
+                parsed.append((item_serializer.validated_data, None))
+            else:
+                parsed.append((None, item_serializer.errors))
+        currency_ids = {data['currency'] for data, _ in parsed if data is not None}
+
+        with transaction.atomic():
+            # баланс читаем внутри транзакции (IMMEDIATE) — до коммита его никто не изменит
+            currencies = Currency.objects.in_bulk(currency_ids | {som_id})
+            running = {pk: cur.balance for pk, cur in currencies.items()}
+            deltas = {}
+            entries = []
+            results = []
+            operations = []
+
+            for index, (data, errors) in enumerate(parsed):
+                if errors is not None:
+                    results.append({"index": index, "status": "error", "errors": errors})
+                    continue
+                currency = currencies.get(data['currency'])
+                if currency is None:
+                    results.append({"index": index, "status": "error",
+                                    "errors": {"currency": [f"Invalid pk \"{data['currency']}\" - object does not exist."]}})
+                    continue
 
-        if op_type == 'buy':
-            som_currency.balance -= total_som
-            som_currency.save()
-            currency.balance += amount
-            currency.save()
-        else:  # sell
-            currency.balance -= amount
-            currency.save()
-            som_currency.balance += total_som
-            som_currency.save()
+                op_type = data['operation_type']
+                amount = data['amount']
+                total_som = amount * data['exchange_rate']
+                changes = operation_deltas(op_type, currency.id, som_id, amount, total_som)
+                debit_id, debit = changes[0]
+
+                if running[debit_id] < -debit:
+                    name = 'Som' if op_type == 'buy' else currency.name
+                    action_name = 'purchase' if op_type == 'buy' else 'sale'
+                    results.append({"index": index, "status": "error",
+                                    "errors": {"detail": f"Insufficient {name} balance for this {action_name}."}})
+                    continue
+
+                operation = ClientOperation(
+                    operation_type=op_type,
+                    currency=currency,
+                    cashier_name=cashier_name,
+                    amount=amount,
+                    exchange_rate=data['exchange_rate'],
+                    total_in_som=total_som,
+                )
+                for currency_id, delta in changes:
+                    running[currency_id] += delta
+                    deltas[currency_id] = deltas.get(currency_id, 0) + delta
+                entries += ledger_entries(changes, LedgerEntry.OPERATION, operation=operation)
+                operations.append(operation)
+                results.append({"index": index, "status": "created", "operation": operation})
+
+            ClientOperation.objects.bulk_create(operations)
+            apply_balance_deltas(deltas)
+            record_operations(operations)
+            entries = record_ledger_entries(entries)
+            if operations:
+                bump_version(CURRENCIES_VERSION, OPERATIONS_VERSION)
+
+            for result in results:
+                if result['status'] == 'created':
+                    result['operation'] = ClientOperationSerializer(result['operation']).data
+            if operations:
+                publish_event('operations.bulk_created', {
+                    "operations": [result['operation'] for result in results if result['status'] == 'created'],
+                    "balances": ledger_balances(entries),
+                })
+        return Response({
+            "created": len(operations),
+            "failed": len(results) - len(operations),
+            "results": results,
+        }, status=201 if operations else 400)
 
     @action(detail=False, methods=['get'], url_path='currencies', url_name='currencies')
+    @conditional_get(CURRENCIES_VERSION, CURRENCY_REGISTRY_VERSION)
     def list_currencies(self, request):
+        registry = get_currency_registry()
+        rows = self.currency_rows(registry)
+        balances = current_balances([row['id'] for row in rows])
+        return Response(self.currency_list(rows, balances))
+
+    @staticmethod
+    def currency_rows(registry):
         # exclude Som and also filter out deleted currencies
-        currencies = Currency.objects.filter(is_deleted=False).exclude(name="Som")
-        serializer = CurrencySerializer(currencies, many=True)
-        return Response(serializer.data)
+        return registry.memo('list_currencies', lambda: [
+            {
+                'id': cur.id,
+                'name': cur.name,
+                'created_at': CurrencySerializer().fields['created_at'].to_representation(cur.created_at),
+            }
+            for cur in registry.active(include_base=False)
+        ])
+
+    @staticmethod
+    def currency_list(rows, balances):
+        balance_field = CurrencySerializer().fields['balance']
+        return [
+            {**row, 'balance': balance_field.to_representation(balances[row['id']])}
+            for row in rows
+            if row['id'] in balances
+        ]
 
     @action(methods=['patch'], detail=True)
+    @idempotent
     def edit_operation(self, request, pk=None):
         """
         Edit an operation and recalculate balances.
         """
-        from rest_framework.exceptions import ValidationError
+        return self._edit_operation(request, partial=True)
 
-        old_op = self.get_object()
-        old_amount = old_op.amount
-        old_total_som = old_op.total_in_som
-        op_type = old_op.operation_type
-        currency = old_op.currency
+    @idempotent
+    def update(self, request, *args, **kwargs):
+        # PUT/PATCH /operations/{id}/ идут тем же путём, что и edit_operation:
+        # откат старых балансов, записи журнала, сводки, версии и кэши
+        return self._edit_operation(request, partial=kwargs.get('partial', False))
 
-        try:
-            som_currency = Currency.objects.get(name="Som", is_deleted=False)
-        except Currency.DoesNotExist:
+    def _edit_operation(self, request, partial):
+        from rest_framework.exceptions import ValidationError
+
+        som_info = get_currency_registry().base
+        if som_info is None or som_info.is_deleted:
             raise ValidationError("The main currency 'Som' was not found or is deleted!")
 
-        if op_type == 'buy':
-            som_currency.balance += old_total_som
-            currency.balance -= old_amount
-        else:  # sell
-            currency.balance += old_amount
-            som_currency.balance -= old_total_som
-
-        som_currency.save()
-        currency.save()
-
-        serializer = self.get_serializer(old_op, data=request.data, partial=True)
-        serializer.is_valid(raise_exception=True)
-        updated_op = serializer.save()
-
-        new_amount = updated_op.amount
-        new_rate = updated_op.exchange_rate
-        new_total_som = new_amount * new_rate
-        updated_op.total_in_som = new_total_som
-        updated_op.edited = self.request.user.username
-        updated_op.save()
-
-        if op_type == 'buy':
-            if som_currency.balance < new_total_som:
-                raise ValidationError("Insufficient Som balance for this edit.")
-            som_currency.balance -= new_total_som
-            currency.balance += new_amount
-        else:  # sell
-            if currency.balance < new_amount:
+        # Откат старой операции и применение новой — в одной транзакции:
+        # при нехватке средств всё откатывается, балансы не меняются
+        with transaction.atomic():
+            old_op = self.get_object()
+            reversal = apply_operation(
+                old_op.operation_type, old_op.currency_id, som_info.id,
+                old_op.amount, old_op.total_in_som, sign=-1, check=False,
+            )
+
+            serializer = self.get_serializer(old_op, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            record_operation(old_op, sign=-1)
+            updated_op = serializer.save()
+
+            new_amount = updated_op.amount
+            new_rate = updated_op.exchange_rate
+            new_total_som = new_amount * new_rate
+            updated_op.total_in_som = new_total_som
+            updated_op.edited = self.request.user.username
+            updated_op.version += 1  # инвалидирует кэш чека
+            updated_op.save(update_fields=['total_in_som', 'edited', 'version'])
+            record_operation(updated_op)
+
+            op_type = updated_op.operation_type
+            currency = updated_op.currency
+            try:
+                changes = apply_operation(op_type, currency.id, som_info.id, new_amount, new_total_som)
+            except InsufficientBalance:
+                if op_type == 'buy':
+                    raise ValidationError("Insufficient Som balance for this edit.")
                 raise ValidationError(f"Insufficient {currency.name} balance for this edit.")
-            currency.balance -= new_amount
-            som_currency.balance += new_total_som
 
-        som_currency.save()
-        currency.save()
+            entries = record_ledger_entries(
+                ledger_entries(reversal, LedgerEntry.EDIT_REVERSAL, operation=updated_op)
+                + ledger_entries(changes, LedgerEntry.EDIT, operation=updated_op)
+            )
+            # итоги уже закрытой смены заморожены — пересчитываем их
+            refreeze_shift_summaries(updated_op.timestamp)
+            bump_version(CURRENCIES_VERSION, OPERATIONS_VERSION)
+            data = self.get_serializer(updated_op).data
+            publish_event('operation.edited', {"operation": data, "balances": ledger_balances(entries)})
 
-        return Response(self.get_serializer(updated_op).data)
+        return Response(data)
 
     @action(detail=True, methods=['get'])
     def generate_receipt(self, request, pk=None):
@@ -216,26 +433,14 @@ class ClientOperationViewSet(viewsets.ModelViewSet):
         """
         operation = self.get_object()
 
-        edited_by = operation.edited if operation.edited else None
-
-        context = {
-            'operation': operation,
-            'edited_by': edited_by,
-        }
-        html_content = render_to_string('receipt_template.html', context)
-
-        pdf_file = BytesIO()
-        pisa_status = pisa.CreatePDF(
-            src=html_content,
-            dest=pdf_file,
-            encoding='utf-8'
-        )
-        if pisa_status.err:
+        status, pdf_bytes = self._render_receipt(operation, settings.RECEIPT_JOB_WAIT_SECONDS)
+        if status == JOB_PENDING:
+            return self._receipt_job_response(operation, status)
+        if pdf_bytes is None:
             return Response({"error": "Error creating PDF"}, status=500)
 
-        pdf_file.seek(0)
         filename = f"receipt_{operation.id}.pdf"
-        response = HttpResponse(pdf_file, content_type='application/pdf')
+        response = HttpResponse(pdf_bytes, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
@@ -246,27 +451,13 @@ class ClientOperationViewSet(viewsets.ModelViewSet):
         can display it on-screen with 'Exit' and 'Download' buttons.
         """
         operation = self.get_object()
-        edited_by = operation.edited if operation.edited else None
-
-        context = {
-            'operation': operation,
-            'edited_by': edited_by,
-        }
 
-        html_content = render_to_string('receipt_template.html', context)
-
-        pdf_file = BytesIO()
-        pisa_status = pisa.CreatePDF(
-            src=html_content,
-            dest=pdf_file,
-            encoding='utf-8'
-        )
-        if pisa_status.err:
+        status, pdf_bytes = self._render_receipt(operation, settings.RECEIPT_JOB_WAIT_SECONDS)
+        if status == JOB_PENDING:
+            return self._receipt_job_response(operation, status)
+        if pdf_bytes is None:
             return Response({"error": "Error creating PDF"}, status=500)
 
-        pdf_file.seek(0)
-        pdf_bytes = pdf_file.read()
-
         import base64
         pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
 
@@ -277,32 +468,180 @@ class ClientOperationViewSet(viewsets.ModelViewSet):
             "filename": filename,  # So the frontend can name the file
         })
 
+    @action(detail=True, methods=['get', 'post'], url_path='receipt_job')
+    def receipt_job(self, request, pk=None):
+        """
+        POST /api/operations/<id>/receipt_job/ starts rendering the receipt.
+        GET  /api/operations/<id>/receipt_job/?wait=<seconds> polls it,
+        optionally waiting up to RECEIPT_JOB_WAIT_SECONDS for the result.
+        A finished job carries the PDF as base64, like generate_receipt_inline.
+        """
+        operation = self.get_object()
+
+        if request.method == 'POST':
+            if render_pool_enabled():
+                submit_receipt_job(operation)
+                status, pdf_bytes = receipt_job_result(operation, wait=0)
+            else:
+                status, pdf_bytes = self._render_receipt(operation, 0)
+            return self._receipt_job_response(operation, status, pdf_bytes)
+
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            return Response({"detail": "wait must be a number of seconds"}, status=400)
+        wait = max(0.0, min(wait, settings.RECEIPT_JOB_WAIT_SECONDS))
+
+        status, pdf_bytes = self._render_receipt(operation, wait)
+        return self._receipt_job_response(operation, status, pdf_bytes)
+
+    @action(detail=False, methods=['get'], url_path='receipts_bundle')
+    def receipts_bundle(self, request):
+        """
+        GET /api/operations/receipts_bundle/?shift=<id>
+        GET /api/operations/receipts_bundle/?since=<ts>&until=<ts>
+        All receipts of a shift or time range as a streamed ZIP
+        (default) or, with &bundle=pdf, as one merged multi-page PDF.
+
+        Only the ZIP is streamed receipt by receipt. The merged PDF is
+        assembled in memory before it is sent, so it is limited to
+        RECEIPT_PDF_BUNDLE_MAX_OPERATIONS receipts; larger ranges get a
+        400 pointing to the ZIP bundle.
+        """
+        bundle = request.query_params.get('bundle', 'zip')
+        if bundle not in ('zip', 'pdf'):
+            return Response({"detail": "bundle must be 'zip' or 'pdf'"}, status=400)
+
+        shift_id = request.query_params.get('shift')
+        since = request.query_params.get('since')
+        if shift_id:
+            try:
+                shift = Shift.objects.get(id=shift_id)
+            except (Shift.DoesNotExist, ValueError):
+                return Response({"detail": "Shift not found"}, status=404)
+            start = shift.start_time
+            end = shift.end_time or timezone.now()
+            label = f"shift_{shift.id}"
+        elif since:
+            start = parse_timestamp_param(since, 'since')
+            until = request.query_params.get('until')
+            end = parse_timestamp_param(until, 'until') if until else timezone.now()
+            label = f"{start:%Y%m%d%H%M%S}-{end:%Y%m%d%H%M%S}"
+        else:
+            return Response({"detail": "Pass either shift or since/until"}, status=400)
+
+        operations = ClientOperation.objects.filter(timestamp__gte=start, timestamp__lte=end)
+        if bundle == 'pdf':
+            limit = settings.RECEIPT_PDF_BUNDLE_MAX_OPERATIONS
+            if operations.count() > limit:
+                return Response({
+                    "detail": f"A merged PDF holds at most {limit} receipts; "
+                              f"use bundle=zip (the default) for larger ranges."
+                }, status=400)
+
+        rendered = iter_rendered_receipts(
+            operations
+            .select_related('currency')
+            .order_by('timestamp', 'id')
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+
+        if bundle == 'pdf':
+            return FileResponse(
+                merged_receipts_pdf(rendered),
+                as_attachment=True,
+                filename=f"receipts_{label}.pdf",
+                content_type='application/pdf',
+            )
+
+        response = StreamingHttpResponse(stream_receipts_zip(rendered), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="receipts_{label}.zip"'
+        return response
+
+    def _render_receipt(self, operation, wait):
+        """(status, pdf_bytes) either from the process pool or rendered inline."""
+        if render_pool_enabled():
+            return receipt_job_result(operation, wait=wait)
+        pdf_bytes = get_receipt_pdf(operation)
+        return (JOB_DONE if pdf_bytes is not None else JOB_FAILED), pdf_bytes
+
+    def _receipt_job_response(self, operation, status, pdf_bytes=None):
+        data = {
+            "job_id": receipt_job_id(operation),
+            "operation_id": operation.id,
+            "version": operation.version,
+            "status": status,
+        }
+        if status == JOB_DONE:
+            import base64
+            data["pdf_base64"] = base64.b64encode(pdf_bytes).decode('utf-8')
+            data["filename"] = f"receipt_{operation.id}.pdf"
+            return Response(data)
+        if status == JOB_FAILED:
+            data["error"] = "Error creating PDF"
+            return Response(data, status=500)
+        return Response(data, status=202)
+
 
 from django_filters.rest_framework import DjangoFilterBackend # type: ignore
 ...
-class HistoryEventViewSet(viewsets.ReadOnlyModelViewSet):
+import django_filters  # type: ignore
+
+
+class HistoryEventFilter(django_filters.FilterSet):
+    # прежние имена параметров, но фильтруем по денормализованным полям — без JOIN
+    currency__name = django_filters.CharFilter(field_name='currency_name')
+    user__username = django_filters.CharFilter(field_name='user_username')
+
+    class Meta:
+        model = HistoryEvent
+        fields = ['event_type']
+
+
+class HistoryEventViewSet(ReportingReadsMixin, CursorOptInMixin, viewsets.ReadOnlyModelViewSet):
     queryset = HistoryEvent.objects.all().order_by('-timestamp')
     serializer_class = HistoryEventSerializer
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['event_type', 'currency__name', 'user__username']
+    filterset_class = HistoryEventFilter
 
 
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
+from .models import BalanceSnapshot, ShiftSummary
+from .snapshots import take_snapshot
+from .analytics import shift_totals
+
 class ShiftHistoryPagination(PageNumberPagination):
     page_size = 8
 
 class ShiftViewSet(viewsets.ModelViewSet):
     queryset = Shift.objects.all()
     serializer_class = ShiftSerializer
+
+    def perform_create(self, serializer):
+        serializer.save()
+        invalidate_active_shift()
+        publish_event('shift.updated', {"shift": serializer.data})
+
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_active_shift()
+        publish_event('shift.updated', {"shift": serializer.data})
+
+    def perform_destroy(self, instance):
+        shift_id = instance.id
+        instance.delete()
+        invalidate_active_shift()
+        publish_event('shift.deleted', {"id": shift_id})
+
     @action(detail=False, methods=['get'], url_path='current_cashier')
     def current_cashier(self, request):
         """
         GET /api/shifts/current_cashier/
         Returns info about the user (cashier) of the active shift.
         """
-        active_shift = Shift.objects.filter(end_time__isnull=True).order_by('-start_time').first()
+        active_shift = get_active_shift()
         if not active_shift:
             return Response({"detail": "No active shift"}, status=404)
 
@@ -338,6 +677,8 @@ class ShiftViewSet(viewsets.ModelViewSet):
         old_user = active_shift.user
         active_shift.user = new_cashier
         active_shift.save()
+        invalidate_active_shift()
+        publish_event('shift.updated', {"shift": ShiftSerializer(active_shift).data})
 
         HistoryEvent.objects.create(
             event_type='update_user',
@@ -354,8 +695,9 @@ class ShiftViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='history')
     def history(self, request):
-        from django.db.models import Avg, Sum
-        shifts_qs = Shift.objects.all().order_by('-start_time')
+        # Закрытые смены читают замороженный ShiftSummary,
+        # живой агрегат считается только для открытой смены
+        shifts_qs = Shift.objects.select_related('user', 'summary').order_by('-start_time')
 
         page = self.paginate_queryset(shifts_qs)
         if page is None:
@@ -363,32 +705,14 @@ class ShiftViewSet(viewsets.ModelViewSet):
 
         results = []
         for shift in page:
-            if shift.end_time:
-                ops = ClientOperation.objects.filter(
-                    timestamp__gte=shift.start_time,
-                    timestamp__lte=shift.end_time
-                )
-            else:
-                ops = ClientOperation.objects.filter(timestamp__gte=shift.start_time)
-
-            ops_count = ops.count()
-
-            buy_agg = ops.filter(operation_type='buy').aggregate(
-                total_bought=Sum('amount'),
-                avg_buy_rate=Avg('exchange_rate')
-            )
-            sell_agg = ops.filter(operation_type='sell').aggregate(
-                total_sold=Sum('amount'),
-                avg_sell_rate=Avg('exchange_rate')
-            )
-
-            total_bought = buy_agg['total_bought'] or 0
-            avg_buy_rate = buy_agg['avg_buy_rate'] or 0
-            total_sold = sell_agg['total_sold'] or 0
-            avg_sell_rate = sell_agg['avg_sell_rate'] or 0
-
-            overlap = min(total_bought, total_sold)
-            profit = overlap * (avg_sell_rate - avg_buy_rate)
+            try:
+                summary = shift.summary
+                ops_count = summary.operations_count
+                profit = summary.profit
+            except ShiftSummary.DoesNotExist:
+                totals = shift_totals(shift.start_time, shift.end_time)
+                ops_count = totals['operations_count']
+                profit = totals['profit']
 
             raw_changes = shift.changed_balances if shift.changed_balances else []
             filtered_changes = []
@@ -410,7 +734,7 @@ class ShiftViewSet(viewsets.ModelViewSet):
                 "end_time": fmt_end,
                 "cashier_name": shift.user.username if shift.user else "N/A",
                 "operations_count": ops_count,
-                "overall_profit": round(profit, 2),
+                "overall_profit": profit,
                 "changed_balances": filtered_changes,
             })
 
@@ -428,15 +752,18 @@ class ShiftViewSet(viewsets.ModelViewSet):
         return self.get_paginated_response(ser.data)
 
     @action(methods=['post'], detail=False)  # Explicitly allow POST method
+    @transaction.atomic
     def clear(self, request):
 
         active_shifts = Shift.objects.filter(end_time__isnull=True).order_by('-start_time')
+        closed_shift, entries = None, []
         if active_shifts.exists():
-            current_shift = active_shifts.first()
+            current_shift = closed_shift = active_shifts.first()
             current_shift.end_time = timezone.now()
 
             balances_data = request.data.get("balances", [])
             changes = []
+            corrections = []
 
             for item in balances_data:
                 currency_id = item.get("currency_id")
@@ -453,17 +780,36 @@ class ShiftViewSet(viewsets.ModelViewSet):
                             "old_balance": float(currency_obj.balance),  # Convert to float
                             "new_balance": float(leftover),  # Convert to float
                         })
+                        corrections.append(
+                            (currency_obj.id, (Decimal(leftover) - currency_obj.balance).quantize(BALANCE_QUANT))
+                        )
                         currency_obj.balance = Decimal(leftover)  # Use Decimal for storage
-                        currency_obj.save()
+                        currency_obj.save(update_fields=['balance'])
                 except Currency.DoesNotExist:
                     pass
 
+            entries = record_ledger_entries(ledger_entries(corrections, LedgerEntry.SHIFT_CLOSE, shift=current_shift))
+
             current_shift.note = f"Clear by user: {self.request.user.username}"
             current_shift.changed_balances = changes  # Сохраняем изменения
             current_shift.save()
+            take_snapshot(BalanceSnapshot.SHIFT_CLOSE, shift=current_shift)
+            bump_version(CURRENCIES_VERSION, OPERATIONS_VERSION)
+
+            # Замораживаем итоги смены для истории
+            ShiftSummary.objects.update_or_create(
+                shift=current_shift,
+                defaults=shift_totals(current_shift.start_time, current_shift.end_time),
+            )
 
         # Создаём новую смену
         new_shift = Shift.objects.create(user=self.request.user)
+        invalidate_active_shift()
+        publish_event('shift.cleared', {
+            "closed_shift_id": closed_shift.id if closed_shift else None,
+            "shift": ShiftSerializer(new_shift).data,
+            "balances": ledger_balances(entries),
+        })
         return Response({
             "detail": "Shift cleared and new shift opened",
             "new_shift_id": new_shift.id,
@@ -479,7 +825,7 @@ class InternalHistoryPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class InternalHistoryAPIView(generics.ListAPIView):
+class InternalHistoryAPIView(ReportingReadsMixin, CursorOptInMixin, generics.ListAPIView):
     queryset = HistoryEvent.objects.all().order_by('-timestamp')  # Adjust ordering as needed
     serializer_class = HistoryEventSerializer
     pagination_class = InternalHistoryPagination
@@ -487,15 +833,21 @@ class InternalHistoryAPIView(generics.ListAPIView):
 
 
 from .permissions import IsAdminOrReadOnly
-class CustomUserViewSet(viewsets.ModelViewSet):
+class CustomUserViewSet(CursorOptInMixin, viewsets.ModelViewSet):
     queryset = CustomUser.objects.filter(is_deleted=False)
     serializer_class = CustomUserSerializer
     permission_classes = [IsAdminOrReadOnly]
     pagination_class = StandardResultsSetPagination
+    cursor_ordering = ('date_joined', 'id')
+
+    @conditional_get(USERS_VERSION)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         # Save the new user instance
         user = serializer.save()
+        bump_version(USERS_VERSION)
         # Create a HistoryEvent for user creation
         HistoryEvent.objects.create(
             event_type='create_user',
@@ -515,21 +867,46 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         # Soft-delete the user
         instance.is_deleted = True
         instance.save()
+        invalidate_active_shift()  # кэш активной смены хранит её пользователя
+        bump_version(USERS_VERSION)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_active_shift()
+        bump_version(USERS_VERSION)
 
 
 
 from rest_framework.views import APIView
 from .permissions import IsCashierOrAdmin
+from .analytics_cache import cached_payload
+
+ANALYTICS_CACHE_HEADER = 'X-Analytics-Cache'  # hit / miss
+# версии, от которых зависят ETag и кэш аналитики
+ANALYTICS_ETAG_VERSIONS = (
+    OPERATIONS_VERSION, CURRENCIES_VERSION, CURRENCY_REGISTRY_VERSION, ACTIVE_SHIFT_VERSION,
+)
 
-class AnalyticsView(APIView):
+
+class AnalyticsView(ReportingReadsMixin, APIView):
     permission_classes = [IsCashierOrAdmin]
 
+    @conditional_get(*ANALYTICS_ETAG_VERSIONS, time_window=ANALYTICS_ETAG_WINDOW)
     def get(self, request):
-        from datetime import timedelta
         period = request.GET.get('period', 'today')
 
         now = timezone.now()
+        start = self.period_start(period, now)
+
+        data, outcome = cached_payload(
+            'analytics', period, start, ANALYTICS_ETAG_VERSIONS,
+            lambda: self.compute(period, start, now),
+        )
+        return Response(data, headers={ANALYTICS_CACHE_HEADER: outcome})
 
+    @staticmethod
+    def period_start(period, now):
+        from datetime import timedelta
         if period == 'week':
             start = now - timedelta(days=7)
         elif period == 'month':
@@ -538,7 +915,7 @@ class AnalyticsView(APIView):
             start = now - timedelta(days=3)
         elif period == 'shift':
             # последняя смена
-            last_shift = Shift.objects.filter(end_time__isnull=True).order_by('-start_time').first()
+            last_shift = get_active_shift()
             if last_shift:
                 start = last_shift.start_time
             else:
@@ -546,35 +923,32 @@ class AnalyticsView(APIView):
         else:
             # 'today' — полночь текущего дня
             start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return start
 
-        # Фильтруем операции за период
-        ops = ClientOperation.objects.filter(timestamp__gte=start, timestamp__lte=now)
+    @classmethod
+    def compute(cls, period, start, now):
+        # Все суммы и средние курсы за период — одним сгруппированным запросом
+        stats = currency_stats(start, now)
+        return cls.build(period, start, now, get_currency_registry(), stats, current_balances())
 
+    @staticmethod
+    def build(period, start, now, registry, stats, balances):
+        """The payload from already loaded stats and balances (no queries)."""
         # Считаем аналитику
         # например, как было
-        som_balance = 0
-        try:
-            som_balance = Currency.objects.get(name="Som").balance
-        except Currency.DoesNotExist:
-            pass
+        som_balance = balances.get(registry.base_id, 0)
 
         results = []
         total_profit = 0
-        all_currencies = Currency.objects.filter(is_deleted=False)
 
+        for cur in registry.active(include_base=False):
+            cur_stats = get_currency_stats(stats, cur.id)
+            cur_balance = balances.get(cur.id, 0)
 
-
-        for cur in all_currencies:
-            if cur.name == "Som":
-                continue
-            buy_ops = ops.filter(operation_type='buy', currency=cur)
-            sell_ops = ops.filter(operation_type='sell', currency=cur)
-            cur_balance = cur.balance
-
-            buy_count = buy_ops.aggregate(total_buy_amount=Sum('amount'))['total_buy_amount'] or 0
-            sell_count = sell_ops.aggregate(total_sell_amount=Sum('amount'))['total_sell_amount'] or 0
-            avg_buy_rate = buy_ops.aggregate(Avg('exchange_rate'))['exchange_rate__avg'] or 0
-            avg_sell_rate = sell_ops.aggregate(Avg('exchange_rate'))['exchange_rate__avg'] or 0
+            buy_count = cur_stats['buy_amount'] or 0
+            sell_count = cur_stats['sell_amount'] or 0
+            avg_buy_rate = cur_stats['avg_buy_rate'] or 0
+            avg_sell_rate = cur_stats['avg_sell_rate'] or 0
             usable_count = min(buy_count, sell_count)  # берем минимум
             profit = usable_count * (avg_sell_rate - avg_buy_rate)
 
@@ -598,11 +972,12 @@ class AnalyticsView(APIView):
             "total_profit": round(total_profit, 2),
             "details": results
         }
-        return Response(data)
+        return data
 from .models import HistoryEvent, Shift
-import openpyxl
-from openpyxl.styles import Font, Alignment
 from django.http import HttpResponse
+from .exports import parse_timestamp_param, resolve_export_range, stream_rows_response, xlsx_response
+
+EXPORT_CHUNK_SIZE = 2000
 from rest_framework.views import APIView
 from datetime import  datetime
 from django.utils.timezone import now as timezone_now
@@ -610,7 +985,7 @@ from decimal import Decimal
 from django.db.models import Q
 
 
-class ExportAnalyticsExcel(APIView):
+class ExportAnalyticsExcel(ReportingReadsMixin, APIView):
     """
     Export analytics data to an Excel file with no authentication required.
     """
@@ -628,25 +1003,22 @@ class ExportAnalyticsExcel(APIView):
         elif period == '3days':
             start = now - timedelta(days=3)
         elif period == 'shift':
-            last_shift = Shift.objects.filter(end_time__isnull=True).order_by('-start_time').first()
+            last_shift = get_active_shift()
             start = last_shift.start_time if last_shift else now - timedelta(days=3)
         else:
             start = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
-        ops = ClientOperation.objects.filter(timestamp__gte=start, timestamp__lte=now)
+        stats = currency_stats(start, now)
 
         results = []
         total_profit = Decimal('0.00')
-        all_currencies = Currency.objects.exclude(name="Som").filter(is_deleted=False)
-
-        for cur in all_currencies:
-            buy_ops = ops.filter(operation_type='buy', currency=cur)
-            sell_ops = ops.filter(operation_type='sell', currency=cur)
+        for cur in get_currency_registry().active(include_base=False):
+            cur_stats = get_currency_stats(stats, cur.id)
 
-            buy_count = buy_ops.aggregate(total_buy_amount=Sum('amount'))['total_buy_amount'] or Decimal('0.00')
-            sell_count = sell_ops.aggregate(total_sell_amount=Sum('amount'))['total_sell_amount'] or Decimal('0.00')
-            avg_buy_rate = buy_ops.aggregate(Avg('exchange_rate'))['exchange_rate__avg'] or Decimal('0.00')
-            avg_sell_rate = sell_ops.aggregate(Avg('exchange_rate'))['exchange_rate__avg'] or Decimal('0.00')
+            buy_count = cur_stats['buy_amount'] or Decimal('0.00')
+            sell_count = cur_stats['sell_amount'] or Decimal('0.00')
+            avg_buy_rate = cur_stats['avg_buy_rate'] or Decimal('0.00')
+            avg_sell_rate = cur_stats['avg_sell_rate'] or Decimal('0.00')
 
             profit = min(buy_count, sell_count) * (avg_sell_rate - avg_buy_rate)
             total_profit += profit
@@ -660,46 +1032,19 @@ class ExportAnalyticsExcel(APIView):
                 "profit": round(float(profit), 2),
             })
 
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Analytics"
-
         headers = ["Currency", "Buy Count", "Avg Buy Rate", "Sell Count", "Avg Sell Rate", "Profit"]
-        header_font = Font(bold=True)
-
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num, value=header)
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-
-        for row_num, row in enumerate(results, 2):
-            ws.cell(row=row_num, column=1, value=row['currency'])
-            ws.cell(row=row_num, column=2, value=row['buy_count'])
-            ws.cell(row=row_num, column=3, value=row['avg_buy_rate'])
-            ws.cell(row=row_num, column=4, value=row['sell_count'])
-            ws.cell(row=row_num, column=5, value=row['avg_sell_rate'])
-            ws.cell(row=row_num, column=6, value=row['profit'])
-
-        total_row = len(results) + 2
-        ws.cell(row=total_row, column=5, value="Total Profit:")
-        ws.cell(row=total_row, column=6, value=round(float(total_profit), 2))
-        ws.cell(row=total_row, column=5).font = Font(bold=True)
-        ws.cell(row=total_row, column=6).font = Font(bold=True)
-
-        for column_cells in ws.columns:
-            length = max(len(str(cell.value)) if cell.value is not None else 0 for cell in column_cells)
-            ws.column_dimensions[column_cells[0].column_letter].width = length + 2
-
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        rows = (
+            (row['currency'], row['buy_count'], row['avg_buy_rate'],
+             row['sell_count'], row['avg_sell_rate'], row['profit'])
+            for row in results
         )
+        footer = [(None, None, None, None, "Total Profit:", round(float(total_profit), 2))]
+
         filename = f"analytics_{period}_{now.strftime('%Y%m%d_%H%M%S')}.xlsx"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        wb.save(response)
-        return response
+        return xlsx_response("Analytics", headers, rows, filename, footer=footer)
 
 
-class ExportEventExcel(APIView):
+class ExportEventExcel(ReportingReadsMixin, APIView):
 
     authentication_classes = []
     permission_classes = []
@@ -713,111 +1058,144 @@ class ExportEventExcel(APIView):
         elif period == 'month':
             start = now - timedelta(days=30)
         elif period == 'shift':
-            last_shift = Shift.objects.filter(end_time__isnull=True).order_by('-start_time').first()
+            last_shift = get_active_shift()
             start = last_shift.start_time if last_shift else now - timedelta(days=3)
         elif period == '3days':
             start = now - timedelta(days=3)
         else:
             start = now - timedelta(days=3)
 
+        # Удалённые пользователи и валюты — короткие списки id, без JOIN по событиям
+        deleted_users = list(CustomUser.objects.filter(is_deleted=True).values_list('id', flat=True))
+        deleted_currencies = [cur.id for cur in get_currency_registry().all() if cur.is_deleted]
         events = HistoryEvent.objects.filter(
             timestamp__gte=start, timestamp__lte=now
-        ).select_related('user', 'currency', 'target_user').exclude(
-            Q(user__is_deleted=True) | Q(currency__is_deleted=True)
-        ).order_by('-timestamp')
+        ).exclude(
+            Q(user_id__in=deleted_users) | Q(currency_id__in=deleted_currencies)
+        ).order_by('-timestamp').values_list(
+            'id', 'event_type', 'user_username', 'currency_name', 'target_user_username', 'timestamp'
+        )
 
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Events"
+        event_labels = dict(HistoryEvent.EVENT_TYPES)
+        rows = (
+            (ev_id, event_labels.get(event_type, event_type), username or "",
+             currency_name or "", target_username or "", timestamp.strftime('%Y-%m-%d %H:%M:%S'))
+            for ev_id, event_type, username, currency_name, target_username, timestamp
+            in events.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
 
         headers = ["ID", "Event Type", "User", "Currency", "Target User", "Timestamp"]
-        header_font = Font(bold=True)
-
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num, value=header)
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-
-        for row_num, ev in enumerate(events, 2):
-            ws.cell(row=row_num, column=1, value=ev.id)
-            ws.cell(row=row_num, column=2, value=ev.get_event_type_display())
-            ws.cell(row=row_num, column=3, value=ev.user.username if ev.user else "")
-            ws.cell(row=row_num, column=4, value=ev.currency.name if ev.currency else "")
-            ws.cell(row=row_num, column=5, value=ev.target_user.username if ev.target_user else "")
-            ws.cell(row=row_num, column=6, value=ev.timestamp.strftime('%Y-%m-%d %H:%M:%S'))
-
-        for column_cells in ws.columns:
-            length = max(len(str(cell.value)) if cell.value is not None else 0 for cell in column_cells)
-            ws.column_dimensions[column_cells[0].column_letter].width = length + 2
-
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        )
         filename = f"events_{period}_{now.strftime('%Y%m%d_%H%M%S')}.xlsx"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        wb.save(response)
-        return response
+        return xlsx_response("Events", headers, rows, filename)
 
 
-class ExportOperationExcel(APIView):
+class ExportOperationExcel(ReportingReadsMixin, APIView):
     authentication_classes = []
     permission_classes = []
 
     def get(self, request, *args, **kwargs):
         period = request.GET.get('period', '3days')
-        ops = self.filter_by_period(period)
+        ops = self.filter_by_period(period).values_list(
+            'id', 'operation_type', 'currency__name', 'cashier_name',
+            'amount', 'exchange_rate', 'total_in_som', 'timestamp'
+        )
 
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Operations"
+        rows = (
+            (op_id, op_type, currency_name, cashier_name, float(amount),
+             float(rate), float(total_som), timestamp.strftime('%Y-%m-%d %H:%M:%S'))
+            for op_id, op_type, currency_name, cashier_name, amount, rate, total_som, timestamp
+            in ops.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
 
         headers = ["ID", "Type", "Currency", "Cashier", "Amount", "Exchange", "Total Som", "Timestamp"]
-        header_font = Font(bold=True)
-
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num, value=header)
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-
-        for row_num, op in enumerate(ops, 2):
-            ws.cell(row=row_num, column=1, value=op.id)
-            ws.cell(row=row_num, column=2, value=op.operation_type)
-            ws.cell(row=row_num, column=3, value=op.currency.name)
-            ws.cell(row=row_num, column=4, value=op.cashier_name)
-            ws.cell(row=row_num, column=5, value=float(op.amount))
-            ws.cell(row=row_num, column=6, value=float(op.exchange_rate))
-            ws.cell(row=row_num, column=7, value=float(op.total_in_som))
-            ws.cell(row=row_num, column=8, value=op.timestamp.strftime('%Y-%m-%d %H:%M:%S'))
-
-        for column_cells in ws.columns:
-            length = max(len(str(cell.value)) if cell.value is not None else 0 for cell in column_cells)
-            ws.column_dimensions[column_cells[0].column_letter].width = length + 2
-
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        )
         filename = f"operations_{period}_{timezone_now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        wb.save(response)
-        return response
+        return xlsx_response("Operations", headers, rows, filename)
 
     def filter_by_period(self, period):
-        now = timezone_now()
-        if period == 'week':
-            start = now - timedelta(days=7)
-        elif period == 'month':
-            start = now - timedelta(days=30)
-        elif period == 'shift':
-            last_shift = Shift.objects.filter(end_time__isnull=True).order_by('-start_time').first()
-            start = last_shift.start_time if last_shift else now - timedelta(days=3)
-        elif period == '3days':
-            start = now - timedelta(days=3)
-        else:
-            start = now - timedelta(days=3)
-
+        start = export_period_start(period, timezone_now())
         return ClientOperation.objects.filter(timestamp__gte=start).order_by('-timestamp')
 
 
+def export_period_start(period, now):
+    if period == 'week':
+        return now - timedelta(days=7)
+    if period == 'month':
+        return now - timedelta(days=30)
+    if period == 'shift':
+        last_shift = get_active_shift()
+        return last_shift.start_time if last_shift else now - timedelta(days=3)
+    # '3days' и всё остальное
+    return now - timedelta(days=3)
+
+
+class StreamExportView(ReportingReadsMixin, APIView):
+    """
+    Bulk CSV/NDJSON export for the accounting pipeline.
+    Accepts ?since=&until= (ISO 8601) or the usual ?period= names and
+    streams rows ordered by timestamp straight from a DB iterator.
+    """
+    permission_classes = [IsCashierOrAdmin]
+    export_format = 'csv'
+    basename = ''
+    columns = ()  # (output name, values_list lookup)
+
+    def get_queryset(self, start, end):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        now = timezone_now()
+        start, end, label = resolve_export_range(
+            request, now, lambda period: export_period_start(period, now)
+        )
+        # строки читаются уже после выхода из view — алиас задаём явно
+        rows = (
+            self.get_queryset(start, end)
+            .using(reporting_alias())
+            .order_by('timestamp', 'id')
+            .values_list(*[lookup for _, lookup in self.columns])
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        fields = [name for name, _ in self.columns]
+        return stream_rows_response(self.export_format, fields, rows, f"{self.basename}_{label}")
+
+
+class ExportOperationStream(StreamExportView):
+    basename = 'operations'
+    columns = (
+        ('id', 'id'),
+        ('operation_type', 'operation_type'),
+        ('currency_id', 'currency_id'),
+        ('currency_name', 'currency__name'),
+        ('cashier_name', 'cashier_name'),
+        ('amount', 'amount'),
+        ('exchange_rate', 'exchange_rate'),
+        ('total_in_som', 'total_in_som'),
+        ('timestamp', 'timestamp'),
+        ('edited', 'edited'),
+    )
+
+    def get_queryset(self, start, end):
+        return ClientOperation.objects.filter(timestamp__gte=start, timestamp__lte=end)
+
+
+class ExportEventStream(StreamExportView):
+    basename = 'events'
+    columns = (
+        ('id', 'id'),
+        ('event_type', 'event_type'),
+        ('user_id', 'user_id'),
+        ('user', 'user_username'),
+        ('target_user_id', 'target_user_id'),
+        ('target_user', 'target_user_username'),
+        ('currency_id', 'currency_id'),
+        ('currency', 'currency_name'),
+        ('timestamp', 'timestamp'),
+    )
+
+    def get_queryset(self, start, end):
+        return HistoryEvent.objects.filter(timestamp__gte=start, timestamp__lte=end)
+
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.db.models import Sum, Avg, Count
@@ -827,39 +1205,53 @@ from datetime import timedelta
 
 from .models import ClientOperation, Currency
 from .permissions import IsCashierOrAdmin
+from .analytics import busiest_hours, currency_stats, get_currency_stats, operation_totals
 
 
-class AdvancedAnalyticsView(APIView):
+class AdvancedAnalyticsView(ReportingReadsMixin, APIView):
     permission_classes = [IsCashierOrAdmin]
 
+    @conditional_get(*ANALYTICS_ETAG_VERSIONS, time_window=ANALYTICS_ETAG_WINDOW)
     def get(self, request):
         period = request.GET.get('period', 'week')
         now = timezone.now()
+        start = self.period_start(period, now)
 
+        data, outcome = cached_payload(
+            'advanced_analytics', period, start, ANALYTICS_ETAG_VERSIONS,
+            lambda: self.compute(period, start, now),
+        )
+        return Response(data, headers={ANALYTICS_CACHE_HEADER: outcome})
+
+    @staticmethod
+    def period_start(period, now):
         if period == 'month':
-            start = now - timedelta(days=30)
+            return now - timedelta(days=30)
         elif period == '3days':
-            start = now - timedelta(days=3)
-        else:  # default 'week'
-            start = now - timedelta(days=7)
-
-        ops = ClientOperation.objects.filter(timestamp__gte=start, timestamp__lte=now)
-
+            return now - timedelta(days=3)
+        return now - timedelta(days=7)  # default 'week'
+
+    @classmethod
+    def compute(cls, period, start, now):
+        return cls.build(
+            period, start, now, get_currency_registry(),
+            currency_stats(start, now), busiest_hours(start, now),
+        )
 
+    @staticmethod
+    def build(period, start, now, registry, stats, hours):
+        """The payload from already loaded stats and peak hours (no queries)."""
         results = []
         total_profit = 0
 
-        currencies = Currency.objects.exclude(name="Som")
-
-        for cur in currencies:
-            buy_ops = ops.filter(operation_type='buy', currency=cur)
-            sell_ops = ops.filter(operation_type='sell', currency=cur)
+        for cur in registry.all(include_base=False):
+            cur_stats = get_currency_stats(stats, cur.id)
 
-            buy_count = buy_ops.aggregate(total_buy_amount=Sum('amount'))['total_buy_amount'] or 0
-            sell_count = sell_ops.aggregate(total_sell_amount=Sum('amount'))['total_sell_amount'] or 0
+            buy_count = cur_stats['buy_amount'] or 0
+            sell_count = cur_stats['sell_amount'] or 0
 
-            avg_buy = buy_ops.aggregate(Avg('exchange_rate'))['exchange_rate__avg'] or 0
-            avg_sell = sell_ops.aggregate(Avg('exchange_rate'))['exchange_rate__avg'] or 0
+            avg_buy = cur_stats['avg_buy_rate'] or 0
+            avg_sell = cur_stats['avg_sell_rate'] or 0
 
             usable_count = min(buy_count, sell_count)
             profit = usable_count * (avg_sell - avg_buy)
@@ -874,25 +1266,15 @@ class AdvancedAnalyticsView(APIView):
                 "profit": round(profit, 2),
             })
 
-        peak_hours_qs = (
-            ops.annotate(hour=TruncHour('timestamp'))
-            .values('hour')
-            .annotate(operation_count=Count('id'))
-            .order_by('-operation_count')[:2]
-        )
         peak_hours = [
             {
-                "hour": entry['hour'].strftime('%H:%M'),
-                "operation_count": entry['operation_count']
+                "hour": hour.strftime('%H:%M'),
+                "operation_count": operation_count
             }
-            for entry in peak_hours_qs
+            for hour, operation_count in hours
         ]
 
-        total_transactions = ops.count()
-
-        total_buys = ops.filter(operation_type='buy').count()
-
-        total_sells = ops.filter(operation_type='sell').count()
+        total_transactions, total_buys, total_sells = operation_totals(stats)
 
         average_profit_per_transaction = round(total_profit / total_transactions, 2) if total_transactions else 0
 
@@ -912,4 +1294,130 @@ class AdvancedAnalyticsView(APIView):
             "details": results
         }
 
-        return Response(data)
+        return data
+
+
+from .snapshots import MAX_SERIES_POINTS, SERIES_STEPS, balance_series, balances_at
+
+
+def _snapshot_info(snapshot):
+    if snapshot is None:
+        return None
+    return {"id": snapshot.id, "kind": snapshot.kind, "taken_at": snapshot.taken_at}
+
+
+def _balance_rows(balances):
+    registry = get_currency_registry()
+    rows = []
+    for currency_id, balance in sorted(balances.items()):
+        info = registry.by_id.get(currency_id)
+        rows.append({
+            "currency_id": currency_id,
+            "currency": info.name if info else None,
+            "balance": str(balance),
+        })
+    return rows
+
+
+class BalanceAtView(ReportingReadsMixin, APIView):
+    """
+    GET ?at=<ISO timestamp> — balances of all currencies at that moment
+    (default: now), from the nearest earlier snapshot plus later ledger
+    entries.
+    """
+    permission_classes = [IsCashierOrAdmin]
+
+    def get(self, request):
+        at = request.GET.get('at')
+        moment = parse_timestamp_param(at, 'at') if at else timezone.now()
+        snapshot, balances = balances_at(moment)
+        return Response({
+            "at": moment,
+            "snapshot": _snapshot_info(snapshot),
+            "balances": _balance_rows(balances),
+        })
+
+
+class BalanceHistoryView(ReportingReadsMixin, APIView):
+    """
+    GET ?since=&until=&step=hour|day — balances at ``since`` and every
+    step after it, for balance-over-time charts. ``until`` defaults to
+    now, ``since`` to 30 days before ``until``.
+    """
+    permission_classes = [IsCashierOrAdmin]
+
+    def get(self, request):
+        until = request.GET.get('until')
+        end = parse_timestamp_param(until, 'until') if until else timezone.now()
+        since = request.GET.get('since')
+        start = parse_timestamp_param(since, 'since') if since else end - timedelta(days=30)
+        step_name = request.GET.get('step', 'day')
+        if step_name not in SERIES_STEPS:
+            raise ValidationError({"step": f"Use one of: {', '.join(SERIES_STEPS)}."})
+        step = SERIES_STEPS[step_name]
+        if start > end:
+            raise ValidationError({"since": "'since' must not be later than 'until'."})
+        if (end - start) / step >= MAX_SERIES_POINTS:
+            raise ValidationError({"detail": f"At most {MAX_SERIES_POINTS} points per request; use a larger step."})
+
+        snapshot, points = balance_series(start, end, step)
+        return Response({
+            "since": start,
+            "until": end,
+            "step": step_name,
+            "snapshot": _snapshot_info(snapshot),
+            "points": [{"at": moment, "balances": _balance_rows(balances)} for moment, balances in points],
+        })
+
+
+import asyncio
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from .events import RESYNC, broker, format_event, hub
+from .permissions import is_cashier_or_admin, jwt_user
+
+
+async def _event_stream():
+    heartbeat = getattr(settings, 'EVENT_STREAM_HEARTBEAT_SECONDS', 15)
+    # подписка — при первом чтении потока, чтобы finally гарантированно её снял
+    subscription = hub.subscribe()
+    broker.ensure_watching()
+    try:
+        # клиент загружает текущее состояние и дальше только применяет события
+        yield "retry: 3000\n\n" + format_event((0, RESYNC, {}))
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def event_stream(request):
+    """
+    GET /api/events/stream/ — server-sent events with committed changes:
+    operation.created / operation.edited / operation.deleted /
+    operations.bulk_created, currency.created / currency.updated /
+    currency.deleted, shift.updated / shift.deleted / shift.cleared.
+    Balance-changing events carry the new balances. 'resync' means
+    "refetch everything", 'invalidate' names the resources to refetch.
+
+    Needs an ASGI server (``uvicorn config.asgi:application``); under
+    WSGI every connection would hold a worker for good.
+    """
+    if request.method != 'GET':
+        return JsonResponse({"detail": "Method not allowed."}, status=405)
+    if 'wsgi.version' in request.META:
+        return JsonResponse({"detail": "The event stream is only served over ASGI."}, status=501)
+
+    user = await sync_to_async(jwt_user)(request, allow_query_token=True)
+    if not is_cashier_or_admin(user):
+        return JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+
+    response = StreamingHttpResponse(_event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx не должен буферизовать поток
+    return response